@@ -11,6 +11,14 @@ but is also compatible with a normal webhook setup.
 **Module overview**
 - [main]: The main entry point of the server, responsible for setting up the Flask app and routing.
 - [builder]: Contains the logic for building and testing the project.
+- [sharding]: Splits a project's tests into shards balanced by earlier durations.
+- [test_selection]: Selects the tests affected by a change from the files tests executed before.
+- [build_queue]: Queues incoming builds and runs them on a pool of worker threads.
+- [scheduler]: Admits queued builds by free cores and memory, per-repository caps, priority and fair share.
+- [config]: Loads the server's runtime configuration.
+- [coordinator]: Dispatches builds to build agents and tracks their heartbeats.
+- [agent]: Build agent that runs builds leased from a coordinator.
+- [metrics]: Collects build, step and queue metrics in the Prometheus text format.
 - [models]: Defines data models for build reports and statuses.
 - [input_validation]: Contains functions for validating incoming webhook payloads.
 - [auth]: Handles auth construction depending on server setup.
@@ -3,3 +3,4 @@ Provides concrete implementations of the Notifier interface.
 """
 
 from .github import GithubNotifier
+from .queued import QueuedNotifier
@@ -27,9 +27,16 @@ class GithubNotifier(Notifier):
             "description": report.description,
             "context": report.context,
         }
+        if report.target_url is not None:
+            payload["target_url"] = report.target_url
         try:
             ctx = GithubAuthContext(installation_id=ref.installation_id)
             self.transport.create_commit_status(ref.repo, ref.sha, payload, ctx)
             return NotificationResult(status=NotificationStatus.SENT)
         except TransportError as e:
-            return NotificationResult(status=NotificationStatus.FAILED, message=str(e))
+            return NotificationResult(
+                status=NotificationStatus.FAILED,
+                message=str(e),
+                retryable=e.retryable,
+                retry_after=e.retry_after,
+            )
@@ -0,0 +1,163 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from src.models import BuildRef, BuildReport
+from src.ports.notifier import NotificationResult, NotificationStatus, Notifier
+
+# Notifications with the same key replace each other while they are waiting to be sent
+_Key = tuple[str, str, str]
+
+
+@dataclass
+class _Pending:
+    ref: BuildRef
+    report: BuildReport
+    attempts: int = 0
+    not_before: float = 0.0
+
+
+class QueuedNotifier(Notifier):
+    """
+    Notifier that sends notifications from a background thread.
+
+    `notify` only enqueues the notification and returns immediately with a QUEUED result,
+    so a slow or unavailable GitHub API never holds up a build. Failed notifications are
+    retried with exponential backoff, waiting at least as long as GitHub asks for when
+    rate limiting. Only the latest report per repository, commit and status context is
+    kept while waiting, e.g. a pending status that was not sent yet is replaced by the
+    build's final status instead of being sent after all.
+
+    Args:
+        notifier: The notifier that actually sends the notifications.
+        max_attempts: Number of times a notification is tried before it is dropped.
+        backoff: Delay before the first retry in seconds, doubled for every further retry.
+        max_backoff: Upper bound of the retry delay in seconds.
+    """
+
+    def __init__(
+        self,
+        notifier: Notifier,
+        max_attempts: int = 8,
+        backoff: float = 1.0,
+        max_backoff: float = 300.0,
+    ) -> None:
+        self._notifier = notifier
+        self._max_attempts = max_attempts
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+
+        self._changed = threading.Condition()
+        self._pending: OrderedDict[_Key, _Pending] = OrderedDict()
+        self._sending = 0
+        self._paused_until = 0.0
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._work, name="notification-dispatcher", daemon=True
+        )
+        self._thread.start()
+
+    def notify(self, ref: BuildRef, report: BuildReport) -> NotificationResult:
+        key = (ref.repo, ref.sha, report.context)
+        with self._changed:
+            if self._closed:
+                return NotificationResult(
+                    status=NotificationStatus.FAILED, message="Notifier is closed"
+                )
+            # Replacing keeps the position in the queue, so a superseded report does not
+            # delay its successor
+            self._pending[key] = _Pending(ref=ref, report=report)
+            self._changed.notify_all()
+        return NotificationResult(status=NotificationStatus.QUEUED)
+
+    def pending(self) -> int:
+        """Number of notifications waiting to be sent, including ones being sent."""
+        with self._changed:
+            return len(self._pending) + self._sending
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until all queued notifications have been sent or dropped.
+
+        Returns:
+            bool: False if the timeout expired first.
+        """
+        with self._changed:
+            return self._changed.wait_for(
+                lambda: not self._pending and not self._sending, timeout=timeout
+            )
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Sends the queued notifications and stops the background thread."""
+        self.flush(timeout)
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+        self._thread.join(timeout)
+
+    def _work(self) -> None:
+        while True:
+            with self._changed:
+                item = self._next_due()
+                while item is None:
+                    if self._closed:
+                        return
+                    self._changed.wait(timeout=self._time_until_due())
+                    item = self._next_due()
+                key, pending = item
+                del self._pending[key]
+                self._sending += 1
+
+            try:
+                result = self._notifier.notify(pending.ref, pending.report)
+            except Exception as e:
+                result = NotificationResult(
+                    status=NotificationStatus.FAILED, message=str(e), retryable=True
+                )
+
+            with self._changed:
+                self._sending -= 1
+                if result.status == NotificationStatus.FAILED:
+                    self._retry(key, pending, result)
+                self._changed.notify_all()
+
+    def _retry(self, key: _Key, pending: _Pending, result: NotificationResult) -> None:
+        # Called with the lock held
+        now = time.monotonic()
+        if result.retry_after is not None:
+            # Rate limits apply to all requests, not just this notification
+            self._paused_until = max(self._paused_until, now + result.retry_after)
+
+        pending.attempts += 1
+        if key in self._pending:
+            # A newer report for the same status was queued in the meantime
+            return
+        if not result.retryable or pending.attempts >= self._max_attempts:
+            print(
+                f"[ERROR] Failed to send notification: \n\tPayload: {pending.report}\n\tError:{result.message}"
+            )
+            return
+
+        delay = min(self._backoff * 2 ** (pending.attempts - 1), self._max_backoff)
+        # Jitter spreads out retries of notifications that failed at the same time
+        pending.not_before = now + delay * random.uniform(0.5, 1.0)
+        self._pending[key] = pending
+
+    def _next_due(self) -> Optional[tuple[_Key, _Pending]]:
+        now = time.monotonic()
+        if now < self._paused_until:
+            return None
+        for key, pending in self._pending.items():
+            if pending.not_before <= now:
+                return key, pending
+        return None
+
+    def _time_until_due(self) -> Optional[float]:
+        if not self._pending:
+            return None
+        now = time.monotonic()
+        due = min(pending.not_before for pending in self._pending.values())
+        return max(max(due, self._paused_until) - now, 0.0)
@@ -0,0 +1,273 @@
+"""
+Build agent that runs builds on behalf of a coordinator.
+
+Start one or more agents with
+```bash
+python3.13 -m src.agent http://coordinator:8010 --name agent-1
+```
+The agent reads `AGENT_TOKEN` and the build settings (caches, test shards, limits and
+timeouts) from the `.env` file of its working directory. Several agents can run on the
+same machine, every build is checked out into a directory of its own.
+"""
+
+import argparse
+import base64
+import os
+import socket
+import threading
+from dataclasses import asdict
+from typing import Any, Callable, Optional, Tuple
+
+from src.build_log import BuildLog
+from src.builder import BuildOptions, build_project
+from src.config import load_server_config
+from src.infra.http.httpClient import HttpClient
+from src.infra.http.requestsHttpClient import RequestsHttpClient
+from src.models import BuildReport
+from src.scheduler import host_memory_mb
+
+BuildFunction = Callable[..., Tuple[BuildReport, BuildLog]]
+
+# Seconds a lease request waits on the coordinator for a build to be queued
+_LEASE_WAIT = 20.0
+# Seconds to wait before retrying after the coordinator could not be reached
+_RETRY_DELAY = 5.0
+_TIMEOUT = 30
+
+
+class CoordinatorError(Exception):
+    """Raised when the coordinator rejects a request or cannot be reached."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class BuildAgent:
+    """
+    Runs builds leased from a coordinator, see `src.coordinator.AgentPool`.
+
+    The agent registers with its capacity, then asks the coordinator for a build
+    whenever one of its slots is free. Every build runs in a thread of its own, which
+    streams the build's output to the coordinator while it runs and reports the result
+    at the end. A heartbeat thread keeps the agent registered and stops builds the
+    coordinator cancelled. If the coordinator forgets the agent, e.g. after missed
+    heartbeats, the agent stops its builds and registers again.
+
+    Args:
+        coordinator_url: Base URL of the coordinator.
+        token: Shared secret the coordinator authenticates agents with.
+        name: Name of the agent shown by the coordinator.
+        slots: Number of builds run at once.
+        options: Settings of the builds.
+        client: HTTP client used to talk to the coordinator.
+        build: Function running a build, with the signature of `build_project`.
+    """
+
+    def __init__(
+        self,
+        coordinator_url: str,
+        token: str,
+        name: str,
+        slots: int,
+        options: Optional[BuildOptions] = None,
+        client: Optional[HttpClient] = None,
+        build: BuildFunction = build_project,
+    ) -> None:
+        self.name = name
+        self.slots = slots
+        self._url = coordinator_url.rstrip("/")
+        self._headers = {"Authorization": f"Bearer {token}"}
+        self._options = options if options is not None else BuildOptions()
+        self._client = client if client is not None else RequestsHttpClient()
+        self._build = build
+
+        self._lock = threading.Lock()
+        self._agent_id: Optional[str] = None
+        self._heartbeat_interval = 5.0
+        # Cancel events of the running builds, by build id
+        self._running: dict[str, threading.Event] = {}
+
+    def run(self, stop: threading.Event) -> None:
+        """Leases and runs builds until `stop` is set, then waits for running builds."""
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(stop,), name="agent-heartbeat", daemon=True
+        )
+        heartbeat.start()
+        workers: list[threading.Thread] = []
+        try:
+            while not stop.is_set():
+                workers = [worker for worker in workers if worker.is_alive()]
+                if len(workers) >= self.slots:
+                    stop.wait(timeout=0.1)
+                    continue
+                try:
+                    agent_id = self._ensure_registered()
+                    lease = self._post(
+                        f"/agents/{agent_id}/lease?wait={_LEASE_WAIT}", {}
+                    )
+                except CoordinatorError as e:
+                    self._handle_error(e)
+                    stop.wait(timeout=_RETRY_DELAY)
+                    continue
+                build = lease.get("build")
+                if build is None:
+                    continue
+                cancel = threading.Event()
+                with self._lock:
+                    self._running[build["build_id"]] = cancel
+                worker = threading.Thread(
+                    target=self._run_build,
+                    args=(agent_id, build, cancel),
+                    name=f"agent-build-{build['build_id']}",
+                )
+                worker.start()
+                workers.append(worker)
+        finally:
+            for worker in workers:
+                worker.join()
+
+    def _run_build(
+        self, agent_id: str, build: dict[str, Any], cancel: threading.Event
+    ) -> None:
+        build_id = build["build_id"]
+        log = BuildLog.temporary()
+        uploader = threading.Thread(
+            target=self._upload_log,
+            args=(agent_id, build_id, log),
+            name=f"agent-log-{build_id}",
+        )
+        uploader.start()
+        try:
+            report, log = self._build(
+                build["clone_url"],
+                build["branch"],
+                build["sha"],
+                self._options,
+                log,
+                cancel=cancel,
+            )
+            # The output must arrive before the result, which ends the build's log
+            uploader.join()
+            self._post(
+                f"/agents/{agent_id}/builds/{build_id}/result",
+                {
+                    "state": report.state.value,
+                    "description": report.description,
+                    "timeline": [asdict(timing) for timing in log.timeline],
+                    "first_failure_offset": log.first_failure_offset,
+                },
+            )
+        except CoordinatorError as e:
+            self._handle_error(e)
+        finally:
+            log.discard()
+            uploader.join()
+            with self._lock:
+                self._running.pop(build_id, None)
+
+    def _upload_log(self, agent_id: str, build_id: str, log: BuildLog) -> None:
+        # Follows the log while the build writes it, so the coordinator's live log is
+        # only behind by the requests in flight
+        for chunk in log.follow(poll_interval=1.0):
+            try:
+                self._post(
+                    f"/agents/{agent_id}/builds/{build_id}/log",
+                    {"data": base64.b64encode(chunk).decode()},
+                )
+            except CoordinatorError as e:
+                self._handle_error(e)
+                return
+
+    def _heartbeat(self, stop: threading.Event) -> None:
+        while not stop.wait(timeout=self._heartbeat_interval):
+            with self._lock:
+                agent_id = self._agent_id
+            if agent_id is None:
+                continue
+            try:
+                response = self._post(f"/agents/{agent_id}/heartbeat", {})
+            except CoordinatorError as e:
+                self._handle_error(e)
+                continue
+            with self._lock:
+                for build_id in response.get("cancel", []):
+                    if build_id in self._running:
+                        self._running[build_id].set()
+
+    def _ensure_registered(self) -> str:
+        with self._lock:
+            if self._agent_id is not None:
+                return self._agent_id
+        response = self._post(
+            "/agents",
+            {
+                "name": self.name,
+                "cores": os.cpu_count() or 1,
+                "memory_mb": host_memory_mb(),
+                "slots": self.slots,
+            },
+        )
+        with self._lock:
+            self._agent_id = response["agent_id"]
+            self._heartbeat_interval = float(response["heartbeat_interval"])
+            print(f"[LOG] Registered with the coordinator as {self._agent_id}")
+            return self._agent_id
+
+    def _handle_error(self, error: CoordinatorError) -> None:
+        print(f"[ERROR] Coordinator request failed: {error}")
+        if error.status_code == 410:
+            # The coordinator gave up on this agent and requeued its builds elsewhere
+            with self._lock:
+                self._agent_id = None
+                for cancel in self._running.values():
+                    cancel.set()
+
+    def _post(self, path: str, body: dict[str, Any]) -> dict[str, Any]:
+        try:
+            response = self._client.post(
+                f"{self._url}{path}", json=body, headers=self._headers, timeout=_TIMEOUT
+            )
+        except Exception as e:
+            raise CoordinatorError(f"{path}: {e}") from e
+        if not response.ok:
+            raise CoordinatorError(
+                f"{path}: {response.status_code} {response.text}", response.status_code
+            )
+        result: dict[str, Any] = response.json()
+        return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Runs builds for a CI coordinator.")
+    parser.add_argument("coordinator", help="Base URL of the coordinator")
+    parser.add_argument("--name", default=socket.gethostname())
+    parser.add_argument(
+        "--slots",
+        type=int,
+        default=None,
+        help="Builds run at once, defaults to the BUILD_WORKERS setting",
+    )
+    args = parser.parse_args()
+
+    config = load_server_config()
+    if config.agent_token is None:
+        raise SystemExit("AGENT_TOKEN must be set in the .env file")
+    options = BuildOptions.from_config(config)
+    agent = BuildAgent(
+        args.coordinator,
+        config.agent_token,
+        args.name,
+        args.slots if args.slots is not None else config.build_workers,
+        options,
+    )
+
+    stop = threading.Event()
+    try:
+        agent.run(stop)
+    except KeyboardInterrupt:
+        stop.set()
+
+
+if __name__ == "__main__":
+    main()
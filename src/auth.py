@@ -1,18 +1,25 @@
+from typing import Optional
+
 from dotenv import dotenv_values
 
 from src.infra.githubAuth.appAuth import GithubAppAuth, GithubAppConfig
 from src.infra.githubAuth.githubAuth import GithubAuth
 from src.infra.githubAuth.patAuth import GithubPatAuth
+from src.infra.http.httpClient import HttpClient
 
 
-def create_github_auth() -> GithubAuth:
+def create_github_auth(client: Optional[HttpClient] = None) -> GithubAuth:
     """
     Creates a GithubAuth instance based on environment variables.
 
+    The optional HTTP client is used to mint installation tokens, so they can share
+    pooled connections with the rest of the server's GitHub traffic.
+
     Read the environment variables from a `.env` file
     - SECRET_KEY
     - CLIENT_ID
     - PAT_TOKEN
+    - TOKEN_CACHE_FILE (optional, persists GitHub App installation tokens across restarts)
 
     If SECRET_KEY and CLIENT_ID are present, creates a GithubAppAuth
     instance and if only PAT_TOKEN is present, creates a GithubPatAuth
@@ -24,10 +31,13 @@ def create_github_auth() -> GithubAuth:
     secret_key = environment.get("SECRET_KEY")
     client_id = environment.get("CLIENT_ID")
     pat_token = environment.get("PAT_TOKEN")
+    token_cache_file = environment.get("TOKEN_CACHE_FILE") or None
 
     if secret_key is not None and client_id is not None:
         return GithubAppAuth(
-            GithubAppConfig(client_id=client_id, private_key_pem=secret_key)
+            GithubAppConfig(client_id=client_id, private_key_pem=secret_key),
+            client=client,
+            cache_path=token_cache_file,
         )
 
     elif pat_token is not None:
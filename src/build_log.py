@@ -0,0 +1,297 @@
+import contextlib
+import os
+import tempfile
+import threading
+from typing import Iterator, Optional
+
+from src.models import StepTiming
+
+
+class BuildLog:
+    """Output of a build, streamed to a file on disk.
+
+    Build steps write their output here as it is produced. Only a bounded tail of the
+    output is kept in memory, which is used for error messages and reports, while the
+    complete output is read back from disk when the log is persisted.
+
+    Attributes:
+        path: File the output is written to.
+        tail_bytes: Number of trailing bytes kept in memory.
+    """
+
+    def __init__(self, path: str, tail_bytes: int = 64 * 1024) -> None:
+        self.path = path
+        self.tail_bytes = tail_bytes
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        # Stays open while the build writes to it, closed by `close`
+        self._file = open(path, "wb")  # noqa: SIM115
+        self._tail = bytearray()
+        self._size = 0
+        self._closed = False
+        self._section_offset = 0
+        self._first_failure_offset: Optional[int] = None
+        self._timeline: list[StepTiming] = []
+        self._forward: Optional["BuildLog"] = None
+
+    @classmethod
+    def temporary(cls, directory: Optional[str] = None) -> "BuildLog":
+        """Creates a log backed by a new temporary file.
+
+        Args:
+            directory: Directory of the file, defaults to the system's temp directory.
+        """
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix="build-", suffix=".log", dir=directory)
+        os.close(fd)
+        return cls(path)
+
+    @property
+    def size(self) -> int:
+        """Number of bytes written to the log so far."""
+        return self._size
+
+    @property
+    def first_failure_offset(self) -> Optional[int]:
+        """Offset of the section of the first failed build step, if any step failed."""
+        return self._first_failure_offset
+
+    @property
+    def timeline(self) -> list[StepTiming]:
+        """Timing and resource usage of the build steps recorded so far."""
+        with self._lock:
+            return list(self._timeline)
+
+    def record_step(self, timing: StepTiming) -> None:
+        """Adds the timing of a finished build step to the build's timeline."""
+        with self._lock:
+            if self._forward is not None:
+                self._forward.record_step(timing)
+                return
+            self._timeline.append(timing)
+
+    @property
+    def closed(self) -> bool:
+        """Whether the build has finished writing to the log."""
+        return self._closed
+
+    def write(self, data: bytes | str) -> None:
+        """Appends output to the log, dropping output written after it was closed."""
+        chunk = data.encode() if isinstance(data, str) else data
+        if not chunk:
+            return
+
+        with self._lock:
+            if self._forward is not None:
+                self._forward.write(chunk)
+                return
+            if self._closed:
+                return
+            self._file.write(chunk)
+            # Flush right away so readers of the file see output as it is produced
+            self._file.flush()
+            self._size += len(chunk)
+            self._tail += chunk
+            if len(self._tail) > 2 * self.tail_bytes:
+                del self._tail[: len(self._tail) - self.tail_bytes]
+            self._changed.notify_all()
+
+    def section(self, step_name: str) -> None:
+        """Writes the header separating the output of a build step from the previous one."""
+        with self._lock:
+            if self._forward is not None:
+                self._forward.section(step_name)
+                return
+            self._section_offset = self._size
+        self.write(f"\n---{step_name}---\n")
+
+    def mark_failure(self) -> None:
+        """Records the current section as the first failure, unless one was recorded before."""
+        with self._lock:
+            if self._forward is not None:
+                self._forward.mark_failure()
+                return
+            self._mark_failure_at(self._section_offset)
+
+    def mark_failure_at(self, offset: int) -> None:
+        """Records the output at `offset` as the first failure, unless one was recorded before."""
+        with self._lock:
+            self._mark_failure_at(offset)
+
+    def _mark_failure_at(self, offset: int) -> None:
+        # Called with the lock held
+        if self._first_failure_offset is None:
+            self._first_failure_offset = offset
+
+    def tail(self) -> str:
+        """Returns the last `tail_bytes` of output."""
+        with self._lock:
+            if self._forward is not None:
+                return self._forward.tail()
+            return bytes(self._tail[-self.tail_bytes :]).decode(errors="replace")
+
+    def forward_to(self, target: "BuildLog") -> None:
+        """Appends the output written so far to `target` and sends all further output there.
+
+        The timeline and a recorded failure are carried over as well, with the failure's
+        offset shifted to where the output was appended.
+        """
+        with self._lock:
+            offset = target.size
+            self._file.flush()
+            for chunk in self.read_chunks():
+                target.write(chunk)
+            with target._lock:
+                if self._first_failure_offset is not None:
+                    target._mark_failure_at(offset + self._first_failure_offset)
+                target._timeline.extend(self._timeline)
+            self._forward = target
+
+    def read_chunks(self, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """Reads the complete output back from disk in chunks."""
+        with open(self.path, "rb") as f:
+            yield from iter(lambda: f.read(chunk_size), b"")
+
+    def follow(
+        self, offset: int = 0, chunk_size: int = 64 * 1024, poll_interval: float = 15.0
+    ) -> Iterator[bytes]:
+        """Reads the output from `offset` onwards, waiting for new output until the log is closed.
+
+        Every follower reads from its own file handle starting at its offset, and sleeps
+        until the build writes more output, so following a log only costs the bytes that
+        are actually new to the follower.
+
+        Args:
+            offset: Byte offset to start reading at, e.g. the number of bytes a reconnecting
+                client has already received.
+            chunk_size: Maximum number of bytes yielded at once.
+            poll_interval: Maximum time to sleep between checks for new output.
+        """
+        try:
+            f = open(self.path, "rb")  # noqa: SIM115 - entered below, once it opened
+        except FileNotFoundError:
+            # The build finished and its log was discarded before we started reading
+            return
+
+        with f:
+            f.seek(min(offset, self.size))
+            while True:
+                chunk = f.read(chunk_size)
+                if chunk:
+                    yield chunk
+                    continue
+
+                with self._changed:
+                    if self._size <= f.tell():
+                        if self._closed:
+                            return
+                        self._changed.wait(timeout=poll_interval)
+
+    def close(self) -> None:
+        """Marks the log as finished and closes the underlying file."""
+        with self._lock:
+            if not self._closed:
+                self._file.close()
+                self._closed = True
+                self._changed.notify_all()
+
+    def discard(self) -> None:
+        """Closes the log and removes its file."""
+        self.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path)
+
+
+class LiveLogRegistry:
+    """Registry of the logs of builds that are currently running.
+
+    Allows the output of a build to be followed while it is still being written.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._logs: dict[str, BuildLog] = {}
+
+    def create(self, build_id: str) -> BuildLog:
+        """Creates and registers the log of a build."""
+        os.makedirs(self.directory, exist_ok=True)
+        log = BuildLog(os.path.join(self.directory, f"{build_id}.log"))
+        with self._lock:
+            self._logs[build_id] = log
+        return log
+
+    def get(self, build_id: str) -> Optional[BuildLog]:
+        """Returns the log of a running build, if any."""
+        with self._lock:
+            return self._logs.get(build_id)
+
+    def remove(self, build_id: str) -> None:
+        """Unregisters and discards the log of a build.
+
+        Clients that are already following the log keep their open file and read
+        it to the end.
+        """
+        with self._lock:
+            log = self._logs.pop(build_id, None)
+        if log is not None:
+            log.discard()
+
+
+class StageLogs:
+    """Presents the output of concurrently running build stages in a stable order.
+
+    The first unfinished stage, in the order the stages were declared, writes straight to
+    the build log so its output can be followed live. Later stages write to a buffer of
+    their own, which is appended to the build log once every stage before them has
+    finished, and from then on forwards their output to it.
+
+    Args:
+        log: Log of the build.
+        stages: Names of the stages in the order their output is presented.
+    """
+
+    def __init__(self, log: BuildLog, stages: list[str]) -> None:
+        self._log = log
+        self._order = list(stages)
+        self._lock = threading.Lock()
+        self._head = 0
+        self._finished: set[str] = set()
+        self._buffers: dict[str, BuildLog] = {}
+
+    def open(self, stage: str) -> BuildLog:
+        """Returns the log a stage that is about to start writes its output to."""
+        with self._lock:
+            if self._order[self._head] == stage:
+                return self._log
+            buffer = BuildLog.temporary()
+            self._buffers[stage] = buffer
+            return buffer
+
+    def finish(self, stage: str) -> None:
+        """Records that a stage has written all of its output."""
+        with self._lock:
+            self._finished.add(stage)
+            while (
+                self._head < len(self._order)
+                and self._order[self._head] in self._finished
+            ):
+                buffer = self._buffers.pop(self._order[self._head], None)
+                if buffer is not None:
+                    buffer.discard()
+                self._head += 1
+                if self._head < len(self._order):
+                    next_buffer = self._buffers.get(self._order[self._head])
+                    if next_buffer is not None:
+                        next_buffer.forward_to(self._log)
+
+    def close(self) -> None:
+        """Appends the output of stages that are still buffered, e.g. after a failure."""
+        with self._lock:
+            for stage in self._order[self._head :]:
+                buffer = self._buffers.pop(stage, None)
+                if buffer is not None:
+                    if self._order[self._head] != stage:
+                        buffer.forward_to(self._log)
+                    buffer.discard()
@@ -0,0 +1,764 @@
+import asyncio
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Awaitable, Callable, Optional
+
+from src.infra.history.queueStore import BuildQueueStore, QueuedBuild
+from src.infra.time.clock import Clock, SystemClock
+from src.models import BuildRef, BuildReport, BuildStatus
+from src.scheduler import DEFAULT_PRIORITY, AdmissionPolicy, BuildScheduler, Priorities
+
+BuildHandler = Callable[["BuildJob"], BuildReport]
+AsyncBuildHandler = Callable[["BuildJob"], Awaitable[BuildReport]]
+
+
+class QueueFull(Exception):
+    """
+    Raised when a build is submitted while the queue holds as many queued builds as it
+    may.
+
+    Attributes:
+        repo (Optional[str]): The repository whose share of the queue is used up, or None
+            if the whole queue is full.
+    """
+
+    def __init__(self, message: str, repo: Optional[str] = None) -> None:
+        super().__init__(message)
+        self.repo = repo
+
+
+class BuildJobState(str, Enum):
+    """Lifecycle states of a job in the build queue."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    FINISHED = "finished"
+
+
+@dataclass
+class BuildJob:
+    """
+    A single build request tracked by the build queue.
+
+    Attributes:
+        id (str): Unique identifier of the build, returned to the webhook caller.
+        ref (BuildRef): The commit to build.
+        enqueued_at (float): Time the job entered the queue.
+        priority (str): Name of the job's priority class.
+        started_at (Optional[float]): Time a worker picked the job up.
+        finished_at (Optional[float]): Time the handler returned.
+        state (BuildJobState): Current lifecycle state of the job.
+        report (Optional[BuildReport]): Final report, set once the job is finished.
+        superseded_by (Optional[str]): Commit SHA of the newer push to the same branch that
+            replaced this build, if any.
+        cancelled (threading.Event): Set when the build should be stopped while running.
+    """
+
+    id: str
+    ref: BuildRef
+    enqueued_at: float
+    priority: str = DEFAULT_PRIORITY
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    state: BuildJobState = BuildJobState.QUEUED
+    report: Optional[BuildReport] = None
+    superseded_by: Optional[str] = None
+    cancelled: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def wait_time(self) -> Optional[float]:
+        """Seconds the job spent in the queue before a worker started it."""
+        if self.started_at is None:
+            return None
+        return self.started_at - self.enqueued_at
+
+
+@dataclass(frozen=True)
+class WorkerStats:
+    """
+    Snapshot of a single build worker.
+
+    Attributes:
+        name (str): Name of the worker thread.
+        busy (bool): Whether the worker is currently running a build.
+        jobs_completed (int): Number of builds the worker has finished.
+        busy_time (float): Total seconds spent running builds.
+        utilisation (float): Fraction of the worker's lifetime spent running builds.
+    """
+
+    name: str
+    busy: bool
+    jobs_completed: int
+    busy_time: float
+    utilisation: float
+
+
+@dataclass(frozen=True)
+class PriorityStats:
+    """
+    Snapshot of the jobs of a priority class.
+
+    Attributes:
+        depth (int): Number of jobs of the class waiting for a worker.
+        started (int): Number of jobs of the class started since the queue was started.
+        avg_wait_time (float): Mean queue wait time of the started jobs in seconds.
+        max_wait_time (float): Longest queue wait time of the started jobs in seconds.
+    """
+
+    depth: int
+    started: int
+    avg_wait_time: float
+    max_wait_time: float
+
+
+@dataclass(frozen=True)
+class QueueStats:
+    """
+    Snapshot of the build queue.
+
+    Attributes:
+        depth (int): Number of jobs waiting for a worker.
+        running (int): Number of jobs currently being built.
+        completed (int): Number of jobs finished since the queue was started.
+        superseded (int): Number of queued jobs dropped in favour of a newer push.
+        deduplicated (int): Number of submissions answered with a job already queued or
+            running for the same commit.
+        avg_wait_time (float): Mean queue wait time of all started jobs in seconds.
+        max_wait_time (float): Longest queue wait time of all started jobs in seconds.
+        workers (list[WorkerStats]): Per-worker statistics.
+        priorities (dict[str, PriorityStats]): Statistics per priority class, highest
+            first.
+    """
+
+    depth: int
+    running: int
+    completed: int
+    superseded: int
+    deduplicated: int
+    avg_wait_time: float
+    max_wait_time: float
+    workers: list[WorkerStats] = field(default_factory=list)
+    priorities: dict[str, PriorityStats] = field(default_factory=dict)
+
+
+@dataclass
+class _WorkerState:
+    name: str
+    started_at: float
+    current_job_started_at: Optional[float] = None
+    jobs_completed: int = 0
+    busy_time: float = 0.0
+
+
+@dataclass
+class _PriorityState:
+    queued: int = 0
+    started: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+
+class _BuildQueueBase(ABC):
+    """
+    Job tracking, coalescing and statistics shared by the build queue implementations,
+    which differ in how the workers run the handler.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        clock: Optional[Clock],
+        history_size: int,
+        coalesce: bool,
+        cancel_running: bool,
+        on_superseded: Optional[Callable[[BuildJob], None]],
+        policy: Optional[AdmissionPolicy],
+        max_queued: Optional[int],
+        max_queued_per_repo: Optional[int],
+        store: Optional[BuildQueueStore],
+        priorities: Optional[Priorities],
+    ) -> None:
+        if workers < 1:
+            raise ValueError("A build queue needs at least one worker")
+
+        self._worker_count = workers
+        self._clock = clock if clock is not None else SystemClock()
+        self._history_size = history_size
+        self._coalesce = coalesce
+        self._cancel_running = cancel_running
+        self._on_superseded = on_superseded
+        self._max_queued = max_queued
+        self._max_queued_per_repo = max_queued_per_repo
+        self._store = store
+
+        self._lock = threading.Lock()
+        self._jobs: OrderedDict[str, BuildJob] = OrderedDict()
+        # Most recent job per (repo, ref), used to find the jobs a new push supersedes
+        self._latest: dict[tuple[str, str], BuildJob] = {}
+        # Queued and running jobs per (repo, sha), used to deduplicate submissions
+        self._active: dict[tuple[str, str], BuildJob] = {}
+        self._workers: list[_WorkerState] = []
+        self._scheduler = BuildScheduler(policy, priorities, self._clock)
+        self._closing = False
+
+        self._queued = 0
+        self._queued_per_repo: dict[str, int] = {}
+        self._per_priority = {
+            name: _PriorityState() for name in self._scheduler.priorities
+        }
+        self._completed = 0
+        self._superseded = 0
+        self._deduplicated = 0
+        self._started = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def submit(self, ref: BuildRef) -> BuildJob:
+        """
+        Adds a build for the given reference to the queue, superseding earlier builds of
+        the same branch if coalescing is enabled.
+
+        Returns:
+            BuildJob: The queued job, whose id can be used to look up its progress. If
+                the commit is already queued or running, that job is returned instead.
+
+        Raises:
+            QueueFull: If the queue or the repository's share of it is full. Pushes that
+                replace a queued build of the same branch are still accepted.
+        """
+        job = BuildJob(id=uuid.uuid4().hex, ref=ref, enqueued_at=self._clock.time())
+        return self._add(job, None)
+
+    def resume(self, build: QueuedBuild) -> BuildJob:
+        """
+        Queues a build again that was recorded in the queue's store before the server
+        stopped, keeping its id and its place in the queue. Resumed builds are not
+        subject to the queue's limits, as they were accepted before.
+
+        Returns:
+            BuildJob: The queued job, or the job already queued or running for the
+                commit, in which case the stored build is forgotten.
+        """
+        job = BuildJob(id=build.id, ref=build.ref, enqueued_at=build.enqueued_at)
+        return self._add(job, build)
+
+    def _add(self, job: BuildJob, resumed: Optional[QueuedBuild]) -> BuildJob:
+        ref = job.ref
+        job.priority = self._scheduler.classify(ref)
+        with self._lock:
+            active = self._active_job(ref)
+            if active is not None:
+                self._deduplicated += 1
+        if active is not None:
+            if resumed is not None and resumed.id != active.id:
+                self._forget(resumed.id)
+            return active
+
+        # The store is written outside of the lock, which the event loop of an
+        # `AsyncBuildQueue` takes as well. Recording the job before it is visible to
+        # other threads keeps a worker from starting it, and a newer push from
+        # superseding it, before its record exists
+        if self._store is not None:
+            attempts = resumed.attempts if resumed is not None else 0
+            self._store.add(job.id, ref, job.enqueued_at, attempts)
+
+        dropped: Optional[BuildJob] = None
+        try:
+            with self._lock:
+                active = self._active_job(ref)
+                if active is not None:
+                    # Submitted concurrently with the same commit
+                    self._deduplicated += 1
+                else:
+                    previous = self._latest.get((ref.repo, ref.ref))
+                    replaces_queued = (
+                        self._coalesce
+                        and previous is not None
+                        and previous.state == BuildJobState.QUEUED
+                    )
+                    if not replaces_queued and resumed is None:
+                        self._check_capacity(ref.repo)
+
+                    self._active[(ref.repo, ref.sha)] = job
+                    self._latest[(ref.repo, ref.ref)] = job
+                    if (
+                        self._coalesce
+                        and previous is not None
+                        and self._supersede(previous, job)
+                    ):
+                        dropped = previous
+                    self._jobs[job.id] = job
+                    self._count_queued(job, 1)
+                    self._trim_history()
+        except QueueFull:
+            self._forget(job.id)
+            raise
+
+        if active is not None:
+            if active.id != job.id:
+                self._forget(job.id)
+            return active
+        if dropped is not None:
+            self._forget(dropped.id)
+        self._enqueue(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[BuildJob]:
+        """Returns the job with the given id, if it is still tracked by the queue."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> QueueStats:
+        """Returns a snapshot of queue depth, wait times and worker utilisation."""
+        now = self._clock.time()
+        with self._lock:
+            workers = [self._worker_stats(w, now) for w in self._workers]
+            return QueueStats(
+                depth=self._queued,
+                running=sum(1 for w in workers if w.busy),
+                completed=self._completed,
+                superseded=self._superseded,
+                deduplicated=self._deduplicated,
+                avg_wait_time=self._total_wait / self._started
+                if self._started
+                else 0.0,
+                max_wait_time=self._max_wait,
+                workers=workers,
+                priorities={
+                    name: PriorityStats(
+                        depth=state.queued,
+                        started=state.started,
+                        avg_wait_time=state.total_wait / state.started
+                        if state.started
+                        else 0.0,
+                        max_wait_time=state.max_wait,
+                    )
+                    for name, state in self._per_priority.items()
+                },
+            )
+
+    @abstractmethod
+    def _enqueue(self, job: BuildJob) -> None:
+        # Hands a job to the scheduler and wakes up the workers
+        ...
+
+    def _next_job(self) -> tuple[Optional[BuildJob], bool]:
+        # Called with the lock held. Returns the next job a worker may start, and whether
+        # the worker should stop because the queue is shutting down and no job is left
+        job = self._scheduler.take()
+        return job, job is None and self._closing and not len(self._scheduler)
+
+    def _claim(self, worker: _WorkerState, job: BuildJob) -> Optional[float]:
+        # Marks the job as running on the worker and returns its start time, or None if
+        # the job was superseded while waiting in the queue and must be skipped
+        started_at = self._clock.time()
+        with self._lock:
+            superseded = job.state != BuildJobState.QUEUED
+            if not superseded:
+                job.started_at = started_at
+                job.state = BuildJobState.RUNNING
+                worker.current_job_started_at = started_at
+                wait = started_at - job.enqueued_at
+                self._count_queued(job, -1)
+                self._started += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+                priority = self._per_priority[job.priority]
+                priority.started += 1
+                priority.total_wait += wait
+                priority.max_wait = max(priority.max_wait, wait)
+
+        if superseded:
+            self._notify_superseded(job)
+            return None
+        # No other thread writes the record of a running job, so the lock is not needed
+        if self._store is not None:
+            self._store.start(job.id)
+        return started_at
+
+    def _finish(
+        self,
+        worker: _WorkerState,
+        job: BuildJob,
+        started_at: float,
+        report: BuildReport,
+    ) -> None:
+        finished_at = self._clock.time()
+        with self._lock:
+            job.finished_at = finished_at
+            job.report = report
+            job.state = BuildJobState.FINISHED
+            worker.current_job_started_at = None
+            worker.jobs_completed += 1
+            worker.busy_time += finished_at - started_at
+            self._completed += 1
+            if self._latest.get((job.ref.repo, job.ref.ref)) is job:
+                del self._latest[(job.ref.repo, job.ref.ref)]
+            self._release(job)
+        self._forget(job.id)
+
+    def _crash_report(self, job: BuildJob, error: Exception) -> BuildReport:
+        print(
+            f"[ERROR] Build {job.id} for {job.ref.repo}@{job.ref.sha} crashed: {error}"
+        )
+        return BuildReport(
+            state=BuildStatus.ERROR, description="System error during build"
+        )
+
+    def _supersede(self, previous: BuildJob, job: BuildJob) -> bool:
+        # Called with the lock held. Returns whether the previous job was dropped from
+        # the queue, whose record the caller removes from the store after the lock
+        if previous.state == BuildJobState.QUEUED:
+            # The job stays in the pending queue, workers skip it once they get to it
+            previous.superseded_by = job.ref.sha
+            previous.state = BuildJobState.FINISHED
+            previous.finished_at = job.enqueued_at
+            previous.report = superseded_report(previous)
+            self._count_queued(previous, -1)
+            self._superseded += 1
+            self._release(previous)
+            return True
+        if previous.state == BuildJobState.RUNNING and self._cancel_running:
+            previous.superseded_by = job.ref.sha
+            previous.cancelled.set()
+        return False
+
+    def _check_capacity(self, repo: str) -> None:
+        # Called with the lock held
+        if self._max_queued is not None and self._queued >= self._max_queued:
+            raise QueueFull(f"The build queue is full ({self._queued} queued builds)")
+        queued = self._queued_per_repo.get(repo, 0)
+        if (
+            self._max_queued_per_repo is not None
+            and queued >= self._max_queued_per_repo
+        ):
+            raise QueueFull(f"{repo} has {queued} queued builds", repo)
+
+    def _count_queued(self, job: BuildJob, delta: int) -> None:
+        # Called with the lock held
+        repo = job.ref.repo
+        self._queued += delta
+        count = self._queued_per_repo.get(repo, 0) + delta
+        if count:
+            self._queued_per_repo[repo] = count
+        else:
+            self._queued_per_repo.pop(repo, None)
+        self._per_priority[job.priority].queued += delta
+
+    def _active_job(self, ref: BuildRef) -> Optional[BuildJob]:
+        # Called with the lock held. Returns the job queued or running for the commit
+        active = self._active.get((ref.repo, ref.sha))
+        if active is None or active.cancelled.is_set():
+            return None
+        return active
+
+    def _forget(self, build_id: str) -> None:
+        # Called without the lock held
+        if self._store is not None:
+            self._store.remove(build_id)
+
+    def _release(self, job: BuildJob) -> None:
+        # Called with the lock held once a job will not be built any further
+        if self._active.get((job.ref.repo, job.ref.sha)) is job:
+            del self._active[(job.ref.repo, job.ref.sha)]
+
+    def _notify_superseded(self, job: BuildJob) -> None:
+        if self._on_superseded is None:
+            return
+        try:
+            self._on_superseded(job)
+        except Exception as e:
+            print(f"[ERROR] Failed to handle superseded build {job.id}: {e}")
+
+    def _worker_stats(self, worker: _WorkerState, now: float) -> WorkerStats:
+        busy_time = worker.busy_time
+        if worker.current_job_started_at is not None:
+            busy_time += now - worker.current_job_started_at
+        lifetime = now - worker.started_at
+        return WorkerStats(
+            name=worker.name,
+            busy=worker.current_job_started_at is not None,
+            jobs_completed=worker.jobs_completed,
+            busy_time=busy_time,
+            utilisation=busy_time / lifetime if lifetime > 0 else 0.0,
+        )
+
+    def _trim_history(self) -> None:
+        # Only forget finished jobs, queued and running jobs must stay observable
+        while len(self._jobs) > self._history_size:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest.state != BuildJobState.FINISHED:
+                return
+            del self._jobs[oldest_id]
+
+
+class BuildQueue(_BuildQueueBase):
+    """
+    Queue of pending builds drained by a pool of worker threads.
+
+    Webhook handlers call `submit` which returns immediately with a `BuildJob`, while the
+    workers run the handler for each job. The handler is expected to take care
+    of notifying about the build's progress; exceptions escaping it are logged and the job is
+    finished with an error report so the worker stays alive.
+
+    With `coalesce` enabled only the most recent push to a branch is built: queued jobs of
+    the same repository and ref are finished with a superseded report as soon as a newer
+    job is submitted, and `on_superseded` is called for them from a worker thread. With
+    `cancel_running` the running job of the branch is also flagged through its `cancelled`
+    event, which the handler is expected to honour.
+
+    Submitting a commit that is already queued or running returns the existing job, so
+    a commit is never built twice at the same time, e.g. when a webhook is redelivered
+    or the same commit is pushed to several branches.
+
+    Builds of a repository and priority class start in the order they were submitted.
+    A `policy` limits which builds run at the same time, by the cores and memory they
+    reserve and by repository and installation, and shares the workers fairly between
+    repositories, see `BuildScheduler`. Without one the workers run the builds in FIFO
+    order. `priorities` sorts builds into priority classes by their repository and ref,
+    builds of higher classes start first.
+
+    With `max_queued` or `max_queued_per_repo` set, `submit` raises `QueueFull` instead
+    of queueing builds beyond those limits, so callers can push back on bursts rather
+    than let the backlog grow without bound.
+
+    With a `store`, queued and running builds are recorded as they change, so that
+    builds accepted before the server stopped can be queued again with `resume`.
+    """
+
+    def __init__(
+        self,
+        handler: BuildHandler,
+        workers: int = 2,
+        clock: Optional[Clock] = None,
+        history_size: int = 1000,
+        coalesce: bool = False,
+        cancel_running: bool = False,
+        on_superseded: Optional[Callable[[BuildJob], None]] = None,
+        policy: Optional[AdmissionPolicy] = None,
+        max_queued: Optional[int] = None,
+        max_queued_per_repo: Optional[int] = None,
+        store: Optional[BuildQueueStore] = None,
+        priorities: Optional[Priorities] = None,
+    ) -> None:
+        super().__init__(
+            workers,
+            clock,
+            history_size,
+            coalesce,
+            cancel_running,
+            on_superseded,
+            policy,
+            max_queued,
+            max_queued_per_repo,
+            store,
+            priorities,
+        )
+        self._handler = handler
+        # Shares the queue's lock, signalled when a job is queued or a build finished
+        self._changed = threading.Condition(self._lock)
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        """Starts the worker threads. Calling start on a running queue has no effect."""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self._worker_count):
+                state = _WorkerState(
+                    name=f"build-worker-{i}", started_at=self._clock.time()
+                )
+                thread = threading.Thread(
+                    target=self._work, args=(state,), name=state.name, daemon=True
+                )
+                self._workers.append(state)
+                self._threads.append(thread)
+
+        for thread in self._threads:
+            thread.start()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stops the workers once the jobs already in the queue have been processed.
+
+        Args:
+            wait (bool): Block until all workers have exited.
+        """
+        with self._changed:
+            self._closing = True
+            self._changed.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _work(self, worker: _WorkerState) -> None:
+        while True:
+            with self._changed:
+                job, stop = self._next_job()
+                while job is None and not stop:
+                    self._changed.wait()
+                    job, stop = self._next_job()
+            if job is None:
+                return
+            try:
+                self._run(worker, job)
+            finally:
+                with self._changed:
+                    self._scheduler.release(job)
+                    self._changed.notify_all()
+
+    def _enqueue(self, job: BuildJob) -> None:
+        with self._changed:
+            self._scheduler.add(job)
+            self._changed.notify_all()
+
+    def _run(self, worker: _WorkerState, job: BuildJob) -> None:
+        started_at = self._claim(worker, job)
+        if started_at is None:
+            return
+
+        try:
+            report = self._handler(job)
+        except Exception as e:
+            report = self._crash_report(job, e)
+        self._finish(worker, job, started_at, report)
+
+
+class AsyncBuildQueue(_BuildQueueBase):
+    """
+    Variant of `BuildQueue` whose builds run as tasks on a single event loop.
+
+    Instead of a thread per worker, one thread runs an event loop and `workers` limits
+    the number of builds the loop supervises at the same time, so many concurrent builds
+    only cost a task each. The handler is a coroutine function and must not block the
+    loop. Submitting, coalescing, scheduling, persistence and statistics work as in
+    `BuildQueue`, but writes to the `store` and `on_superseded` run in worker threads,
+    off the loop.
+    """
+
+    def __init__(
+        self,
+        handler: AsyncBuildHandler,
+        workers: int = 2,
+        clock: Optional[Clock] = None,
+        history_size: int = 1000,
+        coalesce: bool = False,
+        cancel_running: bool = False,
+        on_superseded: Optional[Callable[[BuildJob], None]] = None,
+        policy: Optional[AdmissionPolicy] = None,
+        max_queued: Optional[int] = None,
+        max_queued_per_repo: Optional[int] = None,
+        store: Optional[BuildQueueStore] = None,
+        priorities: Optional[Priorities] = None,
+    ) -> None:
+        super().__init__(
+            workers,
+            clock,
+            history_size,
+            coalesce,
+            cancel_running,
+            on_superseded,
+            policy,
+            max_queued,
+            max_queued_per_repo,
+            store,
+            priorities,
+        )
+        self._handler = handler
+        self._loop = asyncio.new_event_loop()
+        # Only used from the loop, other threads wake the workers with
+        # call_soon_threadsafe
+        self._waiters: list[asyncio.Future[None]] = []
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Starts the event loop. Calling start on a running queue has no effect."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            now = self._clock.time()
+            self._workers = [
+                _WorkerState(name=f"build-slot-{i}", started_at=now)
+                for i in range(self._worker_count)
+            ]
+            self._thread = threading.Thread(
+                target=self._loop.run_until_complete,
+                args=(self._supervise(),),
+                name="build-loop",
+                daemon=True,
+            )
+        self._thread.start()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stops the event loop once the jobs already in the queue have been processed.
+
+        Args:
+            wait (bool): Block until the event loop has exited.
+        """
+        if self._thread is None:
+            return
+        with self._lock:
+            self._closing = True
+        self._loop.call_soon_threadsafe(self._wake)
+        if wait:
+            self._thread.join()
+            self._loop.close()
+
+    def _enqueue(self, job: BuildJob) -> None:
+        with self._lock:
+            self._scheduler.add(job)
+        self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self) -> None:
+        # Runs on the loop
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters.clear()
+
+    async def _supervise(self) -> None:
+        await asyncio.gather(*(self._work(worker) for worker in self._workers))
+
+    async def _work(self, worker: _WorkerState) -> None:
+        while True:
+            with self._lock:
+                job, stop = self._next_job()
+            if stop:
+                return
+            if job is None:
+                # Nothing can start before another job is queued or a build finished
+                waiter = self._loop.create_future()
+                self._waiters.append(waiter)
+                await waiter
+                continue
+
+            try:
+                await self._run(worker, job)
+            finally:
+                with self._lock:
+                    self._scheduler.release(job)
+                self._wake()
+
+    async def _run(self, worker: _WorkerState, job: BuildJob) -> None:
+        # Claiming and finishing write to the store and may notify about superseded
+        # builds, which would stall every build on the loop while waiting for the disk
+        started_at = await asyncio.to_thread(self._claim, worker, job)
+        if started_at is None:
+            return
+
+        try:
+            report = await self._handler(job)
+        except Exception as e:
+            report = self._crash_report(job, e)
+        await asyncio.to_thread(self._finish, worker, job, started_at, report)
+
+
+def superseded_report(job: BuildJob) -> BuildReport:
+    """Report of a build that was dropped or cancelled in favour of a newer push."""
+    sha = job.superseded_by[:7] if job.superseded_by is not None else "a newer push"
+    return BuildReport(state=BuildStatus.ERROR, description=f"Superseded by {sha}")
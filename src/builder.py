@@ -1,16 +1,61 @@
+import asyncio
+import contextlib
+import hashlib
+import json
 import os
+import resource
 import shutil
+import signal
 import subprocess
-from typing import Tuple
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Callable, Generator, NoReturn, Optional, Tuple
 
-from src.models import BuildReport, BuildStatus
+from src.build_log import BuildLog, StageLogs
+from src.config import ServerConfig
+from src.infra.cache.mirrorCache import GitMirrorCache
+from src.infra.cache.venvCache import VenvCache
+from src.infra.history.durationStore import TestDurationStore
+from src.infra.history.impactStore import TestImpactStore
+from src.models import BuildReport, BuildStatus, StepTiming
+from src.sharding import (
+    JunitSummary,
+    parse_collected_modules,
+    plan_shards,
+    read_junit_reports,
+)
+from src.test_selection import TestSelection, parse_coverage_contexts, select_tests
+
+# Maximum number of bytes read from a build step's output at once
+_READ_SIZE = 64 * 1024
+
+# Seconds between checks whether a running build step should be cancelled
+_CANCEL_POLL_INTERVAL = 0.5
+
+# Interpreter the build's virtual environment is created with
+_PYTHON = "python3.13"
+
+# Coverage settings of test runs that record the files every test executes
+_COVERAGE_RC = """[run]
+data_file = {data_file}
+parallel = True
+relative_files = True
+dynamic_context = test_function
+source = .
+"""
+
+# Bump whenever a change to the build steps can change the outcome of a build, so
+# results recorded under an earlier pipeline are not reused
+PIPELINE_VERSION = 1
 
 
 class BuildError(Exception):
     """Exception raised when a build step fails.
 
     Attributes:
-        log_content: Complete log output from the failed build.
+        log_content: Tail of the log output from the failed build.
     """
 
     def __init__(self, message: str, log_content: str):
@@ -18,138 +63,1190 @@ class BuildError(Exception):
         self.log_content = log_content
 
 
+class BuildCancelled(BuildError):
+    """Exception raised when a build is cancelled while it is running."""
+
+
+class BuildTimeout(BuildError):
+    """Exception raised when a build step or the whole build runs out of time."""
+
+
+@dataclass(frozen=True)
+class BuildOptions:
+    """Optional settings and shared resources used by `build_project`.
+
+    Attributes:
+        mirror_cache: Cache of bare repository mirrors to clone from. If not set,
+            every build clones the repository from its remote.
+        venv_cache: Cache of virtual environments keyed on the project's dependency
+            manifests. If not set, every build creates its venv from scratch.
+        test_shards: Number of pytest processes the tests are split across.
+        test_durations: Durations of the project's test modules in earlier builds,
+            used to balance the shards and updated after every sharded test run.
+        memory_limit_mb: Address space limit of every process of the build in
+            megabytes, so a runaway test suite fails instead of exhausting the host's
+            memory. If not set, the build's processes are not limited.
+        step_timeout: Seconds a single build step may run before it is killed. If not
+            set, steps may run indefinitely.
+        build_timeout: Seconds the whole build may run before its running steps are
+            killed. If not set, the build may run indefinitely.
+        test_impact: Index of the files the project's test modules executed in earlier
+            builds. If set, only the tests affected by the changes since the last
+            commit of the branch whose tests passed are run, under coverage, and the
+            index is updated with the files they executed.
+        full_test_interval: Seconds after which all tests of a branch run again, even
+            if only some are affected. If not set, all tests only run when the
+            changes cannot be mapped to tests.
+    """
+
+    mirror_cache: Optional[GitMirrorCache] = None
+    venv_cache: Optional[VenvCache] = None
+    test_shards: int = 1
+    test_durations: Optional[TestDurationStore] = None
+    memory_limit_mb: Optional[int] = None
+    step_timeout: Optional[float] = None
+    build_timeout: Optional[float] = None
+    test_impact: Optional[TestImpactStore] = None
+    full_test_interval: Optional[float] = None
+
+    @classmethod
+    def from_config(cls, config: ServerConfig) -> "BuildOptions":
+        """Creates the options, and the caches and stores they use, from the config.
+
+        The server and the build agents both build with these options, so a build runs
+        the same wherever it is dispatched to.
+        """
+        return cls(
+            mirror_cache=GitMirrorCache(
+                config.mirror_cache_dir, config.mirror_cache_max_mb * 1024 * 1024
+            )
+            if config.mirror_cache_dir is not None
+            else None,
+            venv_cache=VenvCache(
+                config.venv_cache_dir, config.venv_cache_max_mb * 1024 * 1024
+            )
+            if config.venv_cache_dir is not None
+            else None,
+            test_shards=config.test_shards,
+            test_durations=TestDurationStore(config.history_db)
+            if config.test_shards > 1
+            else None,
+            memory_limit_mb=config.build_memory_mb or None,
+            step_timeout=config.step_timeout or None,
+            build_timeout=config.build_timeout or None,
+            test_impact=TestImpactStore(config.history_db)
+            if config.test_impact
+            else None,
+            full_test_interval=config.full_test_interval_hours * 60 * 60 or None,
+        )
+
+
 def run_command(
-    step_name: str, command: list[str], cwd: str, log: list[str]
-) -> list[str]:
-    """Execute a command and log its output.
+    step_name: str,
+    command: list[str],
+    cwd: str,
+    log: BuildLog,
+    cancel: Optional[threading.Event] = None,
+    ok_exit_codes: Tuple[int, ...] = (0,),
+    memory_limit_mb: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> BuildLog:
+    """Execute a command and stream its output to the build log.
+
+    Standard output and standard error are read from a single pipe, so their relative
+    order is preserved, and are written to the log as they are produced. The command
+    runs in its own process group, so cancelling the step or running out of time kills
+    every process it started.
 
     Args:
         step_name: Name of the build step.
         command: Command and arguments to execute.
         cwd: Working directory for the command.
-        log: Existing log entries to append to.
+        log: Build log to stream this command's output to.
+        cancel: Event that kills the command when set.
+        ok_exit_codes: Exit statuses the step succeeds with.
+        memory_limit_mb: Address space limit of the command and the processes it
+            starts, in megabytes.
+        timeout: Seconds after which the command is killed.
 
     Returns:
-        Updated log with this command's output.
+        The build log.
 
     Raises:
-        BuildError: If the command exits with non-zero status.
+        BuildCancelled: If `cancel` is set before or while the command runs.
+        BuildTimeout: If the command is killed after `timeout` seconds.
+        BuildError: If the command exits with any other status.
     """
-    result = subprocess.run(
+    if cancel is not None and cancel.is_set():
+        raise BuildCancelled(f"{step_name} cancelled", log.tail())
+
+    log.section(step_name)
+    started_at = time.time()
+    start = time.monotonic()
+    process = subprocess.Popen(
         command,
         cwd=cwd,
-        capture_output=True,
-        text=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
         shell=False,
+        start_new_session=True,
+    )
+    if memory_limit_mb is not None:
+        _limit_memory(process.pid, memory_limit_mb)
+    watchdog = (
+        _Watchdog(process.pid, cancel, timeout)
+        if cancel is not None or timeout is not None
+        else None
     )
-    log.append(f"\n---{step_name}---\n{result.stdout}{result.stderr}")
-    if result.returncode != 0:
-        raise BuildError(
-            f"{step_name} failed (exit={result.returncode})", "\n".join(log)
+
+    stdout = process.stdout
+    assert stdout is not None
+    with stdout:
+        while chunk := os.read(stdout.fileno(), _READ_SIZE):
+            log.write(chunk)
+    if watchdog is not None:
+        # Wait for the exit without reaping the child, so the watchdog can still kill
+        # its process group if it hangs after closing its output
+        os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+        watchdog.exited()
+
+    # Reap the child ourselves to get the resource usage of this step alone, which
+    # includes any grandchildren the command waited for
+    _, status, usage = os.wait4(process.pid, 0)
+    returncode = os.waitstatus_to_exitcode(status)
+    process.returncode = returncode
+    log.record_step(
+        StepTiming(
+            name=step_name,
+            started_at=started_at,
+            duration=time.monotonic() - start,
+            cpu_user=usage.ru_utime,
+            cpu_system=usage.ru_stime,
+            max_rss_kb=usage.ru_maxrss,
+            exit_code=returncode,
         )
+    )
+
+    if watchdog is not None and watchdog.timed_out:
+        _raise_timeout(step_name, timeout, log)
+    if cancel is not None and cancel.is_set():
+        log.write(f"\nCancelled {step_name}\n")
+        raise BuildCancelled(f"{step_name} cancelled", log.tail())
+    if returncode not in ok_exit_codes:
+        log.mark_failure()
+        raise BuildError(f"{step_name} failed (exit={returncode})", log.tail())
 
     return log
 
 
-def build_project(
-    repo_url: str, branch: str, commit_id: str
-) -> Tuple[BuildReport, str]:
-    """Build and test a project from a Git repository.
+async def run_command_async(
+    step_name: str,
+    command: list[str],
+    cwd: str,
+    log: BuildLog,
+    cancel: Optional[threading.Event] = None,
+    ok_exit_codes: Tuple[int, ...] = (0,),
+    memory_limit_mb: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> BuildLog:
+    """Event loop variant of `run_command`.
+
+    The command's output is read by the event loop instead of a dedicated thread, so
+    one loop can supervise many concurrently running steps. The step's resource usage
+    is not available from asyncio, only its duration and exit code are recorded.
+
+    Raises:
+        BuildCancelled: If `cancel` is set before or while the command runs.
+        BuildTimeout: If the command is killed after `timeout` seconds.
+        BuildError: If the command exits with a status not in `ok_exit_codes`.
+    """
+    if cancel is not None and cancel.is_set():
+        raise BuildCancelled(f"{step_name} cancelled", log.tail())
+
+    log.section(step_name)
+    started_at = time.time()
+    start = time.monotonic()
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        cwd=cwd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        start_new_session=True,
+    )
+    if memory_limit_mb is not None:
+        _limit_memory(process.pid, memory_limit_mb)
+    watcher = (
+        asyncio.create_task(_watch_async(process, cancel, timeout))
+        if cancel is not None or timeout is not None
+        else None
+    )
+
+    stdout = process.stdout
+    assert stdout is not None
+    try:
+        while chunk := await stdout.read(_READ_SIZE):
+            log.write(chunk)
+        returncode = await process.wait()
+    finally:
+        if watcher is not None and not watcher.done():
+            watcher.cancel()
+
+    log.record_step(
+        StepTiming(
+            name=step_name,
+            started_at=started_at,
+            duration=time.monotonic() - start,
+            exit_code=returncode,
+        )
+    )
+
+    if watcher is not None and watcher.done() and watcher.result():
+        _raise_timeout(step_name, timeout, log)
+    if cancel is not None and cancel.is_set():
+        log.write(f"\nCancelled {step_name}\n")
+        raise BuildCancelled(f"{step_name} cancelled", log.tail())
+    if returncode not in ok_exit_codes:
+        log.mark_failure()
+        raise BuildError(f"{step_name} failed (exit={returncode})", log.tail())
+
+    return log
+
+
+async def _watch_async(
+    process: asyncio.subprocess.Process,
+    cancel: Optional[threading.Event],
+    timeout: Optional[float],
+) -> bool:
+    # Kills the process group once the step is cancelled or runs out of time, and
+    # returns whether it ran out of time
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    while True:
+        if cancel is not None and cancel.is_set():
+            timed_out = False
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            timed_out = True
+            break
+        await asyncio.sleep(_poll_interval(deadline))
+    # Not reaped yet, so the process group id cannot have been reused
+    if process.returncode is None:
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(process.pid, signal.SIGKILL)
+        return timed_out
+    return False
+
+
+def _limit_memory(pid: int, memory_limit_mb: int) -> None:
+    # Set on the running process rather than in a preexec_fn, which is not safe in the
+    # threads builds run in. Processes the command starts later inherit the limit.
+    limit = memory_limit_mb * 1024 * 1024
+    # The process may have already exited
+    with contextlib.suppress(ProcessLookupError):
+        resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
 
-    Clones the repository, checks out the specified commit, creates a virtual
-    environment, installs dependencies, performs syntax checking, and runs tests.
+
+def build_config_hash() -> str:
+    """Returns a hash of the build configuration, used to key cached results."""
+    config = {"pipeline": PIPELINE_VERSION, "python": _PYTHON}
+    encoded = json.dumps(config, sort_keys=True).encode()
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class _Watchdog:
+    """Kills the process group of a step once it is cancelled or runs out of time."""
+
+    def __init__(
+        self, pid: int, cancel: Optional[threading.Event], timeout: Optional[float]
+    ) -> None:
+        self.timed_out = False
+        self._pid = pid
+        self._cancel = cancel
+        self._deadline = time.monotonic() + timeout if timeout is not None else None
+        self._exited = threading.Event()
+        # Held while killing, so the process cannot be reaped in the meantime
+        self._lock = threading.Lock()
+        threading.Thread(
+            target=self._watch, name=f"watchdog-{pid}", daemon=True
+        ).start()
+
+    def exited(self) -> None:
+        """Stops watching, must be called after the process exited but before it is reaped."""
+        with self._lock:
+            self._exited.set()
+
+    def _watch(self) -> None:
+        expired = False
+        while not self._exited.wait(timeout=_poll_interval(self._deadline)):
+            if self._cancel is not None and self._cancel.is_set():
+                break
+            if self._deadline is not None and time.monotonic() >= self._deadline:
+                expired = True
+                break
+        with self._lock:
+            # Not reaped yet, so the process group id cannot have been reused
+            if not self._exited.is_set():
+                self.timed_out = expired
+                with contextlib.suppress(ProcessLookupError):
+                    os.killpg(self._pid, signal.SIGKILL)
+
+
+def _poll_interval(deadline: Optional[float]) -> float:
+    if deadline is None:
+        return _CANCEL_POLL_INTERVAL
+    return max(min(_CANCEL_POLL_INTERVAL, deadline - time.monotonic()), 0.0)
+
+
+def _raise_timeout(step_name: str, timeout: Optional[float], log: BuildLog) -> NoReturn:
+    assert timeout is not None
+    log.mark_failure()
+    log.write(f"\n{step_name} timed out after {timeout:g} seconds\n")
+    raise BuildTimeout(f"{step_name} timed out after {timeout:g}s", log.tail())
+
+
+@dataclass(frozen=True)
+class BuildStep:
+    """A command run as one step of a build.
+
+    Attributes:
+        name: Name of the build step, used as the section header in the log.
+        command: Command and arguments to execute.
+        cwd: Working directory for the command.
+        ok_exit_codes: Exit statuses the step succeeds with.
+    """
+
+    name: str
+    command: list[str]
+    cwd: str
+    ok_exit_codes: Tuple[int, ...] = (0,)
+
+
+@dataclass(frozen=True)
+class BuildStage:
+    """Build steps that run in order, concurrently with stages they do not depend on.
+
+    Attributes:
+        name: Name of the stage, referred to by the `needs` of other stages.
+        steps: Called with the log the stage writes to when the stage starts, yields
+            the stage's steps. Work that does not run a command, such as restoring a
+            cached venv, is done between steps. The runner asks for the next step only
+            once the previous one succeeded and closes the generator if a step fails,
+            which releases any cache locks held by the stage.
+        needs: Names of the stages that must succeed before this one starts, which
+            must be declared before it.
+    """
+
+    name: str
+    steps: Callable[[BuildLog], Generator[BuildStep, None, None]]
+    needs: Tuple[str, ...] = ()
+
+
+def build_stages(
+    repo_url: str,
+    branch: str,
+    commit_id: str,
+    work_dir: str,
+    options: BuildOptions,
+) -> list[BuildStage]:
+    """Returns the stages that build and test a project.
+
+    Checking out the project and creating its venv run concurrently, unless the venv is
+    restored from the cache, whose key depends on the checked out dependency manifests.
+    Every later stage needs the one before it, so the tests only run once the project
+    installed and compiled. With `options.test_shards` above one, the tests are split
+    across that many concurrently running pytest processes. With `options.test_impact`,
+    only the tests affected by the build's changes run, see `_TestImpact`.
 
     Args:
         repo_url: HTTPS URL of the Git repository.
         branch: Branch name to checkout.
         commit_id: Full commit SHA to build.
-
-    Returns:
-        BuildReport with build status (SUCCESS, FAILURE, or ERROR).
-        str with all build logs
+        work_dir: Empty directory to check out and build the project in.
+        options: Build settings.
     """
-    report = BuildReport(state=BuildStatus.PENDING)
-    print(f"[LOG] Start processing commit {commit_id} on {branch}")
-
-    base_dir = os.path.abspath("./temp_builds")
-    work_dir = os.path.join(base_dir, commit_id)
-    os.makedirs(work_dir, exist_ok=True)
-
     repo_dir = os.path.join(work_dir, "repo")
     venv_dir = os.path.join(work_dir, "venv")
     venv_python = os.path.join(venv_dir, "bin", "python")
     venv_pip = os.path.join(venv_dir, "bin", "pip")
     venv_pytest = os.path.join(venv_dir, "bin", "pytest")
 
-    log: list[str] = []
+    venv_key: Optional[str] = None
+    venv_restored = False
+    impact = (
+        _TestImpact(
+            options.test_impact,
+            repo_url,
+            branch,
+            commit_id,
+            repo_dir,
+            work_dir,
+            venv_dir,
+            options,
+        )
+        if options.test_impact is not None
+        else None
+    )
+
+    def checkout(log: BuildLog) -> Generator[BuildStep, None, None]:
+        if options.mirror_cache is not None:
+            # Hold the mirror lock until the working copy is cloned, so a concurrent
+            # fetch of the same repository cannot change the mirror underneath us
+            with options.mirror_cache.lease(repo_url) as mirror:
+                yield BuildStep(
+                    "Update Mirror", mirror.update_command(repo_url), work_dir
+                )
+                yield BuildStep("Git Clone", mirror.clone_command(repo_dir), work_dir)
+        else:
+            yield BuildStep("Git Clone", ["git", "clone", repo_url, repo_dir], work_dir)
 
-    try:
-        log = run_command(
-            "Git Clone",
-            ["git", "clone", repo_url, repo_dir],
-            cwd=work_dir,
-            log=log,
+        yield BuildStep("Git Checkout Branch", ["git", "checkout", branch], repo_dir)
+        yield BuildStep("Git Checkout Commit", ["git", "checkout", commit_id], repo_dir)
+
+    def setup_venv(log: BuildLog) -> Generator[BuildStep, None, None]:
+        nonlocal venv_key, venv_restored
+        if options.venv_cache is not None:
+            started_at, start = time.time(), time.monotonic()
+            venv_key = options.venv_cache.key_for(repo_dir)
+            venv_restored = options.venv_cache.restore(venv_key, venv_dir)
+            log.section("Restore venv")
+            log.write(
+                f"{'Restored' if venv_restored else 'No cached'} venv for key {venv_key}\n"
+            )
+            log.record_step(
+                StepTiming(
+                    name="Restore venv",
+                    started_at=started_at,
+                    duration=time.monotonic() - start,
+                )
+            )
+
+        if not venv_restored:
+            yield BuildStep("Create venv", [_PYTHON, "-m", "venv", venv_dir], work_dir)
+            yield BuildStep(
+                "Upgrade pip",
+                [venv_python, "-m", "pip", "install", "--upgrade", "pip"],
+                work_dir,
+            )
+
+    def install(log: BuildLog) -> Generator[BuildStep, None, None]:
+        # Coverage records the files the tests execute, when tests are selected by them
+        extra = ["coverage"] if impact is not None else []
+        # Also run on a restored venv, as it only contains the project's dependencies
+        # and the editable install of the project itself must point at this checkout
+        yield BuildStep(
+            "Install requirements",
+            [venv_pip, "install", "-e", ".[dev]", *extra],
+            repo_dir,
         )
 
-        log = run_command(
-            "Git Checkout Branch",
-            ["git", "checkout", branch],
-            cwd=repo_dir,
-            log=log,
+        if (
+            options.venv_cache is not None
+            and venv_key is not None
+            and not venv_restored
+        ):
+            options.venv_cache.store(venv_key, venv_dir)
+
+    def check_syntax(log: BuildLog) -> Generator[BuildStep, None, None]:
+        yield BuildStep(
+            "Syntax Checking", [venv_python, "-m", "compileall", "-q", "."], repo_dir
         )
-        log = run_command(
-            "Git Checkout Commit",
-            ["git", "checkout", commit_id],
-            cwd=repo_dir,
-            log=log,
+
+    def test(log: BuildLog) -> Generator[BuildStep, None, None]:
+        if impact is None:
+            yield BuildStep("Unit Tests", [venv_pytest], repo_dir)
+        elif impact.skipped:
+            log.section("Unit Tests")
+            log.write("No tests are affected by the changes\n")
+        else:
+            command = [venv_pytest, *(impact.modules or [])]
+            yield BuildStep("Unit Tests", impact.wrap(command), repo_dir)
+
+    stages = [
+        BuildStage("Checkout", checkout),
+        BuildStage(
+            "Setup venv",
+            setup_venv,
+            needs=("Checkout",) if options.venv_cache is not None else (),
+        ),
+        BuildStage("Install", install, needs=("Checkout", "Setup venv")),
+        BuildStage("Syntax Checking", check_syntax, needs=("Install",)),
+    ]
+    needs = "Syntax Checking"
+    if impact is not None:
+        stages.append(BuildStage("Select Tests", impact.select, needs=(needs,)))
+        needs = "Select Tests"
+    if options.test_shards > 1:
+        stages += _sharded_test_stages(
+            repo_url, repo_dir, work_dir, venv_pytest, options, needs, impact
+        )
+    else:
+        stages.append(BuildStage("Unit Tests", test, needs=(needs,)))
+    if impact is not None:
+        stages.append(
+            BuildStage("Test Impact", impact.record, needs=(stages[-1].name,))
         )
+    return stages
 
-        log = run_command(
-            "Create venv",
-            ["python3.13", "-m", "venv", venv_dir],
-            cwd=work_dir,
-            log=log,
+
+def _sharded_test_stages(
+    repo_url: str,
+    repo_dir: str,
+    work_dir: str,
+    venv_pytest: str,
+    options: BuildOptions,
+    needs: str,
+    impact: Optional["_TestImpact"] = None,
+) -> list[BuildStage]:
+    """Returns stages that run the tests split across `options.test_shards` processes.
+
+    The test modules are collected and assigned to shards first, balanced by their
+    durations in earlier builds. With `impact`, only the selected modules are sharded.
+    Every shard runs as a stage of its own and writes a JUnit report, which are merged
+    once all shards finished. A shard with failing tests does not stop the other shards,
+    the merged report fails the build instead.
+    """
+    shard_count = options.test_shards
+    junit_paths = [
+        os.path.join(work_dir, f"junit-{i + 1}.xml") for i in range(shard_count)
+    ]
+    # None runs all tests in the first shard, if the modules could not be collected
+    plan: Optional[list[list[str]]] = None
+
+    def plan_tests(log: BuildLog) -> Generator[BuildStep, None, None]:
+        nonlocal plan
+        started_at, start = time.time(), time.monotonic()
+        log.section("Plan Tests")
+        if impact is not None and impact.test_modules:
+            modules = (
+                impact.modules if impact.modules is not None else impact.test_modules
+            )
+        else:
+            modules = _collect_test_modules(venv_pytest, repo_dir, options.step_timeout)
+        if impact is not None and impact.skipped:
+            plan = [[] for _ in range(shard_count)]
+            log.write("No tests are affected by the changes\n")
+        elif modules:
+            durations = (
+                options.test_durations.durations(repo_url)
+                if options.test_durations is not None
+                else {}
+            )
+            plan = plan_shards(modules, durations, shard_count)
+            for i, shard in enumerate(plan):
+                log.write(f"Shard {i + 1}: {len(shard)} test modules\n")
+        else:
+            log.write("Could not collect test modules, running tests unsharded\n")
+        log.record_step(
+            StepTiming(
+                name="Plan Tests",
+                started_at=started_at,
+                duration=time.monotonic() - start,
+            )
         )
-        log = run_command(
-            "Upgrade pip",
-            [venv_python, "-m", "pip", "install", "--upgrade", "pip"],
-            cwd=work_dir,
-            log=log,
+        yield from ()
+
+    def run_shard(index: int) -> Callable[[BuildLog], Generator[BuildStep, None, None]]:
+        def steps(log: BuildLog) -> Generator[BuildStep, None, None]:
+            if plan is None and index > 0 or plan is not None and not plan[index]:
+                return
+            modules = plan[index] if plan is not None else []
+            command = [
+                venv_pytest,
+                "-o",
+                "junit_family=xunit1",
+                f"--junitxml={junit_paths[index]}",
+                *modules,
+            ]
+            yield BuildStep(
+                f"Unit Tests {index + 1}/{shard_count}",
+                impact.wrap(command) if impact is not None else command,
+                repo_dir,
+                # Failing tests are reported once all shards are done
+                ok_exit_codes=(0, 1),
+            )
+
+        return steps
+
+    def report(log: BuildLog) -> Generator[BuildStep, None, None]:
+        started_at, start = time.time(), time.monotonic()
+        summary = read_junit_reports(junit_paths)
+        log.section("Test Report")
+        if summary is None and impact is not None and impact.skipped:
+            summary = JunitSummary()
+        if summary is None:
+            log.mark_failure()
+            raise BuildError("No test report was written", log.tail())
+
+        log.write(
+            f"{summary.tests} tests, {len(summary.failed)} failed, "
+            f"{summary.skipped} skipped\n"
+        )
+        for test in summary.failed:
+            log.write(f"FAILED {test}\n")
+        if options.test_durations is not None:
+            options.test_durations.record(repo_url, summary.durations)
+        log.record_step(
+            StepTiming(
+                name="Test Report",
+                started_at=started_at,
+                duration=time.monotonic() - start,
+            )
         )
+        if summary.failed:
+            log.mark_failure()
+            raise BuildError(f"{len(summary.failed)} tests failed", log.tail())
+        yield from ()
 
-        log = run_command(
-            "Install requirements",
-            [venv_pip, "install", "-e", ".[dev]"],
+    shard_names = tuple(f"Unit Tests {i + 1}" for i in range(shard_count))
+    return [
+        BuildStage("Plan Tests", plan_tests, needs=(needs,)),
+        *(
+            BuildStage(name, run_shard(i), needs=("Plan Tests",))
+            for i, name in enumerate(shard_names)
+        ),
+        BuildStage("Test Report", report, needs=shard_names),
+    ]
+
+
+def _collect_test_modules(
+    venv_pytest: str, repo_dir: str, timeout: Optional[float]
+) -> list[str]:
+    """Returns the project's test modules, or none if they could not be collected."""
+    try:
+        collected = subprocess.run(
+            [venv_pytest, "--collect-only", "-q"],
             cwd=repo_dir,
-            log=log,
+            capture_output=True,
+            text=True,
+            timeout=timeout,
         )
+    except subprocess.TimeoutExpired:
+        return []
+    if collected.returncode != 0:
+        return []
+    return parse_collected_modules(collected.stdout)
 
-        log = run_command(
-            "Syntax Checking",
-            [venv_python, "-m", "compileall", "-q", "."],
-            cwd=repo_dir,
-            log=log,
+
+class _TestImpact:
+    """Selects the tests a build runs from the files they executed in earlier builds.
+
+    The build is diffed against the most recent commit of its branch whose tests passed,
+    and only the test modules affected by the changed files run, see `select_tests`. All
+    tests run when there is no such commit, or when the last run of all tests of the
+    branch is older than `options.full_test_interval`. The tests run under coverage, and
+    once they passed the files every test module executed are recorded in the index.
+    """
+
+    def __init__(
+        self,
+        store: TestImpactStore,
+        repo_url: str,
+        branch: str,
+        commit_id: str,
+        repo_dir: str,
+        work_dir: str,
+        venv_dir: str,
+        options: BuildOptions,
+    ) -> None:
+        self._store = store
+        self._repo_url = repo_url
+        self._branch = branch
+        self._commit_id = commit_id
+        self._repo_dir = repo_dir
+        self._options = options
+        self._venv_python = os.path.join(venv_dir, "bin", "python")
+        self._venv_pytest = os.path.join(venv_dir, "bin", "pytest")
+        self._rcfile = os.path.join(work_dir, "coveragerc")
+        self._data_file = os.path.join(work_dir, ".coverage")
+        self._report = os.path.join(work_dir, "coverage.json")
+        self.test_modules: list[str] = []
+        self.selection: Optional[TestSelection] = None
+
+    @property
+    def modules(self) -> Optional[list[str]]:
+        """The test modules to run, None to run all tests."""
+        return self.selection.modules if self.selection is not None else None
+
+    @property
+    def skipped(self) -> bool:
+        """Whether no test is affected by the changes."""
+        return self.modules == []
+
+    def wrap(self, command: list[str]) -> list[str]:
+        """Runs a pytest command under coverage."""
+        return [
+            self._venv_python,
+            "-m",
+            "coverage",
+            "run",
+            f"--rcfile={self._rcfile}",
+            *command,
+        ]
+
+    def select(self, log: BuildLog) -> Generator[BuildStep, None, None]:
+        started_at, start = time.time(), time.monotonic()
+        log.section("Select Tests")
+        self.test_modules = _collect_test_modules(
+            self._venv_pytest, self._repo_dir, self._options.step_timeout
+        )
+        self.selection = self._select()
+        log.write(f"{self.selection.reason}\n")
+        for module in self.selection.modules or []:
+            log.write(f"  {module}\n")
+        with open(self._rcfile, "w") as f:
+            f.write(_COVERAGE_RC.format(data_file=self._data_file))
+        log.record_step(
+            StepTiming(
+                name="Select Tests",
+                started_at=started_at,
+                duration=time.monotonic() - start,
+            )
         )
+        yield from ()
 
-        log = run_command(
-            "Unit Tests",
-            [venv_pytest],
-            cwd=repo_dir,
-            log=log,
+    def record(self, log: BuildLog) -> Generator[BuildStep, None, None]:
+        if not self.skipped:
+            # Coverage problems must not fail a build whose tests passed
+            yield BuildStep(
+                "Combine Coverage",
+                [
+                    self._venv_python,
+                    "-m",
+                    "coverage",
+                    "combine",
+                    f"--rcfile={self._rcfile}",
+                ],
+                self._repo_dir,
+                ok_exit_codes=(0, 1),
+            )
+            yield BuildStep(
+                "Coverage Report",
+                [
+                    self._venv_python,
+                    "-m",
+                    "coverage",
+                    "json",
+                    f"--rcfile={self._rcfile}",
+                    "--show-contexts",
+                    "-o",
+                    self._report,
+                ],
+                self._repo_dir,
+                ok_exit_codes=(0, 1),
+            )
+
+        started_at, start = time.time(), time.monotonic()
+        log.section("Test Impact")
+        executed: dict[str, set[str]] = {}
+        if not self.skipped:
+            try:
+                with open(self._report) as f:
+                    executed = parse_coverage_contexts(json.load(f), self.test_modules)
+            except (OSError, ValueError):
+                log.write("No coverage was recorded\n")
+        full_run = self.modules is None
+        self._store.record(
+            self._repo_url, executed, replace_all=full_run and bool(executed)
+        )
+        self._store.record_commit(
+            self._repo_url, self._branch, self._commit_id, full_run
+        )
+        log.write(f"Recorded the files executed by {len(executed)} test modules\n")
+        log.record_step(
+            StepTiming(
+                name="Test Impact",
+                started_at=started_at,
+                duration=time.monotonic() - start,
+            )
         )
 
+    def _select(self) -> TestSelection:
+        if not self.test_modules:
+            return TestSelection(
+                None, "Could not collect test modules, running all tests"
+            )
+        interval = self._options.full_test_interval
+        if interval is not None:
+            last_full_run = self._store.last_full_run(self._repo_url, self._branch)
+            if last_full_run is None or time.time() - last_full_run >= interval:
+                return TestSelection(
+                    None,
+                    f"All tests of {self._branch} did not run in the last "
+                    f"{interval / 3600:g} hours, running all tests",
+                )
+
+        base = self._base_commit()
+        if base is None:
+            return TestSelection(
+                None,
+                f"No earlier commit of {self._branch} passed its tests, running all tests",
+            )
+        diff = self._git("diff", "--name-only", "-z", base, "HEAD")
+        if diff is None:
+            return TestSelection(
+                None, f"Could not diff against {base[:7]}, running all tests"
+            )
+        changed = [path for path in diff.split("\0") if path]
+        selection = select_tests(
+            changed, self._store.impact(self._repo_url), self.test_modules
+        )
+        return replace(selection, reason=f"Since {base[:7]}: {selection.reason}")
+
+    def _base_commit(self) -> Optional[str]:
+        # The most recent commit whose tests passed that this commit descends from
+        for sha in self._store.passed_commits(self._repo_url, self._branch):
+            if sha == self._commit_id:
+                # Building a commit again runs its tests again
+                continue
+            if self._git("merge-base", "--is-ancestor", sha, "HEAD") is not None:
+                return sha
+        return None
+
+    def _git(self, *args: str) -> Optional[str]:
+        # Returns the output of a git command, or None if it failed
+        try:
+            result = subprocess.run(
+                ["git", *args],
+                cwd=self._repo_dir,
+                capture_output=True,
+                text=True,
+                timeout=self._options.step_timeout,
+            )
+        except subprocess.TimeoutExpired:
+            return None
+        return result.stdout if result.returncode == 0 else None
+
+
+class _StageScheduler:
+    """Tracks which stages of a build can start, shared by the thread and event loop runners.
+
+    Not thread-safe, the runners serialise calls to it.
+    """
+
+    def __init__(self, stages: list[BuildStage], log: BuildLog) -> None:
+        declared: set[str] = set()
+        for stage in stages:
+            undeclared = [name for name in stage.needs if name not in declared]
+            if undeclared:
+                raise ValueError(
+                    f"Stage {stage.name} needs stages declared after it: {undeclared}"
+                )
+            declared.add(stage.name)
+
+        self.logs = StageLogs(log, [stage.name for stage in stages])
+        self.error: Optional[Exception] = None
+        self._pending = list(stages)
+        self._running: set[str] = set()
+        self._succeeded: set[str] = set()
+
+    def ready(self) -> list[BuildStage]:
+        """Returns the stages that can start now and marks them as running."""
+        if self.error is not None:
+            return []
+        ready = [
+            stage
+            for stage in self._pending
+            if all(name in self._succeeded for name in stage.needs)
+        ]
+        for stage in ready:
+            self._pending.remove(stage)
+            self._running.add(stage.name)
+        return ready
+
+    def finish(self, stage: BuildStage, error: Optional[Exception]) -> None:
+        self._running.discard(stage.name)
+        self.logs.finish(stage.name)
+        if error is None:
+            self._succeeded.add(stage.name)
+        elif self.error is None:
+            # Later errors are usually steps killed because of this one
+            self.error = error
+
+    def done(self) -> bool:
+        return not self._running and (self.error is not None or not self._pending)
+
+
+class _Deadline:
+    """Time limit of the stages of a build."""
+
+    def __init__(self, timeout: Optional[float]) -> None:
+        self.timeout = timeout
+        self.expired = False
+        self._at = time.monotonic() + timeout if timeout is not None else None
+
+    def check(self, scheduler: _StageScheduler) -> bool:
+        # Returns True once, when the stages ran out of time before they were done
+        if self.expired or self._at is None or time.monotonic() < self._at:
+            return False
+        if scheduler.error is not None or scheduler.done():
+            return False
+        self.expired = True
+        return True
+
+    def raise_if_expired(self, log: BuildLog) -> None:
+        if self.expired:
+            _raise_timeout("Build", self.timeout, log)
+
+
+def run_stages(
+    stages: list[BuildStage],
+    log: BuildLog,
+    cancel: Optional[threading.Event] = None,
+    memory_limit_mb: Optional[int] = None,
+    step_timeout: Optional[float] = None,
+    timeout: Optional[float] = None,
+) -> None:
+    """Run build stages, each in its own thread as soon as the stages it needs succeeded.
+
+    The output of every stage is presented in the order the stages are declared, see
+    `StageLogs`. Once a step fails, or the stages run out of time, the steps running in
+    other stages are killed and no further stages are started.
+
+    Args:
+        stages: Stages of the build.
+        log: Build log to write the output of all stages to.
+        cancel: Event that kills the running steps when set.
+        memory_limit_mb: Address space limit of the processes of every step.
+        step_timeout: Seconds after which a single step is killed.
+        timeout: Seconds after which all running steps are killed.
+
+    Raises:
+        BuildCancelled: If `cancel` is set before or while the stages run.
+        BuildTimeout: If the stages or one of their steps run out of time.
+        BuildError: If a step fails, the first failure is raised.
+    """
+    deadline = _Deadline(timeout)
+    scheduler = _StageScheduler(stages, log)
+    # Set when the build is cancelled or a step failed, killing the running steps
+    stop = threading.Event()
+    changed = threading.Condition()
+
+    def run(stage: BuildStage) -> None:
+        stage_log = scheduler.logs.open(stage.name)
+        error: Optional[Exception] = None
+        try:
+            steps = stage.steps(stage_log)
+            with contextlib.closing(steps):
+                for step in steps:
+                    run_command(
+                        step.name,
+                        step.command,
+                        cwd=step.cwd,
+                        log=stage_log,
+                        cancel=stop,
+                        ok_exit_codes=step.ok_exit_codes,
+                        memory_limit_mb=memory_limit_mb,
+                        timeout=step_timeout,
+                    )
+        except Exception as e:
+            error = e
+        with changed:
+            scheduler.finish(stage, error)
+            if error is not None:
+                stop.set()
+            changed.notify_all()
+
+    try:
+        with changed:
+            while True:
+                if cancel is not None and cancel.is_set():
+                    stop.set()
+                if deadline.check(scheduler):
+                    stop.set()
+                for stage in scheduler.ready():
+                    threading.Thread(
+                        target=run,
+                        args=(stage,),
+                        name=f"stage-{stage.name}",
+                        daemon=True,
+                    ).start()
+                if scheduler.done():
+                    break
+                changed.wait(timeout=_CANCEL_POLL_INTERVAL)
+    finally:
+        scheduler.logs.close()
+
+    deadline.raise_if_expired(log)
+    if scheduler.error is not None:
+        raise scheduler.error
+
+
+async def run_stages_async(
+    stages: list[BuildStage],
+    log: BuildLog,
+    cancel: Optional[threading.Event] = None,
+    memory_limit_mb: Optional[int] = None,
+    step_timeout: Optional[float] = None,
+    timeout: Optional[float] = None,
+) -> None:
+    """Event loop variant of `run_stages`.
+
+    Every stage runs as a task with `run_command_async`, while the blocking work
+    between steps runs in a worker thread.
+    """
+    deadline = _Deadline(timeout)
+    scheduler = _StageScheduler(stages, log)
+    stop = threading.Event()
+
+    async def run(stage: BuildStage) -> None:
+        stage_log = scheduler.logs.open(stage.name)
+        error: Optional[Exception] = None
+        try:
+            steps = stage.steps(stage_log)
+            try:
+                while (step := await asyncio.to_thread(next, steps, None)) is not None:
+                    await run_command_async(
+                        step.name,
+                        step.command,
+                        cwd=step.cwd,
+                        log=stage_log,
+                        cancel=stop,
+                        ok_exit_codes=step.ok_exit_codes,
+                        memory_limit_mb=memory_limit_mb,
+                        timeout=step_timeout,
+                    )
+            finally:
+                await asyncio.to_thread(steps.close)
+        except Exception as e:
+            error = e
+        scheduler.finish(stage, error)
+        if error is not None:
+            stop.set()
+
+    running: set[asyncio.Task[None]] = set()
+    try:
+        while True:
+            if cancel is not None and cancel.is_set():
+                stop.set()
+            if deadline.check(scheduler):
+                stop.set()
+            running.update(
+                asyncio.create_task(run(stage)) for stage in scheduler.ready()
+            )
+            if scheduler.done():
+                break
+            _, running = await asyncio.wait(
+                running,
+                timeout=_CANCEL_POLL_INTERVAL,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+    finally:
+        scheduler.logs.close()
+
+    deadline.raise_if_expired(log)
+    if scheduler.error is not None:
+        raise scheduler.error
+
+
+def build_project(
+    repo_url: str,
+    branch: str,
+    commit_id: str,
+    options: Optional[BuildOptions] = None,
+    log: Optional[BuildLog] = None,
+    cancel: Optional[threading.Event] = None,
+) -> Tuple[BuildReport, BuildLog]:
+    """Build and test a project from a Git repository.
+
+    Clones the repository, checks out the specified commit, creates a virtual
+    environment, installs dependencies, performs syntax checking, and runs tests.
+    Independent stages of the build run concurrently, see `build_stages`.
+
+    Args:
+        repo_url: HTTPS URL of the Git repository.
+        branch: Branch name to checkout.
+        commit_id: Full commit SHA to build.
+        options: Optional build settings, defaults to `BuildOptions()`.
+        log: Log to stream the build output to, defaults to a temporary log.
+        cancel: Event that stops the build when set, killing the running step.
+
+    Returns:
+        BuildReport with build status (SUCCESS, FAILURE, or ERROR). Cancelled builds
+        and builds that ran out of time, see `BuildOptions`, are reported as ERROR.
+        BuildLog with all build output, closed once the build is done. The caller is
+        responsible for discarding it.
+    """
+    options = options if options is not None else BuildOptions()
+    print(f"[LOG] Start processing commit {commit_id} on {branch}")
+    work_dir = _create_work_dir(commit_id)
+    log = log if log is not None else BuildLog.temporary()
+
+    try:
+        run_stages(
+            build_stages(repo_url, branch, commit_id, work_dir, options),
+            log,
+            cancel,
+            memory_limit_mb=options.memory_limit_mb,
+            step_timeout=options.step_timeout,
+            timeout=options.build_timeout,
+        )
         report = BuildReport(state=BuildStatus.SUCCESS, description="Build succeeded")
+    except Exception as e:
+        report = _error_report(e, log)
+    finally:
+        log.close()
+        # Killed steps can leave behind files the build could not clean up, which
+        # must not turn the build's report into a crash
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return report, log
+
 
-    except BuildError as e:
-        report = BuildReport(state=BuildStatus.FAILURE, description="Build failed")
-        print(f"Build error: {e}")
+async def build_project_async(
+    repo_url: str,
+    branch: str,
+    commit_id: str,
+    options: Optional[BuildOptions] = None,
+    log: Optional[BuildLog] = None,
+    cancel: Optional[threading.Event] = None,
+) -> Tuple[BuildReport, BuildLog]:
+    """Event loop variant of `build_project`.
 
+    Build stages are supervised by the event loop with `run_stages_async`. Takes the
+    same arguments and returns the same results as `build_project`.
+    """
+    options = options if options is not None else BuildOptions()
+    print(f"[LOG] Start processing commit {commit_id} on {branch}")
+    work_dir = await asyncio.to_thread(_create_work_dir, commit_id)
+    log = log if log is not None else BuildLog.temporary()
+
+    try:
+        stages = build_stages(repo_url, branch, commit_id, work_dir, options)
+        await run_stages_async(
+            stages,
+            log,
+            cancel,
+            memory_limit_mb=options.memory_limit_mb,
+            step_timeout=options.step_timeout,
+            timeout=options.build_timeout,
+        )
+        report = BuildReport(state=BuildStatus.SUCCESS, description="Build succeeded")
     except Exception as e:
-        report = BuildReport(BuildStatus.ERROR, description="System error during build")
-        print(f"System error: {str(e)}")
-        log.append(f"\nSystem Error: {str(e)}")
+        report = _error_report(e, log)
     finally:
-        if os.path.exists(work_dir):
-            shutil.rmtree(work_dir)
+        log.close()
+        await asyncio.to_thread(shutil.rmtree, work_dir, True)
+
+    return report, log
+
+
+def _create_work_dir(commit_id: str) -> str:
+    base_dir = os.path.abspath("./temp_builds")
+    os.makedirs(base_dir, exist_ok=True)
+    # Unique per build, so concurrent builds of the same commit do not share a checkout
+    return tempfile.mkdtemp(prefix=f"{commit_id[:12]}-", dir=base_dir)
+
+
+def _error_report(error: Exception, log: BuildLog) -> BuildReport:
+    if isinstance(error, BuildTimeout):
+        print(f"Build timed out: {error}")
+        return BuildReport(state=BuildStatus.ERROR, description=str(error))
+    if isinstance(error, BuildCancelled):
+        print(f"Build cancelled: {error}")
+        return BuildReport(state=BuildStatus.ERROR, description="Build cancelled")
+    if isinstance(error, BuildError):
+        print(f"Build error: {error}")
+        return BuildReport(state=BuildStatus.FAILURE, description="Build failed")
 
-    return report, "\n".join(log)
+    print(f"System error: {str(error)}")
+    log.write(f"\nSystem Error: {str(error)}")
+    return BuildReport(BuildStatus.ERROR, description="System error during build")
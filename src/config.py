@@ -0,0 +1,308 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+from dotenv import dotenv_values
+
+
+@dataclass(frozen=True)
+class ServerConfig:
+    """
+    Runtime configuration of the CI server.
+
+    Attributes:
+        build_workers (int): Number of worker threads draining the build queue.
+        mirror_cache_dir (Optional[str]): Directory of the shared git mirror cache, or None
+            to clone every build from the remote.
+        mirror_cache_max_mb (int): Disk budget of the git mirror cache in megabytes.
+        venv_cache_dir (Optional[str]): Directory of the virtualenv cache, or None to create
+            every build's venv from scratch.
+        venv_cache_max_mb (int): Disk budget of the virtualenv cache in megabytes.
+        history_db (str): Path of the SQLite database indexing the build history.
+        coalesce_builds (bool): Drop queued builds of a branch once a newer push to the
+            same branch is queued.
+        cancel_superseded_builds (bool): Also terminate the running build of a branch
+            when a newer push to the same branch is queued.
+        reuse_build_results (bool): Report the stored result of an earlier build of the
+            same commit and build configuration instead of building it again.
+        public_url (Optional[str]): Base URL the server is reachable at, used to link
+            commit statuses to build logs.
+        http_pool_size (int): Maximum number of keep-alive connections to the GitHub API.
+        async_builds (bool): Supervise builds on a single event loop instead of a thread
+            per build, `build_workers` then limits the number of concurrent builds.
+        test_shards (int): Number of pytest processes every build's tests are split
+            across, balanced by the durations of the test modules in earlier builds.
+        agent_token (Optional[str]): Shared secret of the build agents. When set, builds
+            are dispatched to build agents instead of running on the server itself.
+        agent_timeout (int): Seconds without a heartbeat after which a build agent is
+            considered dead and its builds are queued again.
+        build_cpus (int): CPU cores reserved by every build running on the server, builds
+            only start while the host has enough cores left. 0 to not account for cores.
+        build_memory_mb (int): Memory reserved by every build running on the server in
+            megabytes, which also limits the address space of each of its processes. 0
+            to neither reserve nor limit memory.
+        max_builds_per_repo (int): Concurrent builds of a repository, 0 for no cap.
+        max_builds_per_installation (int): Concurrent builds of the repositories of a
+            GitHub App installation, 0 for no cap.
+        step_timeout (int): Seconds a build step may run before it is killed, 0 for no
+            limit.
+        build_timeout (int): Seconds a build may run before its running steps are
+            killed, 0 for no limit.
+        webhook_secret (Optional[str]): Secret GitHub signs webhook deliveries with. When
+            set, deliveries without a valid `X-Hub-Signature-256` are rejected.
+        max_webhook_kb (int): Largest webhook body accepted, in kilobytes.
+        max_queued_builds (int): Builds waiting in the queue before further webhooks are
+            answered with 503, 0 for no limit.
+        max_queued_builds_per_repo (int): Builds of a repository waiting in the queue
+            before its further webhooks are answered with 429, 0 for no limit.
+        delivery_journal (Optional[str]): Path of the journal of accepted webhook
+            deliveries, used to ignore redeliveries and to resume unfinished builds after
+            a restart, or None to not keep one.
+        delivery_ttl_hours (int): Hours a delivery is remembered in the journal.
+        queue_db (Optional[str]): Path of the SQLite database recording the queued and
+            running builds, which are resumed after a restart, or None to not keep one.
+        build_attempts (int): Times a build is started before it is reported as an
+            error when a restart interrupted it, 1 to never re-run interrupted builds.
+        priority_classes (str): Priority classes of builds, highest first, written as
+            `name=pattern,pattern;name=pattern` with `[repo:]ref` patterns, where the ref
+            "@default" stands for the repository's default branch. Empty to build in the
+            order builds were queued.
+        priority_aging (int): Seconds a queued build waits before it is promoted by one
+            priority class, 0 to never promote builds.
+        test_impact (bool): Only run the tests affected by the changes since the last
+            commit of the branch whose tests passed, using the files the tests executed
+            in earlier builds, recorded in `history_db`.
+        full_test_interval_hours (int): Hours after which all tests of a branch run
+            again when `test_impact` is set, 0 to only run all tests when the changes
+            cannot be mapped to tests.
+    """
+
+    build_workers: int = 2
+    mirror_cache_dir: Optional[str] = "cache/mirrors"
+    mirror_cache_max_mb: int = 10 * 1024
+    venv_cache_dir: Optional[str] = "cache/venvs"
+    venv_cache_max_mb: int = 5 * 1024
+    history_db: str = "history.sqlite3"
+    coalesce_builds: bool = True
+    cancel_superseded_builds: bool = False
+    reuse_build_results: bool = True
+    public_url: Optional[str] = None
+    http_pool_size: int = 10
+    async_builds: bool = False
+    test_shards: int = 1
+    agent_token: Optional[str] = field(default=None, repr=False)
+    agent_timeout: int = 30
+    build_cpus: int = 1
+    build_memory_mb: int = 0
+    max_builds_per_repo: int = 0
+    max_builds_per_installation: int = 0
+    step_timeout: int = 30 * 60
+    build_timeout: int = 60 * 60
+    webhook_secret: Optional[str] = field(default=None, repr=False)
+    max_webhook_kb: int = 5 * 1024
+    max_queued_builds: int = 100
+    max_queued_builds_per_repo: int = 0
+    delivery_journal: Optional[str] = "deliveries.jsonl"
+    delivery_ttl_hours: int = 72
+    queue_db: Optional[str] = "queue.sqlite3"
+    build_attempts: int = 2
+    priority_classes: str = "main=@default,refs/tags/*"
+    priority_aging: int = 10 * 60
+    test_impact: bool = False
+    full_test_interval_hours: int = 24
+
+
+def load_server_config(path: str = ".env") -> ServerConfig:
+    """
+    Creates a ServerConfig from the environment file, falling back to defaults
+    for values that are not set.
+
+    Read the environment variables from a `.env` file
+    - BUILD_WORKERS
+    - MIRROR_CACHE_DIR (set to an empty value to disable the cache)
+    - MIRROR_CACHE_MAX_MB
+    - VENV_CACHE_DIR (set to an empty value to disable the cache)
+    - VENV_CACHE_MAX_MB
+    - HISTORY_DB
+    - COALESCE_BUILDS
+    - CANCEL_SUPERSEDED_BUILDS
+    - REUSE_BUILD_RESULTS
+    - PUBLIC_URL
+    - HTTP_POOL_SIZE
+    - ASYNC_BUILDS
+    - TEST_SHARDS
+    - AGENT_TOKEN
+    - AGENT_TIMEOUT
+    - BUILD_CPUS
+    - BUILD_MEMORY_MB
+    - MAX_BUILDS_PER_REPO
+    - MAX_BUILDS_PER_INSTALLATION
+    - STEP_TIMEOUT
+    - BUILD_TIMEOUT
+    - WEBHOOK_SECRET
+    - MAX_WEBHOOK_KB
+    - MAX_QUEUED_BUILDS
+    - MAX_QUEUED_BUILDS_PER_REPO
+    - DELIVERY_JOURNAL (set to an empty value to disable the journal)
+    - DELIVERY_TTL_HOURS
+    - QUEUE_DB (set to an empty value to disable the record of queued builds)
+    - BUILD_ATTEMPTS
+    - PRIORITY_CLASSES (set to an empty value to disable priority classes)
+    - PRIORITY_AGING
+    - TEST_IMPACT
+    - FULL_TEST_INTERVAL_HOURS
+
+    Raises a ValueError if a value is present but malformed.
+    """
+
+    environment = dotenv_values(path)
+    defaults = ServerConfig()
+
+    build_workers = _parse_int(environment.get("BUILD_WORKERS"), defaults.build_workers)
+    if build_workers < 1:
+        raise ValueError("BUILD_WORKERS must be at least 1.")
+
+    http_pool_size = _parse_int(
+        environment.get("HTTP_POOL_SIZE"), defaults.http_pool_size
+    )
+    if http_pool_size < 1:
+        raise ValueError("HTTP_POOL_SIZE must be at least 1.")
+
+    test_shards = _parse_int(environment.get("TEST_SHARDS"), defaults.test_shards)
+    if test_shards < 1:
+        raise ValueError("TEST_SHARDS must be at least 1.")
+
+    agent_timeout = _parse_int(environment.get("AGENT_TIMEOUT"), defaults.agent_timeout)
+    if agent_timeout < 1:
+        raise ValueError("AGENT_TIMEOUT must be at least 1.")
+
+    build_cpus = _parse_int(environment.get("BUILD_CPUS"), defaults.build_cpus)
+    build_memory_mb = _parse_int(
+        environment.get("BUILD_MEMORY_MB"), defaults.build_memory_mb
+    )
+    max_builds_per_repo = _parse_int(
+        environment.get("MAX_BUILDS_PER_REPO"), defaults.max_builds_per_repo
+    )
+    max_builds_per_installation = _parse_int(
+        environment.get("MAX_BUILDS_PER_INSTALLATION"),
+        defaults.max_builds_per_installation,
+    )
+    step_timeout = _parse_int(environment.get("STEP_TIMEOUT"), defaults.step_timeout)
+    build_timeout = _parse_int(environment.get("BUILD_TIMEOUT"), defaults.build_timeout)
+    max_webhook_kb = _parse_int(
+        environment.get("MAX_WEBHOOK_KB"), defaults.max_webhook_kb
+    )
+    if max_webhook_kb < 1:
+        raise ValueError("MAX_WEBHOOK_KB must be at least 1.")
+    delivery_ttl_hours = _parse_int(
+        environment.get("DELIVERY_TTL_HOURS"), defaults.delivery_ttl_hours
+    )
+    if delivery_ttl_hours < 1:
+        raise ValueError("DELIVERY_TTL_HOURS must be at least 1.")
+    build_attempts = _parse_int(
+        environment.get("BUILD_ATTEMPTS"), defaults.build_attempts
+    )
+    if build_attempts < 1:
+        raise ValueError("BUILD_ATTEMPTS must be at least 1.")
+    priority_aging = _parse_int(
+        environment.get("PRIORITY_AGING"), defaults.priority_aging
+    )
+    full_test_interval_hours = _parse_int(
+        environment.get("FULL_TEST_INTERVAL_HOURS"), defaults.full_test_interval_hours
+    )
+    max_queued_builds = _parse_int(
+        environment.get("MAX_QUEUED_BUILDS"), defaults.max_queued_builds
+    )
+    max_queued_builds_per_repo = _parse_int(
+        environment.get("MAX_QUEUED_BUILDS_PER_REPO"),
+        defaults.max_queued_builds_per_repo,
+    )
+    for name, value in [
+        ("BUILD_CPUS", build_cpus),
+        ("BUILD_MEMORY_MB", build_memory_mb),
+        ("MAX_BUILDS_PER_REPO", max_builds_per_repo),
+        ("MAX_BUILDS_PER_INSTALLATION", max_builds_per_installation),
+        ("STEP_TIMEOUT", step_timeout),
+        ("BUILD_TIMEOUT", build_timeout),
+        ("MAX_QUEUED_BUILDS", max_queued_builds),
+        ("MAX_QUEUED_BUILDS_PER_REPO", max_queued_builds_per_repo),
+        ("PRIORITY_AGING", priority_aging),
+        ("FULL_TEST_INTERVAL_HOURS", full_test_interval_hours),
+    ]:
+        if value < 0:
+            raise ValueError(f"{name} must not be negative.")
+
+    mirror_cache_dir = environment.get("MIRROR_CACHE_DIR", defaults.mirror_cache_dir)
+    mirror_cache_max_mb = _parse_int(
+        environment.get("MIRROR_CACHE_MAX_MB"), defaults.mirror_cache_max_mb
+    )
+    venv_cache_dir = environment.get("VENV_CACHE_DIR", defaults.venv_cache_dir)
+    venv_cache_max_mb = _parse_int(
+        environment.get("VENV_CACHE_MAX_MB"), defaults.venv_cache_max_mb
+    )
+
+    return ServerConfig(
+        build_workers=build_workers,
+        mirror_cache_dir=mirror_cache_dir or None,
+        mirror_cache_max_mb=mirror_cache_max_mb,
+        venv_cache_dir=venv_cache_dir or None,
+        venv_cache_max_mb=venv_cache_max_mb,
+        history_db=environment.get("HISTORY_DB") or defaults.history_db,
+        coalesce_builds=_parse_bool(
+            environment.get("COALESCE_BUILDS"), defaults.coalesce_builds
+        ),
+        cancel_superseded_builds=_parse_bool(
+            environment.get("CANCEL_SUPERSEDED_BUILDS"),
+            defaults.cancel_superseded_builds,
+        ),
+        reuse_build_results=_parse_bool(
+            environment.get("REUSE_BUILD_RESULTS"), defaults.reuse_build_results
+        ),
+        public_url=(environment.get("PUBLIC_URL") or "").rstrip("/") or None,
+        http_pool_size=http_pool_size,
+        async_builds=_parse_bool(
+            environment.get("ASYNC_BUILDS"), defaults.async_builds
+        ),
+        test_shards=test_shards,
+        agent_token=environment.get("AGENT_TOKEN") or None,
+        agent_timeout=agent_timeout,
+        build_cpus=build_cpus,
+        build_memory_mb=build_memory_mb,
+        max_builds_per_repo=max_builds_per_repo,
+        max_builds_per_installation=max_builds_per_installation,
+        step_timeout=step_timeout,
+        build_timeout=build_timeout,
+        webhook_secret=environment.get("WEBHOOK_SECRET") or None,
+        max_webhook_kb=max_webhook_kb,
+        max_queued_builds=max_queued_builds,
+        max_queued_builds_per_repo=max_queued_builds_per_repo,
+        delivery_journal=environment.get("DELIVERY_JOURNAL", defaults.delivery_journal)
+        or None,
+        delivery_ttl_hours=delivery_ttl_hours,
+        queue_db=environment.get("QUEUE_DB", defaults.queue_db) or None,
+        build_attempts=build_attempts,
+        priority_classes=environment.get("PRIORITY_CLASSES", defaults.priority_classes)
+        or "",
+        priority_aging=priority_aging,
+        test_impact=_parse_bool(environment.get("TEST_IMPACT"), defaults.test_impact),
+        full_test_interval_hours=full_test_interval_hours,
+    )
+
+
+def _parse_int(value: str | None, default: int) -> int:
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return int(value)
+    except ValueError as e:
+        raise ValueError(f"Expected an integer, got '{value}'") from e
+
+
+def _parse_bool(value: str | None, default: bool) -> bool:
+    if value is None or value.strip() == "":
+        return default
+    normalized = value.strip().lower()
+    if normalized in ("1", "true", "yes", "on"):
+        return True
+    if normalized in ("0", "false", "no", "off"):
+        return False
+    raise ValueError(f"Expected a boolean, got '{value}'")
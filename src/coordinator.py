@@ -0,0 +1,378 @@
+import base64
+import binascii
+import hmac
+import itertools
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field, replace
+from functools import wraps
+from typing import Any, Callable, Optional, ParamSpec, Tuple
+
+from flask import Blueprint, Response, jsonify, request
+
+from src.build_log import BuildLog
+from src.build_queue import BuildJob
+from src.models import BuildReport, BuildStatus, StepTiming
+
+FlaskResponse = Tuple[Response, int]
+P = ParamSpec("P")
+
+# Seconds between checks whether a dispatched build was cancelled or its agent died
+_POLL_INTERVAL = 0.5
+
+
+@dataclass
+class AgentInfo:
+    """
+    A build agent registered with the coordinator.
+
+    Attributes:
+        id (str): Identifier assigned by the coordinator.
+        name (str): Name the agent registered with, e.g. its hostname.
+        cores (int): Number of CPU cores of the agent's machine.
+        memory_mb (int): Memory of the agent's machine in megabytes.
+        slots (int): Number of builds the agent runs at once.
+        last_seen (float): Monotonic time of the agent's last request.
+        builds (list[str]): Ids of the builds the agent is running.
+    """
+
+    id: str
+    name: str
+    cores: int
+    memory_mb: int
+    slots: int
+    last_seen: float
+    builds: list[str] = field(default_factory=list)
+
+
+@dataclass
+class _RemoteBuild:
+    job: BuildJob
+    log: BuildLog
+    agent_id: Optional[str] = None
+    attempts: int = 0
+    # Size of the log when the current attempt started, agent offsets are relative to it
+    log_offset: int = 0
+    cancel_sent: bool = False
+    report: Optional[BuildReport] = None
+
+
+class AgentPool:
+    """
+    Dispatches builds to a fleet of build agents.
+
+    Agents pull work: an agent asks for a build whenever it has a free slot, so queued
+    builds go to whichever agent frees up first and a busy agent never holds on to
+    builds another agent could run. Agents report their running builds with regular
+    heartbeats. An agent that misses heartbeats for `agent_timeout` seconds is
+    considered dead, and its builds are queued again at the front of the queue, up to
+    `max_attempts` times per build.
+
+    `run` is used as the build handler of the coordinator's build queue. It blocks until
+    an agent finished the build, streaming the agent's output to the build's log.
+
+    Args:
+        agent_timeout: Seconds without a heartbeat after which an agent is dead.
+        max_attempts: Number of agents a build is dispatched to before it errors.
+        clock: Monotonic time source, for tests.
+    """
+
+    def __init__(
+        self,
+        agent_timeout: float = 30.0,
+        max_attempts: int = 3,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.agent_timeout = agent_timeout
+        self._max_attempts = max_attempts
+        self._clock = clock
+        self._changed = threading.Condition()
+        self._agents: dict[str, AgentInfo] = {}
+        self._queue: deque[_RemoteBuild] = deque()
+        self._builds: dict[str, _RemoteBuild] = {}
+        self._ids = itertools.count(1)
+
+    def register(self, name: str, cores: int, memory_mb: int, slots: int) -> AgentInfo:
+        """Adds an agent to the pool."""
+        with self._changed:
+            agent = AgentInfo(
+                id=f"agent-{next(self._ids)}",
+                name=name,
+                cores=cores,
+                memory_mb=memory_mb,
+                slots=max(slots, 1),
+                last_seen=self._clock(),
+            )
+            self._agents[agent.id] = agent
+            self._changed.notify_all()
+        print(f"[LOG] Agent {agent.id} ({name}) registered with {agent.slots} slots")
+        return agent
+
+    def heartbeat(self, agent_id: str) -> list[str]:
+        """
+        Records that an agent is alive.
+
+        Returns:
+            list[str]: Ids of the agent's builds that were cancelled and must be stopped.
+
+        Raises:
+            KeyError: If the agent is unknown, e.g. because it was declared dead. The agent
+                must stop its builds and register again.
+        """
+        with self._changed:
+            agent = self._touch(agent_id)
+            cancelled = []
+            for build_id in agent.builds:
+                build = self._builds[build_id]
+                if build.job.cancelled.is_set() and not build.cancel_sent:
+                    build.cancel_sent = True
+                    cancelled.append(build_id)
+            return cancelled
+
+    def lease(self, agent_id: str, timeout: float = 0.0) -> Optional[BuildJob]:
+        """
+        Hands the next queued build to an agent with a free slot.
+
+        Waits up to `timeout` seconds for a build to be queued.
+
+        Raises:
+            KeyError: If the agent is unknown.
+        """
+        deadline = self._clock() + timeout
+        with self._changed:
+            while True:
+                self._reap()
+                agent = self._touch(agent_id)
+                if self._queue and len(agent.builds) < agent.slots:
+                    build = self._queue.popleft()
+                    build.agent_id = agent_id
+                    build.attempts += 1
+                    build.log_offset = build.log.size
+                    agent.builds.append(build.job.id)
+                    return build.job
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    return None
+                self._changed.wait(timeout=min(remaining, _POLL_INTERVAL))
+
+    def append_log(self, agent_id: str, build_id: str, data: bytes) -> None:
+        """
+        Appends output an agent produced for one of its builds to the build's log.
+
+        Raises:
+            KeyError: If the build is not assigned to the agent (any more).
+        """
+        with self._changed:
+            build = self._assigned(agent_id, build_id)
+        # Written under the log's own lock, disk writes must not hold up the whole pool
+        build.log.write(data)
+
+    def complete(
+        self,
+        agent_id: str,
+        build_id: str,
+        report: BuildReport,
+        timeline: list[StepTiming],
+        first_failure_offset: Optional[int] = None,
+    ) -> None:
+        """
+        Records the result of a build reported by the agent that ran it.
+
+        Args:
+            first_failure_offset: Offset of the first failed step in the output the agent
+                sent for this build.
+
+        Raises:
+            KeyError: If the build is not assigned to the agent (any more).
+        """
+        with self._changed:
+            build = self._assigned(agent_id, build_id)
+            for timing in timeline:
+                build.log.record_step(timing)
+            if first_failure_offset is not None:
+                build.log.mark_failure_at(build.log_offset + first_failure_offset)
+            self._agents[agent_id].builds.remove(build_id)
+            build.agent_id = None
+            build.report = report
+            self._changed.notify_all()
+
+    def run(self, job: BuildJob, log: BuildLog) -> BuildReport:
+        """
+        Queues a build for the agents and waits until one of them finished it.
+
+        The log is closed once the build is done. Cancelling the job stops the build on its
+        agent, or drops it from the queue if no agent picked it up yet.
+        """
+        build = _RemoteBuild(job=job, log=log)
+        with self._changed:
+            self._builds[job.id] = build
+            self._queue.append(build)
+            self._changed.notify_all()
+            try:
+                while build.report is None:
+                    self._reap()
+                    if job.cancelled.is_set() and build in self._queue:
+                        self._queue.remove(build)
+                        build.report = BuildReport(
+                            state=BuildStatus.ERROR, description="Build cancelled"
+                        )
+                    else:
+                        self._changed.wait(timeout=_POLL_INTERVAL)
+            finally:
+                del self._builds[job.id]
+                log.close()
+        return build.report
+
+    def agents(self) -> list[AgentInfo]:
+        """Returns the registered agents that are alive."""
+        with self._changed:
+            self._reap()
+            return [
+                replace(agent, builds=list(agent.builds))
+                for agent in self._agents.values()
+            ]
+
+    def queued(self) -> int:
+        """Number of builds waiting for an agent."""
+        with self._changed:
+            return len(self._queue)
+
+    def _touch(self, agent_id: str) -> AgentInfo:
+        agent = self._agents[agent_id]
+        agent.last_seen = self._clock()
+        return agent
+
+    def _assigned(self, agent_id: str, build_id: str) -> _RemoteBuild:
+        build = self._builds.get(build_id)
+        if build is None or build.agent_id != agent_id:
+            raise KeyError(build_id)
+        self._touch(agent_id)
+        return build
+
+    def _reap(self) -> None:
+        # Called with the lock held
+        now = self._clock()
+        for agent in list(self._agents.values()):
+            if now - agent.last_seen <= self.agent_timeout:
+                continue
+            del self._agents[agent.id]
+            print(f"[ERROR] Agent {agent.id} ({agent.name}) stopped responding")
+            # Requeued in their original order, ahead of builds that waited less
+            for build_id in reversed(agent.builds):
+                build = self._builds[build_id]
+                build.agent_id = None
+                build.log.write(f"\nBuild agent {agent.name} stopped responding\n")
+                if build.attempts >= self._max_attempts:
+                    build.report = BuildReport(
+                        state=BuildStatus.ERROR,
+                        description="No build agent finished the build",
+                    )
+                else:
+                    build.log.write("The build is queued again\n")
+                    self._queue.appendleft(build)
+            self._changed.notify_all()
+
+
+def agent_blueprint(pool: AgentPool, token: str) -> Blueprint:
+    """
+    Creates the HTTP API build agents talk to, see `src.agent` for the client.
+
+    Every request must carry the shared agent token as a bearer token.
+    """
+    api = Blueprint("agents", __name__, url_prefix="/agents")
+
+    def authenticated(f: Callable[P, FlaskResponse]) -> Callable[P, FlaskResponse]:
+        @wraps(f)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> FlaskResponse:
+            header = request.headers.get("Authorization", "")
+            if not hmac.compare_digest(header.encode(), f"Bearer {token}".encode()):
+                return jsonify({"error": "Invalid agent token"}), 401
+            try:
+                return f(*args, **kwargs)
+            except KeyError:
+                return jsonify({"error": "Unknown agent or build"}), 410
+            except (TypeError, ValueError, binascii.Error) as e:
+                return jsonify({"error": f"Malformed request: {e}"}), 400
+
+        return wrapper
+
+    @api.route("", methods=["POST"])
+    @authenticated
+    def register() -> FlaskResponse:
+        body = _json_body()
+        agent = pool.register(
+            name=str(body["name"]),
+            cores=int(body["cores"]),
+            memory_mb=int(body["memory_mb"]),
+            slots=int(body["slots"]),
+        )
+        return jsonify(
+            {"agent_id": agent.id, "heartbeat_interval": pool.agent_timeout / 6}
+        ), 201
+
+    @api.route("", methods=["GET"])
+    @authenticated
+    def list_agents() -> FlaskResponse:
+        return jsonify(
+            {
+                "agents": [asdict(agent) for agent in pool.agents()],
+                "queued": pool.queued(),
+            }
+        ), 200
+
+    @api.route("/<agent_id>/heartbeat", methods=["POST"])
+    @authenticated
+    def heartbeat(agent_id: str) -> FlaskResponse:
+        return jsonify({"cancel": pool.heartbeat(agent_id)}), 200
+
+    @api.route("/<agent_id>/lease", methods=["POST"])
+    @authenticated
+    def lease(agent_id: str) -> FlaskResponse:
+        wait = min(max(request.args.get("wait", default=0.0, type=float), 0.0), 60.0)
+        job = pool.lease(agent_id, timeout=wait)
+        if job is None:
+            return jsonify({"build": None}), 200
+        return jsonify(
+            {
+                "build": {
+                    "build_id": job.id,
+                    "repo": job.ref.repo,
+                    "ref": job.ref.ref,
+                    "sha": job.ref.sha,
+                    "clone_url": job.ref.clone_url,
+                    "branch": job.ref.branch,
+                }
+            }
+        ), 200
+
+    @api.route("/<agent_id>/builds/<build_id>/log", methods=["POST"])
+    @authenticated
+    def append_log(agent_id: str, build_id: str) -> FlaskResponse:
+        data = base64.b64decode(_json_body()["data"], validate=True)
+        pool.append_log(agent_id, build_id, data)
+        return jsonify({"received": len(data)}), 200
+
+    @api.route("/<agent_id>/builds/<build_id>/result", methods=["POST"])
+    @authenticated
+    def complete(agent_id: str, build_id: str) -> FlaskResponse:
+        body = _json_body()
+        pool.complete(
+            agent_id,
+            build_id,
+            BuildReport(
+                state=BuildStatus(body["state"]), description=str(body["description"])
+            ),
+            [StepTiming(**timing) for timing in body.get("timeline", [])],
+            body.get("first_failure_offset"),
+        )
+        return jsonify({"received": True}), 200
+
+    return api
+
+
+def _json_body() -> dict[str, Any]:
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise ValueError("expected a JSON object")
+    return body
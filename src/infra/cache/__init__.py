@@ -0,0 +1,12 @@
+"""
+Persistent on-disk caches used to speed up builds.
+
+Caches in this module live outside of the per-build work directories and are shared between
+builds. They are bounded by a disk budget and evict their least recently used entries.
+"""
+
+from .diskCache import DiskCache
+from .locks import FileLock
+from .lru import CacheEntry, CacheStats, directory_size, select_evictions
+from .mirrorCache import GitMirrorCache, MirrorLease
+from .venvCache import VenvCache
@@ -0,0 +1,119 @@
+import os
+import shutil
+import threading
+
+from .locks import FileLock
+from .lru import CacheEntry, CacheStats, directory_size, select_evictions
+
+
+class DiskCache:
+    """
+    Base class for caches storing one directory per key below a common root.
+
+    Handles the bookkeeping shared by all caches: a lock per key shared between
+    threads and processes, hit/miss counters, and least recently used eviction based
+    on the modification time of the entry directories.
+    """
+
+    def __init__(self, root: str, max_bytes: int) -> None:
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+        self._guard = threading.Lock()
+        self._locks: dict[str, FileLock] = {}
+        self._sizes: dict[str, int] = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def path_for(self, key: str) -> str:
+        """Returns the directory of the entry with the given key."""
+        return os.path.join(self.root, key)
+
+    def lock_for(self, key: str) -> FileLock:
+        """Returns the lock guarding the entry with the given key."""
+        with self._guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = FileLock(os.path.join(self.root, f"{key}.lock"))
+                self._locks[key] = lock
+            return lock
+
+    def record_lookup(self, hit: bool) -> None:
+        """Counts a lookup as a hit or a miss."""
+        with self._guard:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+
+    def mark_used(self, key: str) -> None:
+        """
+        Marks an entry as most recently used and refreshes its recorded size.
+        Should be called while holding the entry's lock.
+        """
+        path = self.path_for(key)
+        if not os.path.isdir(path):
+            return
+        os.utime(path)
+        size = directory_size(path)
+        with self._guard:
+            self._sizes[key] = size
+
+    def evict(self) -> list[str]:
+        """
+        Removes least recently used entries until the cache fits its disk budget.
+        Entries that are currently locked are skipped.
+
+        Returns:
+            The keys of the evicted entries.
+        """
+        evicted: list[str] = []
+        for entry in select_evictions(self._entries(), self.max_bytes):
+            lock = self.lock_for(entry.key)
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                shutil.rmtree(self.path_for(entry.key), ignore_errors=True)
+            finally:
+                lock.release()
+
+            with self._guard:
+                self._sizes.pop(entry.key, None)
+                self._evictions += 1
+            evicted.append(entry.key)
+
+        return evicted
+
+    def stats(self) -> CacheStats:
+        """Returns hit/miss counters and the current size of the cache."""
+        entries = self._entries()
+        with self._guard:
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                entries=len(entries),
+                size_bytes=sum(e.size for e in entries),
+            )
+
+    def _entries(self) -> list[CacheEntry]:
+        entries: list[CacheEntry] = []
+        for key in os.listdir(self.root):
+            path = self.path_for(key)
+            # Skip lock files and entries that are still being written
+            if not os.path.isdir(path) or key.endswith(".tmp"):
+                continue
+            with self._guard:
+                size = self._sizes.get(key)
+            if size is None:
+                size = directory_size(path)
+                with self._guard:
+                    self._sizes[key] = size
+            try:
+                last_used = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            entries.append(CacheEntry(key=key, size=size, last_used=last_used))
+        return entries
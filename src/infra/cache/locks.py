@@ -0,0 +1,70 @@
+import fcntl
+import os
+import threading
+from types import TracebackType
+from typing import Optional
+
+
+class FileLock:
+    """
+    Exclusive lock shared between threads and processes.
+
+    Threads of the same process are serialised by an in-memory lock, while other
+    processes are excluded by an `flock` on the lock file. Instances should be shared
+    between all threads that lock the same path.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Acquires the lock.
+
+        Args:
+            blocking: Wait for the lock to be released if it is held elsewhere.
+
+        Returns:
+            True if the lock was acquired, False if it is held elsewhere and blocking is False.
+        """
+        if not self._thread_lock.acquire(blocking):
+            return False
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(
+                fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            )
+        except BlockingIOError:
+            os.close(fd)
+            self._thread_lock.release()
+            return False
+        except BaseException:
+            os.close(fd)
+            self._thread_lock.release()
+            raise
+
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        """Releases a lock previously acquired by this thread."""
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        self.release()
@@ -0,0 +1,75 @@
+import os
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    """
+    A single entry of an on-disk cache.
+
+    Attributes:
+        key (str): Identifier of the entry within its cache.
+        size (int): Size of the entry on disk in bytes.
+        last_used (float): Unix timestamp of the last time the entry was used.
+    """
+
+    key: str
+    size: int
+    last_used: float
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    """
+    Snapshot of an on-disk cache.
+
+    Attributes:
+        hits (int): Number of lookups served from the cache.
+        misses (int): Number of lookups that had to populate the cache.
+        evictions (int): Number of entries removed to stay within the disk budget.
+        entries (int): Number of entries currently in the cache.
+        size_bytes (int): Total size of all entries in bytes.
+    """
+
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    size_bytes: int
+
+
+def directory_size(path: str) -> int:
+    """
+    Returns the apparent size in bytes of all files below the given directory.
+    Symlinks are not followed, and files that vanish while walking are ignored.
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return total
+
+
+def select_evictions(entries: list[CacheEntry], max_bytes: int) -> list[CacheEntry]:
+    """
+    Selects the least recently used entries that must be removed for the cache to fit
+    within the given budget.
+
+    Args:
+        entries: All entries currently in the cache.
+        max_bytes: Disk budget of the cache in bytes.
+
+    Returns:
+        The entries to evict, least recently used first.
+    """
+    total = sum(e.size for e in entries)
+    evictions: list[CacheEntry] = []
+    for entry in sorted(entries, key=lambda e: e.last_used):
+        if total <= max_bytes:
+            break
+        evictions.append(entry)
+        total -= entry.size
+    return evictions
@@ -0,0 +1,105 @@
+import hashlib
+import os
+import re
+import shutil
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator
+
+from .diskCache import DiskCache
+
+
+@dataclass(frozen=True)
+class MirrorLease:
+    """
+    Exclusive access to the bare mirror of a repository, handed out by `GitMirrorCache.lease`.
+
+    Attributes:
+        path (str): Path of the bare mirror repository.
+        populated (bool): Whether the mirror already existed before this lease, i.e.
+            only an incremental fetch is needed to bring it up to date.
+    """
+
+    path: str
+    populated: bool
+
+    @property
+    def staging_path(self) -> str:
+        """
+        Path a new mirror is cloned to. It is moved to `path` once the lease ends
+        without an error, so a killed clone never leaves a partial mirror in the cache.
+        """
+        return f"{self.path}.tmp"
+
+    def update_command(self, repo_url: str) -> list[str]:
+        """
+        Returns the git command bringing the mirror up to date with the remote,
+        creating it if it does not exist yet.
+        """
+        if self.populated:
+            return ["git", "--git-dir", self.path, "fetch", "--prune", "origin"]
+        return ["git", "clone", "--mirror", repo_url, self.staging_path]
+
+    def clone_command(self, dest: str) -> list[str]:
+        """
+        Returns the git command creating a working copy of the mirror at `dest`.
+
+        The clone is local, so git hardlinks the mirror's object files instead of copying
+        them. The working copy therefore stays valid even if the mirror is evicted later on.
+        """
+        source = self.path if self.populated else self.staging_path
+        return ["git", "clone", source, dest]
+
+
+class GitMirrorCache(DiskCache):
+    """
+    Cache of bare `git clone --mirror` repositories shared by all builds.
+
+    Each repository is mirrored once and afterwards only fetched incrementally. Builds
+    clone their working copy from the local mirror, which avoids downloading the full
+    history for every build. Access to a mirror is serialised by a lock shared between
+    threads and processes, and the least recently used mirrors are evicted once the
+    cache exceeds its disk budget.
+    """
+
+    def key_for(self, repo_url: str) -> str:
+        """
+        Returns the cache key of a repository, a readable prefix of the repository name
+        followed by a hash of the full URL.
+        """
+        digest = hashlib.sha256(repo_url.encode()).hexdigest()[:16]
+        name = repo_url.rstrip("/").removesuffix(".git").rsplit("/", 1)[-1]
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", name)[:40]
+        return f"{name}-{digest}"
+
+    @contextmanager
+    def lease(self, repo_url: str) -> Iterator[MirrorLease]:
+        """
+        Locks the mirror of the given repository for the duration of the context.
+
+        The caller is expected to run `MirrorLease.update_command` followed by
+        `MirrorLease.clone_command` while holding the lease. A new mirror is only kept
+        if the context exits without an error. Once released, the mirror is marked as
+        recently used and the cache is trimmed to its disk budget.
+        """
+        key = self.key_for(repo_url)
+        path = self.path_for(key)
+
+        with self.lock_for(key):
+            populated = os.path.isfile(os.path.join(path, "HEAD"))
+            self.record_lookup(hit=populated)
+            mirror = MirrorLease(path=path, populated=populated)
+            if not populated:
+                # Left behind by a clone that was killed before it completed
+                shutil.rmtree(path, ignore_errors=True)
+                shutil.rmtree(mirror.staging_path, ignore_errors=True)
+            try:
+                yield mirror
+                if not populated and os.path.isdir(mirror.staging_path):
+                    os.replace(mirror.staging_path, path)
+            finally:
+                if not populated:
+                    shutil.rmtree(mirror.staging_path, ignore_errors=True)
+                self.mark_used(key)
+
+        self.evict()
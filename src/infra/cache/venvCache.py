@@ -0,0 +1,163 @@
+import glob
+import hashlib
+import os
+import shutil
+import subprocess
+from typing import Optional
+
+from .diskCache import DiskCache
+
+# Files whose content determines the third-party packages installed into a build's venv
+DEPENDENCY_MANIFESTS = (
+    "pyproject.toml",
+    "setup.py",
+    "setup.cfg",
+    "requirements*.txt",
+    "poetry.lock",
+    "pdm.lock",
+    "uv.lock",
+    "Pipfile.lock",
+)
+
+# Marker inside a snapshot recording the path the venv was originally created at
+_ORIGIN_FILE = ".ci-venv-origin"
+
+
+class VenvCache(DiskCache):
+    """
+    Content-addressed cache of virtual environments.
+
+    Environments are keyed on a hash of the interpreter version and the dependency
+    manifests of the project (see `DEPENDENCY_MANIFESTS`). A snapshot is stored after a
+    successful dependency install and restored into later builds with the same key, so
+    only the editable install of the project itself has to be re-run.
+
+    Snapshots are stored as full copies and restored as hardlink clones, with the absolute
+    venv paths baked into `bin/` scripts rewritten to the new location. Files that pip or
+    Python later replace in the restored venv are replaced atomically, which leaves the
+    snapshot untouched.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        max_bytes: int,
+        python: str = "python3.13",
+        python_version: Optional[str] = None,
+    ) -> None:
+        super().__init__(root, max_bytes)
+        self.python = python
+        self._python_version = python_version
+
+    def key_for(self, project_dir: str) -> str:
+        """
+        Computes the cache key of the project checked out at `project_dir`.
+        """
+        digest = hashlib.sha256()
+        digest.update(self.python_version().encode())
+
+        for pattern in DEPENDENCY_MANIFESTS:
+            for path in sorted(glob.glob(os.path.join(project_dir, pattern))):
+                digest.update(b"\0" + os.path.basename(path).encode() + b"\0")
+                with open(path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 16), b""):
+                        digest.update(chunk)
+
+        return digest.hexdigest()[:32]
+
+    def python_version(self) -> str:
+        """Returns the full version string of the interpreter used to create venvs."""
+        if self._python_version is None:
+            result = subprocess.run(
+                [self.python, "-c", "import sys; print(sys.version)"],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            self._python_version = result.stdout.strip()
+        return self._python_version
+
+    def restore(self, key: str, dest: str) -> bool:
+        """
+        Restores the snapshot with the given key to `dest`.
+
+        Returns:
+            True if a snapshot was restored, False on a cache miss.
+        """
+        with self.lock_for(key):
+            snapshot = self.path_for(key)
+            hit = os.path.isfile(os.path.join(snapshot, _ORIGIN_FILE))
+            self.record_lookup(hit)
+            if not hit:
+                return False
+
+            if os.path.exists(dest):
+                shutil.rmtree(dest)
+            shutil.copytree(snapshot, dest, symlinks=True, copy_function=_link_or_copy)
+
+            with open(os.path.join(snapshot, _ORIGIN_FILE)) as f:
+                origin = f.read()
+            _relocate(dest, origin)
+            self.mark_used(key)
+
+        return True
+
+    def store(self, key: str, venv_dir: str) -> None:
+        """
+        Stores a snapshot of `venv_dir` under the given key, unless one already exists.
+        """
+        with self.lock_for(key):
+            snapshot = self.path_for(key)
+            if os.path.isdir(snapshot):
+                return
+
+            tmp = f"{snapshot}.tmp"
+            shutil.rmtree(tmp, ignore_errors=True)
+            try:
+                shutil.copytree(venv_dir, tmp, symlinks=True)
+                with open(os.path.join(tmp, _ORIGIN_FILE), "w") as f:
+                    f.write(os.path.abspath(venv_dir))
+                os.replace(tmp, snapshot)
+            except BaseException:
+                shutil.rmtree(tmp, ignore_errors=True)
+                raise
+            self.mark_used(key)
+
+        self.evict()
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _relocate(venv_dir: str, origin: str) -> None:
+    """
+    Rewrites references to the venv's original location in its scripts.
+    Files are replaced rather than modified, so hardlinked snapshot files stay intact.
+    """
+    old, new = origin.encode(), os.path.abspath(venv_dir).encode()
+    if old == new:
+        return
+
+    candidates = [os.path.join(venv_dir, "pyvenv.cfg")]
+    bin_dir = os.path.join(venv_dir, "bin")
+    if os.path.isdir(bin_dir):
+        candidates += [os.path.join(bin_dir, name) for name in os.listdir(bin_dir)]
+
+    for path in candidates:
+        if os.path.islink(path) or not os.path.isfile(path):
+            continue
+        with open(path, "rb") as f:
+            content = f.read()
+        if old not in content:
+            continue
+
+        mode = os.stat(path).st_mode
+        tmp = f"{path}.relocate"
+        with open(tmp, "wb") as f:
+            f.write(content.replace(old, new))
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
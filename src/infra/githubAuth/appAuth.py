@@ -1,5 +1,8 @@
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from typing import Any, Dict, Mapping, Tuple, Optional
+import json
+import os
+import threading
 import time
 import jwt
 from .githubAuth import GithubAuth, GithubAuthContext
@@ -26,6 +29,10 @@ class GithubTokenResponse:
     expires_at: int
 
 
+# Tokens are not handed out during their last minute, so requests using them can finish
+_EXPIRY_MARGIN = 60
+
+
 class GithubAppAuth(GithubAuth):
     """
     Concrete implementation of GithubAuth that uses GitHub App authentication.
@@ -33,6 +40,12 @@ class GithubAppAuth(GithubAuth):
     This class handles handles caching and singing of JWTs for authenticating as a GitHub App,
     as well as minting and caching installation access tokens for specific installations. It ensures
     that tokens are refreshed as needed while minimizing unnecessary API calls to GitHub.
+
+    The caches are safe to use from multiple threads. Concurrent requests for the same
+    installation wait for a single token to be minted instead of minting one each, and a
+    token that expires within `refresh_margin` seconds is replaced in a background thread
+    while the cached one is still handed out. With `cache_path` set, installation tokens
+    are persisted to that file (readable by the owner only) and reused after a restart.
     """
 
     def __init__(
@@ -40,14 +53,27 @@ class GithubAppAuth(GithubAuth):
         config: GithubAppConfig,
         client: Optional[HttpClient] = None,
         clock: Optional[Clock] = None,
+        refresh_margin: int = 5 * 60,
+        cache_path: Optional[str] = None,
     ) -> None:
         self.cfg = config
         self._client = RequestsHttpClient() if client is None else client
         self._clock = clock if clock is not None else SystemClock()
+        self._refresh_margin = refresh_margin
+        self._cache_path = cache_path
         self._jwt_cache: Tuple[str, int] | None = (
             None  # Cache for JWT tokens with their expiration times
         )
+        self._jwt_lock = threading.Lock()
         self._installation_token_cache: Dict[int, GithubTokenResponse] = {}
+        # Guards the token cache and the installation locks, never held while minting
+        self._lock = threading.Lock()
+        self._installation_locks: Dict[int, threading.Lock] = {}
+
+        if cache_path is not None:
+            self._installation_token_cache = _load_tokens(
+                cache_path, int(self._clock.time()) + _EXPIRY_MARGIN
+            )
 
     def headers(self, ctx: GithubAuthContext) -> Mapping[str, str]:
         if ctx.installation_id is None:
@@ -90,37 +116,99 @@ class GithubAppAuth(GithubAuth):
         """
         Retrieves a cached JWT or generates a new one if the cached one is expired or absent.
         """
-        now = int(self._clock.time())
+        # Held while signing, so concurrent callers reuse one signature
+        with self._jwt_lock:
+            now = int(self._clock.time())
 
-        if self._jwt_cache is not None:
-            cached_jwt, exp = self._jwt_cache
+            if self._jwt_cache is not None:
+                cached_jwt, exp = self._jwt_cache
 
-            if exp > now + 60:
-                return cached_jwt
+                if exp > now + _EXPIRY_MARGIN:
+                    return cached_jwt
 
-        jwt_token, exp = self._generate_jwt()
-        self._jwt_cache = (jwt_token, exp)
+            jwt_token, exp = self._generate_jwt()
+            self._jwt_cache = (jwt_token, exp)
 
-        return jwt_token
+            return jwt_token
 
     def _get_installation_token(self, installation_id: int) -> str:
         """
         Retrieves an installation access token for the given installation ID.
         """
-        now = int(self._clock.time())
-
-        # Check cache for valid token
-        cached_token = self._installation_token_cache.get(installation_id)
-        if cached_token is not None and cached_token.expires_at > now + 60:
+        cached_token = self._cached_token(installation_id)
+        if cached_token is not None:
+            if self._expires_soon(cached_token):
+                self._start_refresh(installation_id)
             return cached_token.token
 
-        # Delete expired token from cache if it existed
-        self._installation_token_cache.pop(installation_id, None)
+        with self._installation_lock(installation_id):
+            # Another thread may have minted a token while this one was waiting
+            cached_token = self._cached_token(installation_id)
+            if cached_token is not None:
+                return cached_token.token
+            return self._mint_installation_token(installation_id).token
+
+    def _cached_token(self, installation_id: int) -> Optional[GithubTokenResponse]:
+        """
+        Returns the cached token of the installation, unless it is about to expire.
+        """
+        now = int(self._clock.time())
+        with self._lock:
+            cached_token = self._installation_token_cache.get(installation_id)
+            if (
+                cached_token is not None
+                and cached_token.expires_at > now + _EXPIRY_MARGIN
+            ):
+                return cached_token
+            # Delete expired token from cache if it existed
+            self._installation_token_cache.pop(installation_id, None)
+            return None
+
+    def _expires_soon(self, token: GithubTokenResponse) -> bool:
+        now = int(self._clock.time())
+        return token.expires_at <= now + _EXPIRY_MARGIN + self._refresh_margin
 
+    def _installation_lock(self, installation_id: int) -> threading.Lock:
+        with self._lock:
+            return self._installation_locks.setdefault(
+                installation_id, threading.Lock()
+            )
+
+    def _mint_installation_token(self, installation_id: int) -> GithubTokenResponse:
+        """
+        Fetches a new token and stores it in the cache, the installation's lock must be held.
+        """
         token_response = self._fetch_installation_token(installation_id)
+        with self._lock:
+            self._installation_token_cache[installation_id] = token_response
+            tokens = dict(self._installation_token_cache)
+        if self._cache_path is not None:
+            try:
+                _store_tokens(self._cache_path, tokens)
+            except OSError as e:
+                print(f"[ERROR] Failed to persist installation tokens: {e}")
+        return token_response
 
-        self._installation_token_cache[installation_id] = token_response
-        return token_response.token
+    def _start_refresh(self, installation_id: int) -> None:
+        """
+        Replaces the installation's token in a background thread, unless one is being minted.
+        """
+        lock = self._installation_lock(installation_id)
+        if not lock.acquire(blocking=False):
+            return
+
+        def refresh() -> None:
+            try:
+                self._mint_installation_token(installation_id)
+            except TransportError as e:
+                # The cached token stays valid, the next request retries the refresh
+                print(f"[ERROR] Failed to refresh installation token: {e}")
+            finally:
+                lock.release()
+
+        threading.Thread(
+            target=refresh, name=f"token-refresh-{installation_id}", daemon=True
+        ).start()
 
     def _fetch_installation_token(self, installation_id: int) -> GithubTokenResponse:
         """
@@ -157,6 +245,44 @@ class GithubAppAuth(GithubAuth):
         return token_response
 
 
+def _load_tokens(path: str, valid_after: int) -> Dict[int, GithubTokenResponse]:
+    """
+    Reads persisted installation tokens, skipping the ones that expire before `valid_after`.
+    """
+    try:
+        with open(path) as f:
+            stored = json.load(f)
+        tokens = {
+            int(installation_id): GithubTokenResponse(**token)
+            for installation_id, token in stored.items()
+        }
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        print(f"[ERROR] Ignoring unreadable installation token cache {path}: {e}")
+        return {}
+    return {
+        installation_id: token
+        for installation_id, token in tokens.items()
+        if token.expires_at > valid_after
+    }
+
+
+def _store_tokens(path: str, tokens: Dict[int, GithubTokenResponse]) -> None:
+    # Written to a private temporary file and renamed, so the file is never partially
+    # written nor readable by other users
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump({str(i): asdict(token) for i, token in tokens.items()}, f)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
 def _parse_github_datetime(dt_str: str) -> int:
     dt = time.strptime(dt_str, "%Y-%m-%dT%H:%M:%SZ")
     return int(time.mktime(dt))
@@ -0,0 +1,16 @@
+"""
+Persistent storage of the build history.
+
+Provides an indexed store of build metadata, so the history can be browsed and filtered
+without scanning the log files themselves, the durations of test modules that
+test shards are balanced with, the source files test modules executed, which affected
+tests are selected with, a journal of the accepted webhook deliveries and the builds in
+the build queue, which are resumed after a restart.
+"""
+
+from .deliveryJournal import Delivery, DeliveryJournal
+from .durationStore import TestDurationStore
+from .historyStore import BuildHistoryStore, HistoryPage, HistoryQuery, HistoryRecord
+from .impactStore import TestImpactStore
+from .logStore import ChunkedLogReader, ChunkedLogWriter, LogChunk, LogStore
+from .queueStore import BuildQueueStore, QueuedBuild
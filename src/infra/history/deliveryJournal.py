@@ -0,0 +1,243 @@
+import json
+import os
+import threading
+from dataclasses import dataclass, replace
+from typing import IO, Any, Optional
+
+from src.infra.time.clock import Clock, SystemClock
+from src.models import BuildRef
+
+# GitHub lets deliveries be redelivered for three days
+_DEFAULT_TTL = 3 * 24 * 60 * 60
+# Records appended between compactions, at least
+_COMPACT_AFTER = 1000
+
+
+@dataclass(frozen=True)
+class Delivery:
+    """
+    A webhook delivery that was accepted for building.
+
+    Attributes:
+        id (str): The delivery's `X-GitHub-Delivery` header.
+        ref (BuildRef): The commit the delivery asked to build.
+        accepted_at (float): Unix timestamp of when the delivery was accepted.
+        finished (bool): Whether the build of the delivery finished.
+    """
+
+    id: str
+    ref: BuildRef
+    accepted_at: float
+    finished: bool = False
+
+
+class DeliveryJournal:
+    """
+    Durable record of the webhook deliveries the server accepted, keyed on their
+    `X-GitHub-Delivery` id.
+
+    Every change is appended to a JSON lines file and synced to disk before the call
+    returns, so a delivery that was acknowledged is known after a crash. Lookups are
+    answered from an in-memory index. Deliveries are forgotten `ttl` seconds after they
+    were accepted: the file is compacted when it is opened and whenever enough records
+    were appended, by writing the live deliveries to a new file that replaces the old
+    one. A record torn by a crash during an append is skipped when the file is read.
+
+    Args:
+        path: Path of the journal file, created if missing.
+        ttl: Seconds after which a delivery is forgotten.
+        clock: Time source of the acceptance timestamps.
+    """
+
+    def __init__(
+        self, path: str, ttl: float = _DEFAULT_TTL, clock: Optional[Clock] = None
+    ) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._path = path
+        self._ttl = ttl
+        self._clock = clock if clock is not None else SystemClock()
+        self._lock = threading.Lock()
+        self._deliveries: dict[str, Delivery] = {}
+        # Unfinished deliveries by (repo, sha), finished together by `finish`
+        self._unfinished: dict[tuple[str, str], list[str]] = {}
+        self._appended = 0
+        self._file: Optional[IO[str]] = None
+
+        for record in _read_records(path):
+            try:
+                self._apply(record)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"[ERROR] Skipping malformed record in delivery journal: {e}")
+        with self._lock:
+            self._compact()
+
+    def __contains__(self, delivery_id: object) -> bool:
+        with self._lock:
+            return delivery_id in self._deliveries
+
+    def accept(self, delivery_id: str, ref: BuildRef) -> bool:
+        """
+        Records that a delivery was accepted.
+
+        Returns:
+            bool: False if the delivery was accepted before, which leaves it unchanged.
+        """
+        with self._lock:
+            if delivery_id in self._deliveries:
+                return False
+            self._append(
+                {
+                    "op": "accept",
+                    "id": delivery_id,
+                    "at": self._clock.time(),
+                    "repo": ref.repo,
+                    "ref": ref.ref,
+                    "sha": ref.sha,
+                    "installation_id": ref.installation_id,
+                    "default_branch": ref.default_branch,
+                }
+            )
+            return True
+
+    def drop(self, delivery_id: str) -> None:
+        """Forgets an accepted delivery, e.g. one that could not be queued after all."""
+        with self._lock:
+            if delivery_id in self._deliveries:
+                self._append({"op": "drop", "id": delivery_id})
+
+    def finish(self, repo: str, sha: str) -> None:
+        """Records that the build of a commit finished, for every delivery asking for it."""
+        with self._lock:
+            ids = self._unfinished.get((repo, sha))
+            if ids:
+                self._append({"op": "finish", "ids": list(ids)})
+
+    def unfinished(self) -> list[Delivery]:
+        """Returns the accepted deliveries whose build did not finish, oldest first."""
+        with self._lock:
+            deliveries = [d for d in self._deliveries.values() if not d.finished]
+        return sorted(deliveries, key=lambda d: d.accepted_at)
+
+    def close(self) -> None:
+        """Closes the journal file."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _append(self, record: dict[str, Any]) -> None:
+        # Called with the lock held
+        assert self._file is not None
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._apply(record)
+        self._appended += 1
+        if self._appended >= max(_COMPACT_AFTER, 2 * len(self._deliveries)):
+            self._compact()
+
+    def _apply(self, record: dict[str, Any]) -> None:
+        op = record.get("op")
+        if op == "accept":
+            delivery = Delivery(
+                id=record["id"],
+                ref=BuildRef(
+                    repo=record["repo"],
+                    ref=record["ref"],
+                    sha=record["sha"],
+                    installation_id=record.get("installation_id"),
+                    default_branch=record.get("default_branch"),
+                ),
+                accepted_at=float(record["at"]),
+                finished=bool(record.get("finished", False)),
+            )
+            self._deliveries[delivery.id] = delivery
+            if not delivery.finished:
+                key = (delivery.ref.repo, delivery.ref.sha)
+                self._unfinished.setdefault(key, []).append(delivery.id)
+        elif op in ("drop", "finish"):
+            ids = record["ids"] if op == "finish" else [record["id"]]
+            for delivery_id in ids:
+                known = self._deliveries.get(delivery_id)
+                if known is None:
+                    continue
+                if op == "drop":
+                    del self._deliveries[delivery_id]
+                else:
+                    self._deliveries[delivery_id] = replace(known, finished=True)
+                self._forget_unfinished(known)
+
+    def _forget_unfinished(self, delivery: Delivery) -> None:
+        key = (delivery.ref.repo, delivery.ref.sha)
+        ids = self._unfinished.get(key, [])
+        if delivery.id in ids:
+            ids.remove(delivery.id)
+        if not ids:
+            self._unfinished.pop(key, None)
+
+    def _compact(self) -> None:
+        # Called with the lock held. Rewrites the journal with the live deliveries
+        cutoff = self._clock.time() - self._ttl
+        for delivery in list(self._deliveries.values()):
+            if delivery.accepted_at < cutoff:
+                del self._deliveries[delivery.id]
+                self._forget_unfinished(delivery)
+
+        if self._file is not None:
+            self._file.close()
+        tmp = f"{self._path}.tmp"
+        with open(tmp, "w") as f:
+            for delivery in self._deliveries.values():
+                f.write(json.dumps(_accept_record(delivery)) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path)
+        _sync_directory(self._path)
+        # Appended to until the next compaction, closed by `close`
+        self._file = open(self._path, "a")  # noqa: SIM115
+        self._appended = 0
+
+
+def _accept_record(delivery: Delivery) -> dict[str, Any]:
+    return {
+        "op": "accept",
+        "id": delivery.id,
+        "at": delivery.accepted_at,
+        "repo": delivery.ref.repo,
+        "ref": delivery.ref.ref,
+        "sha": delivery.ref.sha,
+        "installation_id": delivery.ref.installation_id,
+        "default_branch": delivery.ref.default_branch,
+        "finished": delivery.finished,
+    }
+
+
+def _read_records(path: str) -> list[dict[str, Any]]:
+    try:
+        with open(path) as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return []
+    records = []
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # Torn by a crash while it was appended
+            print(f"[ERROR] Skipping corrupt record in delivery journal {path}")
+            continue
+        if isinstance(record, dict):
+            records.append(record)
+    return records
+
+
+def _sync_directory(path: str) -> None:
+    # Makes the rename of the compacted journal durable
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,62 @@
+import os
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS test_durations (
+    repo TEXT NOT NULL,
+    module TEXT NOT NULL,
+    duration REAL NOT NULL,
+    recorded_at INTEGER NOT NULL,
+    PRIMARY KEY (repo, module)
+);
+"""
+
+
+class TestDurationStore:
+    """
+    SQLite backed record of how long the test modules of each repository took.
+
+    Only the latest duration of every module is kept, which is what test shards are
+    balanced with. The table can live in the same database as the build history.
+    """
+
+    # Not a test class, despite its name
+    __test__ = False
+
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def durations(self, repo: str) -> dict[str, float]:
+        """Returns the latest duration in seconds of every test module of a repository."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT module, duration FROM test_durations WHERE repo = ?", (repo,)
+            ).fetchall()
+        return dict(rows)
+
+    def record(self, repo: str, durations: dict[str, float]) -> None:
+        """Replaces the durations of the given test modules of a repository."""
+        now = int(time.time() * 1000)
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO test_durations "
+                "(repo, module, duration, recorded_at) VALUES (?, ?, ?, ?)",
+                [
+                    (repo, module, duration, now)
+                    for module, duration in durations.items()
+                ],
+            )
+
+    def close(self) -> None:
+        """Closes the underlying database connection."""
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,333 @@
+import json
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Optional
+
+from src.models import BuildStatus
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS builds (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    repo TEXT NOT NULL,
+    refspec TEXT NOT NULL,
+    branch TEXT NOT NULL,
+    sha TEXT NOT NULL,
+    status TEXT NOT NULL,
+    finished_at INTEGER NOT NULL,
+    duration REAL,
+    log_file TEXT NOT NULL,
+    config_hash TEXT,
+    build_id TEXT
+);
+CREATE INDEX IF NOT EXISTS builds_by_time ON builds (finished_at, id);
+CREATE INDEX IF NOT EXISTS builds_by_repo ON builds (repo, finished_at, id);
+CREATE INDEX IF NOT EXISTS builds_by_branch ON builds (branch, finished_at, id);
+CREATE INDEX IF NOT EXISTS builds_by_status ON builds (status, finished_at, id);
+"""
+
+# Created after migrating databases written before the column existed
+_RESULT_INDEX = """
+CREATE INDEX IF NOT EXISTS builds_by_result ON builds (repo, sha, config_hash, finished_at)
+"""
+
+# Build outcomes that only depend on the commit and the build configuration
+_CONCLUSIVE = (BuildStatus.SUCCESS, BuildStatus.FAILURE)
+
+_COLUMNS = (
+    "id, repo, refspec, sha, status, finished_at, duration, log_file, config_hash, "
+    "build_id"
+)
+
+
+@dataclass(frozen=True)
+class HistoryRecord:
+    """
+    Metadata of a single finished build.
+
+    Attributes:
+        repo (str): Full name of the repository (e.g. "owner/repo").
+        refspec (str): The git reference that triggered the build (e.g. "refs/heads/main").
+        commit_sha (str): The commit that was built.
+        status (BuildStatus): Outcome of the build.
+        finished_at (datetime): Time the build finished.
+        duration (Optional[float]): Wall-clock duration of the build in seconds, if known.
+        log_file (str): Name of the build's log file within the logs directory.
+        id (Optional[int]): Identifier assigned by the store.
+        config_hash (Optional[str]): Hash of the build configuration the build ran with.
+        build_id (Optional[str]): Identifier of the build's job in the build queue.
+    """
+
+    repo: str
+    refspec: str
+    commit_sha: str
+    status: BuildStatus
+    finished_at: datetime
+    duration: Optional[float]
+    log_file: str
+    id: Optional[int] = None
+    config_hash: Optional[str] = None
+    build_id: Optional[str] = None
+
+    @property
+    def branch(self) -> str:
+        """The branch or tag name of the refspec."""
+        return self.refspec.removeprefix("refs/heads/")
+
+
+@dataclass(frozen=True)
+class HistoryQuery:
+    """
+    Filters and pagination of a history lookup. Unset filters match all builds.
+
+    Attributes:
+        repo (Optional[str]): Only include builds of this repository.
+        branch (Optional[str]): Only include builds of this branch or tag.
+        status (Optional[BuildStatus]): Only include builds with this outcome.
+        since (Optional[datetime]): Only include builds finished at or after this time.
+        until (Optional[datetime]): Only include builds finished before this time.
+        limit (int): Maximum number of builds per page.
+        cursor (Optional[str]): `HistoryPage.next_cursor` of the previous page.
+    """
+
+    repo: Optional[str] = None
+    branch: Optional[str] = None
+    status: Optional[BuildStatus] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    limit: int = 50
+    cursor: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class HistoryPage:
+    """
+    A page of builds, most recent first.
+
+    Attributes:
+        records (list[HistoryRecord]): The builds on this page.
+        next_cursor (Optional[str]): Cursor of the next page, None on the last page.
+    """
+
+    records: list[HistoryRecord] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+
+
+class BuildHistoryStore:
+    """
+    SQLite backed index of finished builds.
+
+    Builds are indexed by finish time, repository, branch and status. Pages are fetched
+    with keyset pagination, so the cost of a page does not depend on how far into the
+    history it is.
+    """
+
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(builds)")]
+        if "config_hash" not in columns:
+            self._db.execute("ALTER TABLE builds ADD COLUMN config_hash TEXT")
+        if "build_id" not in columns:
+            self._db.execute("ALTER TABLE builds ADD COLUMN build_id TEXT")
+        self._db.execute(_RESULT_INDEX)
+
+    def add(self, record: HistoryRecord) -> int:
+        """
+        Adds a build to the history.
+
+        Returns:
+            int: The id assigned to the build.
+        """
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT INTO builds (repo, refspec, branch, sha, status, finished_at, "
+                "duration, log_file, config_hash, build_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    record.repo,
+                    record.refspec,
+                    record.branch,
+                    record.commit_sha,
+                    record.status.value,
+                    _to_millis(record.finished_at),
+                    record.duration,
+                    record.log_file,
+                    record.config_hash,
+                    record.build_id,
+                ),
+            )
+        assert cursor.lastrowid is not None
+        return cursor.lastrowid
+
+    def query(self, query: HistoryQuery) -> HistoryPage:
+        """Returns a page of builds matching the query, most recent first."""
+        clauses: list[str] = []
+        params: list[Any] = []
+
+        for column, value in (
+            ("repo", query.repo),
+            ("branch", query.branch),
+            ("status", query.status.value if query.status is not None else None),
+        ):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if query.since is not None:
+            clauses.append("finished_at >= ?")
+            params.append(_to_millis(query.since))
+        if query.until is not None:
+            clauses.append("finished_at < ?")
+            params.append(_to_millis(query.until))
+        if query.cursor is not None:
+            finished_at, build_id = _parse_cursor(query.cursor)
+            clauses.append("(finished_at, id) < (?, ?)")
+            params += [finished_at, build_id]
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        # Fetch one extra row to find out whether there is a next page
+        sql = (
+            f"SELECT {_COLUMNS} "
+            f"FROM builds {where} ORDER BY finished_at DESC, id DESC LIMIT ?"
+        )
+        params.append(query.limit + 1)
+
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+
+        records = [_to_record(row) for row in rows[: query.limit]]
+        next_cursor = None
+        if len(rows) > query.limit:
+            last = rows[query.limit - 1]
+            next_cursor = f"{last[5]}.{last[0]}"
+        return HistoryPage(records=records, next_cursor=next_cursor)
+
+    def find_result(
+        self, repo: str, commit_sha: str, config_hash: str
+    ) -> Optional[HistoryRecord]:
+        """
+        Looks up the most recent conclusive build of a commit.
+
+        Only successful and failed builds are considered, as errors are caused by the
+        environment rather than by the commit and should be retried.
+
+        Args:
+            repo (str): Full name of the repository.
+            commit_sha (str): The commit to look up.
+            config_hash (str): Hash of the build configuration the result must have been
+                produced with.
+
+        Returns:
+            Optional[HistoryRecord]: The build, or None if the commit was not built yet.
+        """
+        statuses = [status.value for status in _CONCLUSIVE]
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {_COLUMNS} FROM builds "
+                "WHERE repo = ? AND sha = ? AND config_hash = ? AND status IN (?, ?) "
+                "ORDER BY finished_at DESC, id DESC LIMIT 1",
+                (repo, commit_sha, config_hash, *statuses),
+            ).fetchone()
+        return _to_record(row) if row is not None else None
+
+    def is_empty(self) -> bool:
+        """Whether no build has been recorded yet."""
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM builds LIMIT 1").fetchone() is None
+
+    def import_log_directory(self, log_dir: str) -> int:
+        """
+        Indexes the JSON log files in `log_dir`, as written before the history store existed.
+        Files that cannot be parsed are skipped.
+
+        Returns:
+            int: Number of imported builds.
+        """
+        if not os.path.isdir(log_dir):
+            return 0
+
+        imported = 0
+        for filename in sorted(os.listdir(log_dir)):
+            # Skip compressed output files, only metadata files describe a build
+            if filename.endswith(".gz") or filename.endswith(".tmp"):
+                continue
+            try:
+                with open(os.path.join(log_dir, filename)) as f:
+                    data = json.load(f)
+                record = HistoryRecord(
+                    repo=repo_name_from_url(data["repo_url"]),
+                    refspec=data["refspec"],
+                    commit_sha=data["commit_SHA"],
+                    status=BuildStatus(data["status"]),
+                    finished_at=datetime.fromtimestamp(data["date_time"] / 1000),
+                    duration=data.get("duration"),
+                    log_file=filename,
+                    config_hash=data.get("config_hash"),
+                    build_id=data.get("build_id"),
+                )
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+            self.add(record)
+            imported += 1
+        return imported
+
+    def close(self) -> None:
+        """Closes the underlying database connection."""
+        with self._lock:
+            self._db.close()
+
+
+def repo_name_from_url(repo_url: str) -> str:
+    """
+    Extracts the full repository name from a GitHub clone URL.
+    For example, "https://github.com/owner/repo.git" becomes "owner/repo".
+    """
+    path = repo_url.split("://", 1)[-1].split("/", 1)[-1]
+    return path.removesuffix(".git").strip("/")
+
+
+def _to_millis(dt: datetime) -> int:
+    return int(dt.timestamp() * 1000)
+
+
+def _parse_cursor(cursor: str) -> tuple[int, int]:
+    try:
+        finished_at, build_id = cursor.split(".", 1)
+        return int(finished_at), int(build_id)
+    except ValueError as e:
+        raise ValueError(f"Invalid history cursor '{cursor}'") from e
+
+
+def _to_record(row: tuple[Any, ...]) -> HistoryRecord:
+    (
+        record_id,
+        repo,
+        refspec,
+        sha,
+        status,
+        finished_at,
+        duration,
+        log_file,
+        config_hash,
+        build_id,
+    ) = row
+    return HistoryRecord(
+        id=record_id,
+        repo=repo,
+        refspec=refspec,
+        commit_sha=sha,
+        status=BuildStatus(status),
+        finished_at=datetime.fromtimestamp(finished_at / 1000),
+        duration=duration,
+        log_file=log_file,
+        config_hash=config_hash,
+        build_id=build_id,
+    )
@@ -0,0 +1,138 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS test_impact (
+    repo TEXT NOT NULL,
+    test_module TEXT NOT NULL,
+    source_file TEXT NOT NULL,
+    PRIMARY KEY (repo, test_module, source_file)
+);
+CREATE INDEX IF NOT EXISTS test_impact_by_source ON test_impact (repo, source_file);
+CREATE TABLE IF NOT EXISTS test_impact_commits (
+    repo TEXT NOT NULL,
+    branch TEXT NOT NULL,
+    sha TEXT NOT NULL,
+    full_run INTEGER NOT NULL,
+    recorded_at INTEGER NOT NULL,
+    PRIMARY KEY (repo, branch, sha)
+);
+"""
+
+# Successfully tested commits remembered per branch, to diff later builds against
+_COMMITS_PER_BRANCH = 50
+
+
+class TestImpactStore:
+    """
+    SQLite backed index of the source files the test modules of each repository
+    executed, and of the commits of each branch whose tests passed.
+
+    Builds record the coverage of the test modules they ran, replacing what was recorded
+    for those modules before, and later builds select the tests affected by their
+    changes from it. The tables can live in the same database as the build history.
+    """
+
+    # Not a test class, despite its name
+    __test__ = False
+
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def impact(self, repo: str) -> dict[str, set[str]]:
+        """Returns the test modules that executed each source file of a repository."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT source_file, test_module FROM test_impact WHERE repo = ?",
+                (repo,),
+            ).fetchall()
+        impact: dict[str, set[str]] = {}
+        for source_file, test_module in rows:
+            impact.setdefault(source_file, set()).add(test_module)
+        return impact
+
+    def record(
+        self, repo: str, executed: dict[str, set[str]], replace_all: bool = False
+    ) -> None:
+        """
+        Replaces the source files the given test modules of a repository executed.
+
+        Args:
+            repo: The repository the tests belong to.
+            executed: The files every test module that ran executed.
+            replace_all: Also forget the test modules that did not run, after a run of
+                the whole suite.
+        """
+        with self._lock, self._db:
+            if replace_all:
+                self._db.execute("DELETE FROM test_impact WHERE repo = ?", (repo,))
+            else:
+                self._db.executemany(
+                    "DELETE FROM test_impact WHERE repo = ? AND test_module = ?",
+                    [(repo, module) for module in executed],
+                )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO test_impact (repo, test_module, source_file) "
+                "VALUES (?, ?, ?)",
+                [
+                    (repo, module, source_file)
+                    for module, files in executed.items()
+                    for source_file in files
+                ],
+            )
+
+    def record_commit(self, repo: str, branch: str, sha: str, full_run: bool) -> None:
+        """Records that the tests of a commit passed, all of them if `full_run`."""
+        now = int(time.time() * 1000)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO test_impact_commits "
+                "(repo, branch, sha, full_run, recorded_at) VALUES (?, ?, ?, ?, ?)",
+                (repo, branch, sha, int(full_run), now),
+            )
+            # Keeps the most recent commits and the last full run, for `last_full_run`
+            self._db.execute(
+                "DELETE FROM test_impact_commits WHERE repo = ? AND branch = ? "
+                "AND sha NOT IN (SELECT sha FROM test_impact_commits "
+                "WHERE repo = ? AND branch = ? "
+                "ORDER BY recorded_at DESC, rowid DESC LIMIT ?) "
+                "AND NOT (full_run = 1 AND recorded_at = (SELECT MAX(recorded_at) "
+                "FROM test_impact_commits "
+                "WHERE repo = ? AND branch = ? AND full_run = 1))",
+                (repo, branch, repo, branch, _COMMITS_PER_BRANCH, repo, branch),
+            )
+
+    def passed_commits(self, repo: str, branch: str) -> list[str]:
+        """Returns the commits of a branch whose tests passed, most recent first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT sha FROM test_impact_commits WHERE repo = ? AND branch = ? "
+                "ORDER BY recorded_at DESC, rowid DESC",
+                (repo, branch),
+            ).fetchall()
+        return [sha for (sha,) in rows]
+
+    def last_full_run(self, repo: str, branch: str) -> Optional[float]:
+        """Returns when all tests of a branch last passed, as a Unix timestamp."""
+        with self._lock:
+            (recorded_at,) = self._db.execute(
+                "SELECT MAX(recorded_at) FROM test_impact_commits "
+                "WHERE repo = ? AND branch = ? AND full_run = 1",
+                (repo, branch),
+            ).fetchone()
+        return recorded_at / 1000 if recorded_at is not None else None
+
+    def close(self) -> None:
+        """Closes the underlying database connection."""
+        with self._lock:
+            self._db.close()
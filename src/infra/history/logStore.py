@@ -0,0 +1,233 @@
+import gzip
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Iterator, Optional
+
+from src.models import LogEntry
+
+# Amount of uncompressed output stored in a single, independently decompressible chunk
+DEFAULT_CHUNK_SIZE = 256 * 1024
+
+# Suffix of the compressed output file next to a log's metadata file
+OUTPUT_SUFFIX = ".gz"
+
+
+@dataclass(frozen=True)
+class LogChunk:
+    """
+    Location of one chunk of build output.
+
+    Every chunk is a complete gzip member, so it can be decompressed without reading
+    the rest of the output file.
+
+    Attributes:
+        offset (int): Offset of the chunk in the uncompressed output.
+        size (int): Uncompressed size of the chunk.
+        compressed_offset (int): Offset of the chunk in the compressed output file.
+        compressed_size (int): Compressed size of the chunk.
+    """
+
+    offset: int
+    size: int
+    compressed_offset: int
+    compressed_size: int
+
+
+class ChunkedLogWriter:
+    """
+    Writes build output as a sequence of independently compressed gzip members.
+
+    The resulting file is a valid multi-member gzip file, so it can also be read as a
+    whole with standard tools such as `zcat`.
+    """
+
+    def __init__(
+        self, path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, compresslevel: int = 6
+    ) -> None:
+        self.chunk_size = chunk_size
+        self.compresslevel = compresslevel
+        # Stays open while chunks are written, closed by `close`
+        self._file: BinaryIO = open(path, "wb")  # noqa: SIM115
+        self._buffer = bytearray()
+        self._chunks: list[LogChunk] = []
+        self._offset = 0
+        self._compressed_offset = 0
+
+    def write(self, data: bytes) -> None:
+        """Appends uncompressed output."""
+        self._buffer += data
+        while len(self._buffer) >= self.chunk_size:
+            self._flush_chunk(bytes(self._buffer[: self.chunk_size]))
+            del self._buffer[: self.chunk_size]
+
+    def close(self) -> list[LogChunk]:
+        """
+        Compresses the remaining output and closes the file.
+
+        Returns:
+            list[LogChunk]: Index of all chunks written.
+        """
+        if self._buffer:
+            self._flush_chunk(bytes(self._buffer))
+            self._buffer.clear()
+        self._file.close()
+        return self._chunks
+
+    def _flush_chunk(self, chunk: bytes) -> None:
+        # mtime=0 keeps the output deterministic
+        compressed = gzip.compress(chunk, compresslevel=self.compresslevel, mtime=0)
+        self._file.write(compressed)
+        self._chunks.append(
+            LogChunk(
+                offset=self._offset,
+                size=len(chunk),
+                compressed_offset=self._compressed_offset,
+                compressed_size=len(compressed),
+            )
+        )
+        self._offset += len(chunk)
+        self._compressed_offset += len(compressed)
+
+
+class ChunkedLogReader:
+    """
+    Reads ranges of build output written by `ChunkedLogWriter`, decompressing only the
+    chunks that overlap the requested range.
+    """
+
+    def __init__(self, path: str, chunks: list[LogChunk]) -> None:
+        self.path = path
+        self.chunks = chunks
+
+    @property
+    def size(self) -> int:
+        """Uncompressed size of the output."""
+        if not self.chunks:
+            return 0
+        last = self.chunks[-1]
+        return last.offset + last.size
+
+    def iter_range(
+        self, offset: int = 0, limit: Optional[int] = None
+    ) -> Iterator[bytes]:
+        """
+        Yields the uncompressed output from `offset`, chunk by chunk.
+
+        Args:
+            offset: Offset in the uncompressed output to start at.
+            limit: Maximum number of bytes to yield, defaults to the rest of the output.
+        """
+        end = self.size if limit is None else min(self.size, offset + limit)
+        if offset >= end:
+            return
+
+        with open(self.path, "rb") as f:
+            for chunk in self.chunks:
+                if chunk.offset + chunk.size <= offset:
+                    continue
+                if chunk.offset >= end:
+                    break
+
+                f.seek(chunk.compressed_offset)
+                data = gzip.decompress(f.read(chunk.compressed_size))
+                yield data[max(offset - chunk.offset, 0) : end - chunk.offset]
+
+    def read(self, offset: int = 0, limit: Optional[int] = None) -> bytes:
+        """Returns the uncompressed output in the given range."""
+        return b"".join(self.iter_range(offset, limit))
+
+
+class LogStore:
+    """
+    Stores build logs as a small JSON metadata file and a separate compressed output
+    file.
+
+    The metadata file keeps the name returned by `LogEntry.generate_log_file_name` and
+    contains the same fields as the JSON serialisation of a `LogEntry`, except that the
+    output is replaced by a reference to the compressed output file and its chunk index.
+    Logs written before this format existed, with the output inlined into the JSON
+    document, can still be read.
+    """
+
+    def __init__(self, log_dir: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+        self.log_dir = log_dir
+        self.chunk_size = chunk_size
+
+    def save(self, entry: LogEntry) -> str:
+        """
+        Writes the log entry to the store, streaming its output from `entry.output_path`
+        if set.
+
+        Returns:
+            str: Filename of the log's metadata file.
+        """
+        os.makedirs(self.log_dir, exist_ok=True)
+        filename = entry.generate_log_file_name()
+        output_file = filename + OUTPUT_SUFFIX
+
+        # Write the output atomically too, so it is never left truncated by a crash
+        output_path = os.path.join(self.log_dir, output_file)
+        writer = ChunkedLogWriter(output_path + ".tmp", chunk_size=self.chunk_size)
+        if entry.output_path is not None:
+            with open(entry.output_path, "rb") as output:
+                for data in iter(lambda: output.read(self.chunk_size), b""):
+                    writer.write(data)
+        else:
+            writer.write(entry.gradle_output.encode())
+        chunks = writer.close()
+        os.replace(output_path + ".tmp", output_path)
+
+        metadata = entry.to_metadata()
+        metadata["output"] = {
+            "file": output_file,
+            "size": sum(c.size for c in chunks),
+            "chunks": [
+                [c.offset, c.size, c.compressed_offset, c.compressed_size]
+                for c in chunks
+            ],
+        }
+
+        # Write the metadata last and atomically, so it never references missing output
+        path = os.path.join(self.log_dir, filename)
+        with open(path + ".tmp", "w") as f:
+            json.dump(metadata, f)
+        os.replace(path + ".tmp", path)
+
+        return filename
+
+    def path_for(self, filename: str) -> Optional[str]:
+        """
+        Returns the path of a log file in the store, or None if the name is not a plain
+        filename or the file does not exist.
+        """
+        if os.path.basename(filename) != filename or filename.startswith("."):
+            return None
+        path = os.path.join(self.log_dir, filename)
+        return path if os.path.isfile(path) else None
+
+    def metadata(self, filename: str) -> Optional[dict[str, Any]]:
+        """
+        Returns the metadata of a log, or None if the log does not exist or is not JSON.
+        For logs in the old format the metadata includes the inlined output.
+        """
+        path = self.path_for(filename)
+        if path is None:
+            return None
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return data if isinstance(data, dict) else None
+
+    def reader(self, metadata: dict[str, Any]) -> Optional[ChunkedLogReader]:
+        """
+        Returns a reader of the compressed output referenced by the metadata, or None for
+        logs in the old format.
+        """
+        output = metadata.get("output")
+        if not isinstance(output, dict):
+            return None
+        chunks = [LogChunk(*c) for c in output["chunks"]]
+        return ChunkedLogReader(os.path.join(self.log_dir, output["file"]), chunks)
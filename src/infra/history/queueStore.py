@@ -0,0 +1,134 @@
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+
+from src.models import BuildRef
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queued_builds (
+    id TEXT PRIMARY KEY,
+    repo TEXT NOT NULL,
+    ref TEXT NOT NULL,
+    sha TEXT NOT NULL,
+    installation_id INTEGER,
+    enqueued_at REAL NOT NULL,
+    running INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+@dataclass(frozen=True)
+class QueuedBuild:
+    """
+    A build that was accepted by the build queue and has not finished.
+
+    Attributes:
+        id (str): Identifier of the build's job.
+        ref (BuildRef): The commit to build.
+        enqueued_at (float): Unix timestamp of when the build was queued.
+        running (bool): Whether a worker had started the build.
+        attempts (int): Number of times a worker started the build.
+    """
+
+    id: str
+    ref: BuildRef
+    enqueued_at: float
+    running: bool = False
+    attempts: int = 0
+
+
+class BuildQueueStore:
+    """
+    SQLite backed record of the builds in the build queue, so they can be resumed after
+    the server stopped.
+
+    A build is added when it is queued, marked as running when a worker starts it and
+    removed once it finished or was superseded. The database runs in WAL mode with
+    `synchronous=NORMAL`: every change is committed before the call returns and survives
+    the process dying, only a power loss may lose the last changes. A change then costs
+    an append to the write-ahead log rather than a sync to disk, which keeps up with
+    hundreds of builds queued per second.
+    """
+
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        columns = [
+            row[1] for row in self._db.execute("PRAGMA table_info(queued_builds)")
+        ]
+        if "default_branch" not in columns:
+            self._db.execute("ALTER TABLE queued_builds ADD COLUMN default_branch TEXT")
+
+    def add(
+        self, build_id: str, ref: BuildRef, enqueued_at: float, attempts: int = 0
+    ) -> None:
+        """Records a queued build, replacing an earlier record with the same id."""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO queued_builds "
+                "(id, repo, ref, sha, installation_id, default_branch, enqueued_at, "
+                "running, attempts) VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?)",
+                (
+                    build_id,
+                    ref.repo,
+                    ref.ref,
+                    ref.sha,
+                    ref.installation_id,
+                    ref.default_branch,
+                    enqueued_at,
+                    attempts,
+                ),
+            )
+
+    def start(self, build_id: str) -> None:
+        """Records that a worker started a build."""
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE queued_builds SET running = 1, attempts = attempts + 1 "
+                "WHERE id = ?",
+                (build_id,),
+            )
+
+    def remove(self, build_id: str) -> None:
+        """Forgets a build that finished or will not be built."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM queued_builds WHERE id = ?", (build_id,))
+
+    def pending(self) -> list[QueuedBuild]:
+        """Returns the builds that were queued or running, oldest first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, repo, ref, sha, installation_id, default_branch, "
+                "enqueued_at, running, attempts FROM queued_builds "
+                "ORDER BY enqueued_at, id"
+            ).fetchall()
+        return [
+            QueuedBuild(
+                id=row[0],
+                ref=BuildRef(
+                    repo=row[1],
+                    ref=row[2],
+                    sha=row[3],
+                    installation_id=row[4],
+                    default_branch=row[5],
+                ),
+                enqueued_at=row[6],
+                running=bool(row[7]),
+                attempts=row[8],
+            )
+            for row in rows
+        ]
+
+    def close(self) -> None:
+        """Closes the underlying database connection."""
+        with self._lock:
+            self._db.close()
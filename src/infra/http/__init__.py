@@ -6,4 +6,4 @@ for easier mocking and testing of HTTP interactions.
 """
 
 from .httpClient import HttpClient
-from .requestsHttpClient import RequestsHttpClient
+from .requestsHttpClient import HttpPoolStats, RequestsHttpClient
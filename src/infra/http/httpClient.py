@@ -6,6 +6,13 @@ class HttpClient(Protocol):
     Generic interface for making HTTP requests.
     """
 
+    def get(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> Any: ...
+
     def post(
         self,
         url: str,
@@ -14,4 +21,12 @@ class HttpClient(Protocol):
         **kwargs: Any,
     ) -> Any: ...
 
-    # More HTTP methods (get, put, delete, etc.) can be added as needed.
+    def patch(
+        self,
+        url: str,
+        data: Optional[Dict[str, Any]] = None,
+        json: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> Any: ...
+
+    # More HTTP methods (put, delete, etc.) can be added as needed.
@@ -1,15 +1,61 @@
+from dataclasses import dataclass
 from typing import Any, Dict, Optional
 from .httpClient import HttpClient
 import requests
+from requests.adapters import HTTPAdapter
 
 unkownDict = Optional[Dict[str, Any]]
 
 
+@dataclass(frozen=True)
+class HttpPoolStats:
+    """
+    Snapshot of the connection pools of a `RequestsHttpClient`.
+
+    Attributes:
+        requests (int): Number of requests sent since the client was created.
+        connections_opened (int): Number of TCP/TLS connections opened for them.
+        reused_connections (int): Number of requests sent over an open connection.
+        hosts (int): Number of hosts with a connection pool.
+    """
+
+    requests: int
+    connections_opened: int
+    reused_connections: int
+    hosts: int
+
+
 class RequestsHttpClient(HttpClient):
     """
     Concrete implementation of HttpClient using the requests library.
+
+    All requests go through a single `requests.Session`, which keeps connections alive
+    in a pool per host, so consecutive calls to the same API reuse the TCP and TLS
+    connection instead of opening a new one for every request.
+
+    Args:
+        pool_connections (int): Number of hosts to keep connection pools for.
+        pool_maxsize (int): Maximum number of idle connections kept open per host. Should
+            be at least the number of threads sending requests concurrently, otherwise
+            surplus connections are closed after use.
     """
 
+    def __init__(self, pool_connections: int = 4, pool_maxsize: int = 10) -> None:
+        self._adapter = HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+        self._session = requests.Session()
+        self._session.mount("https://", self._adapter)
+        self._session.mount("http://", self._adapter)
+
+    def get(
+        self,
+        url: str,
+        params: unkownDict = None,
+        **kwargs: Any,
+    ) -> Any:
+        return self._session.get(url, params=params, **kwargs)
+
     def post(
         self,
         url: str,
@@ -17,4 +63,43 @@ class RequestsHttpClient(HttpClient):
         json: unkownDict = None,
         **kwargs: Any,
     ) -> Any:
-        return requests.post(url, data=data, json=json, **kwargs)
+        return self._session.post(url, data=data, json=json, **kwargs)
+
+    def patch(
+        self,
+        url: str,
+        data: unkownDict = None,
+        json: unkownDict = None,
+        **kwargs: Any,
+    ) -> Any:
+        return self._session.patch(url, data=data, json=json, **kwargs)
+
+    def stats(self) -> HttpPoolStats:
+        """
+        Returns how many requests were sent and how many connections they needed.
+
+        Counts only cover hosts that still have a pool, at most `pool_connections`.
+        """
+        pools = self._adapter.poolmanager.pools
+        total_requests = 0
+        total_connections = 0
+        hosts = 0
+        # The pool container cannot be iterated, `keys` copies the keys under its lock
+        hosts_with_pools = pools.keys()
+        for key in hosts_with_pools:
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            hosts += 1
+            total_requests += pool.num_requests
+            total_connections += pool.num_connections
+        return HttpPoolStats(
+            requests=total_requests,
+            connections_opened=total_connections,
+            reused_connections=max(total_requests - total_connections, 0),
+            hosts=hosts,
+        )
+
+    def close(self) -> None:
+        """Closes all pooled connections."""
+        self._session.close()
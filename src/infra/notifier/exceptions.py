@@ -1,6 +1,22 @@
+from typing import Optional
+
+
 class TransportError(RuntimeError):
     """
     Raised when a transport error occurs while sending a notification.
+
+    Attributes:
+        retryable: Whether sending the same notification again may succeed, e.g. after a
+            network error, a server error or a rate limit.
+        retry_after: Seconds to wait before the next attempt, if the server asked for it.
     """
 
-    pass
+    def __init__(
+        self,
+        message: str = "",
+        retryable: bool = True,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
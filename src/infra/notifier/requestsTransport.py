@@ -1,10 +1,14 @@
-from typing import Any, Dict, Optional
+import time
+from typing import Any, Dict, Mapping, Optional
 from src.infra.githubAuth.githubAuth import GithubAuth, GithubAuthContext
 from src.infra.http.httpClient import HttpClient
 from src.infra.http.requestsHttpClient import RequestsHttpClient
 from .github import GithubNotificationTransport
 from .exceptions import TransportError
 
+# Seconds to wait for GitHub to respond, notifications are retried on timeouts
+_TIMEOUT = 10
+
 
 class GithubRequestsTransport(GithubNotificationTransport):
     """HTTP transport for sending build status notifications to GitHub.
@@ -31,7 +35,8 @@ class GithubRequestsTransport(GithubNotificationTransport):
             ctx: GitHub authentication context.
 
         Raises:
-            TransportError: If the API request fails.
+            TransportError: If the API request fails. Rate limits and server errors are
+                marked as retryable, with the delay GitHub asked for if any.
         """
         url = f"https://api.github.com/repos/{repo}/statuses/{sha}"
 
@@ -42,11 +47,39 @@ class GithubRequestsTransport(GithubNotificationTransport):
         }
 
         try:
-            response = self._client.post(url, json=payload, headers=headers, timeout=50)
+            response = self._client.post(
+                url, json=payload, headers=headers, timeout=_TIMEOUT
+            )
         except Exception as e:
             raise TransportError(f"Failed to create commit status: {str(e)}") from e
 
         if not response.ok:
+            retry_after = _retry_after(response.headers)
             raise TransportError(
-                f"Failed to create commit status: {response.status_code} {response.text}"
+                f"Failed to create commit status: {response.status_code} {response.text}",
+                retryable=response.status_code >= 500
+                or response.status_code == 429
+                or retry_after is not None,
+                retry_after=retry_after,
             )
+
+
+def _retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """
+    Returns the delay GitHub asks for in a rate limited response, or None.
+
+    See https://docs.github.com/en/rest/using-the-rest-api/rate-limits-for-the-rest-api
+    """
+    retry_after = headers.get("Retry-After")
+    if retry_after is not None:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            return None
+
+    if headers.get("X-RateLimit-Remaining") == "0":
+        try:
+            return max(float(headers["X-RateLimit-Reset"]) - time.time(), 0.0)
+        except (KeyError, ValueError):
+            return None
+    return None
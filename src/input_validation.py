@@ -1,3 +1,5 @@
+import hashlib
+import hmac
 from functools import wraps
 from typing import Optional, ParamSpec, Tuple, Callable, TypeVar
 from src.infra.githubAuth.appAuth import GithubAppAuth
@@ -5,6 +7,7 @@ from pydantic import BaseModel
 from flask import request, jsonify, Response
 
 from src.infra.githubAuth.githubAuth import GithubAuth
+from src.infra.history.deliveryJournal import DeliveryJournal
 from src.models import BuildRef
 
 
@@ -14,6 +17,7 @@ class RepositoryPayload(BaseModel):
     """
 
     full_name: str
+    default_branch: Optional[str] = None
 
 
 class InstallationPayload(BaseModel):
@@ -37,21 +41,45 @@ class WebhookPayload(BaseModel):
     """
     Pydantic model for all the relevant information from the GitHub webhook payload
     that is needed for processing.
+
+    `head_commit` is null when a push deletes a branch.
     """
 
     repository: RepositoryPayload
-    head_commit: HeadCommitPayload
+    head_commit: Optional[HeadCommitPayload]
     ref: str
     installation: Optional[InstallationPayload] = None
+    deleted: bool = False
 
 
 FlaskResponse = Tuple[Response, int]
 WebhookHandler = Callable[[BuildRef], FlaskResponse]
 InputValidator = Callable[[], FlaskResponse]
 
+# Default limit of the size of webhook bodies, GitHub caps payloads at 25 MB
+MAX_BODY_BYTES = 5 * 1024 * 1024
+
+
+def verify_signature(secret: str, body: bytes, header: Optional[str]) -> bool:
+    """
+    Checks the `X-Hub-Signature-256` header GitHub signs webhook deliveries with.
+
+    Args:
+        secret: The webhook secret configured for the app or repository.
+        body: The raw request body, exactly as received.
+        header: Value of the header, "sha256=" followed by the hex digest.
+    """
+    if header is None:
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(header.encode(), f"sha256={expected}".encode())
+
 
 def webhook_validation_factory(
     auth_handler: GithubAuth,
+    secret: Optional[str] = None,
+    max_body_bytes: int = MAX_BODY_BYTES,
+    journal: Optional[DeliveryJournal] = None,
 ) -> Callable[[WebhookHandler], InputValidator]:
     """
     Factory wrapper for validating incoming GitHub webhook payloads and extracting necessary information
@@ -60,6 +88,17 @@ def webhook_validation_factory(
     must include installation information, while for PAT authentication, this is not required. The factory
     ensures that the payload is correctly parsed and validated according to the expected structure.
 
+    Cheap checks run before the payload is parsed, so junk requests are turned away early:
+    bodies larger than `max_body_bytes` are rejected with 413 without reading them, and with a
+    `secret` set, requests whose `X-Hub-Signature-256` does not match the raw body are rejected
+    with 401. Events other than pushes, as told by the `X-GitHub-Event` header, and pushes
+    deleting a branch are acknowledged with 200 without building anything.
+
+    With a `journal`, every delivery is recorded under its `X-GitHub-Delivery` id once it
+    passed validation, and redeliveries of a recorded delivery are acknowledged with 200
+    without calling the handler. If the handler rejects the delivery with an error status,
+    the record is dropped again, so a later redelivery is retried.
+
     The returned decorator can be applied to a webhook handler function that takes a `BuildRef` as input and
     returns a Flask response.
     """
@@ -67,9 +106,30 @@ def webhook_validation_factory(
     def decorator(f: WebhookHandler) -> InputValidator:
         @wraps(f)
         def wrapper() -> FlaskResponse:
+            length = request.content_length
+            if length is not None and length > max_body_bytes:
+                return _too_large(max_body_bytes)
+            raw = request.stream.read(max_body_bytes + 1)
+            if len(raw) > max_body_bytes:
+                return _too_large(max_body_bytes)
+
+            if secret is not None and not verify_signature(
+                secret, raw, request.headers.get("X-Hub-Signature-256")
+            ):
+                print("[ERROR] Rejected webhook with a missing or invalid signature")
+                return jsonify({"error": "Invalid signature"}), 401
+
+            # Deliveries without the header, e.g. from scripts, are treated as pushes
+            event = request.headers.get("X-GitHub-Event", "push")
+            if event != "push":
+                return _ignored(f"{event} events are not built")
+
+            delivery = request.headers.get("X-GitHub-Delivery")
+            if journal is not None and delivery is not None and delivery in journal:
+                return _duplicate(delivery)
+
             try:
-                payload = request.get_json(silent=True) or {}
-                body = WebhookPayload.model_validate(payload)
+                body = WebhookPayload.model_validate_json(raw)
             except Exception as exc:
                 print(f"[ERROR] Failed to parse webhook payload: {exc}")
                 return (
@@ -95,15 +155,45 @@ def webhook_validation_factory(
                     422,
                 )
 
+            if body.deleted or body.head_commit is None:
+                return _ignored(f"{body.ref} was deleted")
+
             ref = BuildRef(
                 repo=body.repository.full_name,
                 ref=body.ref,
                 sha=body.head_commit.id,
                 installation_id=body.installation.id if body.installation else None,
+                default_branch=body.repository.default_branch,
             )
 
-            return f(ref)
+            if journal is None or delivery is None:
+                return f(ref)
+            # Checked again, the same delivery may have been validated concurrently
+            if not journal.accept(delivery, ref):
+                return _duplicate(delivery)
+            try:
+                response, status = f(ref)
+            except BaseException:
+                journal.drop(delivery)
+                raise
+            if status >= 400:
+                journal.drop(delivery)
+            return response, status
 
         return wrapper
 
     return decorator
+
+
+def _too_large(max_body_bytes: int) -> FlaskResponse:
+    print(f"[ERROR] Rejected webhook larger than {max_body_bytes} bytes")
+    return jsonify({"error": f"Payload larger than {max_body_bytes} bytes"}), 413
+
+
+def _ignored(reason: str) -> FlaskResponse:
+    return jsonify({"received": True, "ignored": reason}), 200
+
+
+def _duplicate(delivery: str) -> FlaskResponse:
+    print(f"[LOG] Ignoring redelivery of webhook {delivery}")
+    return jsonify({"received": True, "duplicate": True}), 200
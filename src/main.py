@@ -1,64 +1,114 @@
+import asyncio
+import time
+from dataclasses import asdict, replace
 from functools import wraps
-from typing import Callable, Tuple
-from flask import Flask, Response, jsonify
+from typing import Awaitable, Callable, Optional, Tuple
+from flask import Flask, Response, jsonify, request
 from datetime import datetime
 from src.adapters.notifier.github import GithubNotifier
+from src.adapters.notifier.queued import QueuedNotifier
 
 from src.auth import create_github_auth
-from src.builder import build_project
-from src.infra.githubAuth.githubAuth import GithubAuthContext
+from src.build_log import BuildLog, LiveLogRegistry
+from src.build_queue import (
+    AsyncBuildQueue,
+    BuildJob,
+    BuildQueue,
+    QueueFull,
+    superseded_report,
+)
+from src.builder import (
+    BuildOptions,
+    build_config_hash,
+    build_project,
+    build_project_async,
+)
+from src.config import load_server_config
+from src.coordinator import AgentPool, agent_blueprint
+from src.infra.history.deliveryJournal import DeliveryJournal
+from src.infra.history.historyStore import BuildHistoryStore, HistoryRecord
+from src.infra.history.queueStore import BuildQueueStore
+from src.infra.http.requestsHttpClient import RequestsHttpClient
 from src.infra.notifier.requestsTransport import GithubRequestsTransport
 from src.input_validation import webhook_validation_factory
+from src.metrics import BuildMetrics, Counter, Gauge, MetricsRegistry
 from src.models import BuildRef, BuildReport, BuildStatus, LogType, LogEntry
-from src.ports.notifier import NotificationStatus
+from src.ports.notifier import NotificationStatus, Notifier
+from src.scheduler import AdmissionPolicy, Priorities
 from src.view_history import list_logs, view_log, save_log_to_file
 
 
 FlaskResponse = Tuple[Response, int]
-NotifierMiddleware = Callable[[BuildRef], FlaskResponse]
-CiHandler = Callable[[BuildRef], BuildReport]
+
+# Directory holding the output of builds while they are running
+LIVE_LOG_DIR = "temp_builds/live"
+# Seconds GitHub or other senders are asked to wait before retrying a rejected webhook
+RETRY_AFTER = 30
+CiHandler = Callable[[BuildJob], BuildReport]
+AsyncCiHandler = Callable[[BuildJob], Awaitable[BuildReport]]
+
+
+def _notify(notifier: Notifier, ref: BuildRef, report: BuildReport) -> None:
+    res = notifier.notify(ref, report)
+    if res.status == NotificationStatus.FAILED:
+        print(
+            f"[ERROR] Failed to send notification: \n\tPayload: {report}\n\tError:{res.message}"
+        )
 
 
 def notifier_middleware_factory(
-    notifier: GithubNotifier,
-) -> Callable[[CiHandler], NotifierMiddleware]:
+    notifier: Notifier,
+) -> Callable[[CiHandler], CiHandler]:
     """
     Middleware factory for creating a notifier middleware that sends notifications before and after
     the CI handler is executed.
 
     The middleware sends a "pending" notification before the CI handler is executed, and then sends
     success or failure notifications based on the result of the CI handler. If sending a notification fails,
+    the error is logged and the build carries on. Queued notifiers report failures themselves once
+    they give up retrying. The wrapped handler is run by the build queue workers,
+    so notifications are sent from the worker thread rather than the request thread.
     """
 
-    def notify_middleware(f: CiHandler) -> NotifierMiddleware:
+    def notify_middleware(f: CiHandler) -> CiHandler:
         @wraps(f)
-        def middleware(ref: BuildRef) -> FlaskResponse:
+        def middleware(job: BuildJob) -> BuildReport:
+            ref = job.ref
             pending_report = BuildReport(
                 state=BuildStatus.PENDING,
                 description="Build is pending",
             )
 
-            res = notifier.notify(ref, pending_report)
-            if res.status != NotificationStatus.SENT:
-                print(
-                    f"[ERROR] Failed to send notification: \n\tPayload: {pending_report}\n\tError:{res.message}"
-                )
+            _notify(notifier, ref, pending_report)
+            report = f(job)
+            _notify(notifier, ref, report)
+            return report
 
-            report = f(ref)
+        return middleware
 
-            res = notifier.notify(ref, report)
-            if res.status != NotificationStatus.SENT:
-                print(
-                    f"[ERROR] Failed to send notification: \n\tPayload: {report}\n\tError:{res.message}"
-                )
+    return notify_middleware
 
-            return jsonify(
-                {
-                    "received": True,
-                    "repo": ref.repo,
-                    "sha": ref.sha,
-                }
-            ), 201
+
+def async_notifier_middleware_factory(
+    notifier: Notifier,
+) -> Callable[[AsyncCiHandler], AsyncCiHandler]:
+    """
+    Variant of `notifier_middleware_factory` for CI handlers that are coroutine functions.
+
+    The notifier is called on the event loop, so it must not block, e.g. a `QueuedNotifier`.
+    """
+
+    def notify_middleware(f: AsyncCiHandler) -> AsyncCiHandler:
+        @wraps(f)
+        async def middleware(job: BuildJob) -> BuildReport:
+            pending_report = BuildReport(
+                state=BuildStatus.PENDING,
+                description="Build is pending",
+            )
+            _notify(notifier, job.ref, pending_report)
+            report = await f(job)
+            _notify(notifier, job.ref, report)
+            return report
 
         return middleware
 
@@ -74,20 +124,83 @@ def create_app() -> Flask:
     """
     app = Flask(__name__)
 
-    AUTH_HANDLER = create_github_auth()
-    NOTIFICATION_TRANSPORT = GithubRequestsTransport(AUTH_HANDLER)
-    NOTIFICATION_HANDLER = GithubNotifier(NOTIFICATION_TRANSPORT)
+    CONFIG = load_server_config()
+    # Shared by all GitHub API calls, so they reuse pooled keep-alive connections
+    HTTP_CLIENT = RequestsHttpClient(pool_maxsize=CONFIG.http_pool_size)
+    AUTH_HANDLER = create_github_auth(HTTP_CLIENT)
+    NOTIFICATION_TRANSPORT = GithubRequestsTransport(AUTH_HANDLER, HTTP_CLIENT)
+    NOTIFICATION_HANDLER = QueuedNotifier(GithubNotifier(NOTIFICATION_TRANSPORT))
+    BUILD_OPTIONS = BuildOptions.from_config(CONFIG)
 
-    @app.route("/webhook", methods=["POST"])
-    @webhook_validation_factory(AUTH_HANDLER)
-    @notifier_middleware_factory(NOTIFICATION_HANDLER)
-    def webhook(ref: BuildRef) -> BuildReport:
-        # Stable clone URL with token authentication for GitHub
-        # Allows cloning even private repositories
-        clone_url = f"https://x-access-token:{
-            AUTH_HANDLER.get_token(GithubAuthContext(ref.installation_id))
-        }@github.com/{ref.repo}.git"
-        report, log_str_gradle = build_project(ref.clone_url, ref.branch, ref.sha)
+    # With an agent token set, builds are dispatched to build agents
+    AGENT_POOL: Optional[AgentPool] = None
+    if CONFIG.agent_token is not None:
+        AGENT_POOL = AgentPool(agent_timeout=CONFIG.agent_timeout)
+        app.register_blueprint(agent_blueprint(AGENT_POOL, CONFIG.agent_token))
+    # Builds dispatched to agents use the agents' resources, not the server's
+    ADMISSION_POLICY = (
+        AdmissionPolicy.for_host(
+            cpus_per_build=CONFIG.build_cpus,
+            memory_mb_per_build=CONFIG.build_memory_mb,
+            max_per_repo=CONFIG.max_builds_per_repo or None,
+            max_per_installation=CONFIG.max_builds_per_installation or None,
+        )
+        if AGENT_POOL is None
+        else AdmissionPolicy(
+            max_per_repo=CONFIG.max_builds_per_repo or None,
+            max_per_installation=CONFIG.max_builds_per_installation or None,
+        )
+    )
+    PRIORITIES = Priorities.parse(
+        CONFIG.priority_classes, aging=CONFIG.priority_aging or None
+    )
+    LIVE_LOGS = LiveLogRegistry(LIVE_LOG_DIR)
+    HISTORY = BuildHistoryStore(CONFIG.history_db)
+    DELIVERIES = (
+        DeliveryJournal(
+            CONFIG.delivery_journal, ttl=CONFIG.delivery_ttl_hours * 60 * 60
+        )
+        if CONFIG.delivery_journal is not None
+        else None
+    )
+    QUEUE_STORE = (
+        BuildQueueStore(CONFIG.queue_db) if CONFIG.queue_db is not None else None
+    )
+    if HISTORY.is_empty():
+        HISTORY.import_log_directory("logs")
+    METRICS = MetricsRegistry()
+    BUILD_METRICS = BuildMetrics(METRICS)
+    BUILD_CONFIG_HASH = build_config_hash()
+
+    def log_url(filename: str) -> Optional[str]:
+        if CONFIG.public_url is None:
+            return None
+        return f"{CONFIG.public_url}/logs/{filename}"
+
+    def cached_report(record: HistoryRecord) -> BuildReport:
+        succeeded = record.status == BuildStatus.SUCCESS
+        outcome = "Build succeeded" if succeeded else "Build failed"
+        return BuildReport(
+            state=record.status,
+            target_url=log_url(record.log_file),
+            description=f"{outcome} (result of an earlier build of this commit)",
+        )
+
+    def reused_result(job: BuildJob) -> Optional[BuildReport]:
+        if not CONFIG.reuse_build_results:
+            return None
+        cached = HISTORY.find_result(job.ref.repo, job.ref.sha, BUILD_CONFIG_HASH)
+        if cached is None:
+            return None
+        print(f"[LOG] Reusing result of build {cached.id} for {job.ref.sha}")
+        return cached_report(cached)
+
+    def record_build(
+        job: BuildJob, report: BuildReport, build_log: BuildLog, started_at: float
+    ) -> BuildReport:
+        ref = job.ref
+        if report.state == BuildStatus.ERROR and job.cancelled.is_set():
+            report = superseded_report(job)
 
         log_entry = LogEntry(
             type=LogType.INFO if report.state == BuildStatus.SUCCESS else LogType.ERROR,
@@ -96,12 +209,309 @@ def create_app() -> Flask:
             commit_SHA=ref.sha,
             date_time=datetime.now(),
             status=report.state,
-            gradle_output=log_str_gradle,
+            gradle_output=build_log.tail(),
+            output_path=build_log.path,
+            duration=time.monotonic() - started_at,
+            first_failure_offset=build_log.first_failure_offset,
+            timeline=build_log.timeline,
+            config_hash=BUILD_CONFIG_HASH,
+            build_id=job.id,
+        )
+        report = replace(
+            report, target_url=log_url(save_log_to_file(log_entry, HISTORY))
+        )
+        BUILD_METRICS.observe_build(
+            ref.repo, report, log_entry.duration or 0.0, log_entry.timeline
         )
-        save_log_to_file(log_entry)
-
         return report
 
+    @notifier_middleware_factory(NOTIFICATION_HANDLER)
+    def run_build(job: BuildJob) -> BuildReport:
+        ref = job.ref
+        BUILD_METRICS.observe_wait(job.priority, job.wait_time or 0.0)
+        reused = reused_result(job)
+        if reused is not None:
+            return reused
+
+        build_log = LIVE_LOGS.create(job.id)
+        started_at = time.monotonic()
+        try:
+            if AGENT_POOL is not None:
+                report = AGENT_POOL.run(job, build_log)
+            else:
+                report, _ = build_project(
+                    ref.clone_url,
+                    ref.branch,
+                    ref.sha,
+                    BUILD_OPTIONS,
+                    build_log,
+                    cancel=job.cancelled,
+                )
+            return record_build(job, report, build_log, started_at)
+        finally:
+            LIVE_LOGS.remove(job.id)
+
+    @async_notifier_middleware_factory(NOTIFICATION_HANDLER)
+    async def run_build_async(job: BuildJob) -> BuildReport:
+        ref = job.ref
+        BUILD_METRICS.observe_wait(job.priority, job.wait_time or 0.0)
+        # Blocking database calls run in a worker thread, off the loop
+        reused = await asyncio.to_thread(reused_result, job)
+        if reused is not None:
+            return reused
+
+        build_log = LIVE_LOGS.create(job.id)
+        started_at = time.monotonic()
+        try:
+            if AGENT_POOL is not None:
+                report = await asyncio.to_thread(AGENT_POOL.run, job, build_log)
+            else:
+                report, _ = await build_project_async(
+                    ref.clone_url,
+                    ref.branch,
+                    ref.sha,
+                    BUILD_OPTIONS,
+                    build_log,
+                    cancel=job.cancelled,
+                )
+            return await asyncio.to_thread(
+                record_build, job, report, build_log, started_at
+            )
+        finally:
+            LIVE_LOGS.remove(job.id)
+
+    def finish_delivery(job: BuildJob) -> None:
+        if DELIVERIES is not None:
+            DELIVERIES.finish(job.ref.repo, job.ref.sha)
+
+    def run_journaled_build(job: BuildJob) -> BuildReport:
+        try:
+            return run_build(job)
+        finally:
+            finish_delivery(job)
+
+    async def run_journaled_build_async(job: BuildJob) -> BuildReport:
+        try:
+            return await run_build_async(job)
+        finally:
+            await asyncio.to_thread(finish_delivery, job)
+
+    def notify_superseded(job: BuildJob) -> None:
+        assert job.report is not None
+        _notify(NOTIFICATION_HANDLER, job.ref, job.report)
+        finish_delivery(job)
+
+    def resume_builds() -> None:
+        assert QUEUE_STORE is not None
+        for build in QUEUE_STORE.pending():
+            if build.running and build.attempts >= CONFIG.build_attempts:
+                # Restarting the build may well interrupt the server again
+                print(f"[ERROR] Build {build.id} was interrupted by a server restart")
+                _notify(
+                    NOTIFICATION_HANDLER,
+                    build.ref,
+                    BuildReport(
+                        state=BuildStatus.ERROR,
+                        description="Build interrupted by a server restart",
+                    ),
+                )
+                QUEUE_STORE.remove(build.id)
+                if DELIVERIES is not None:
+                    DELIVERIES.finish(build.ref.repo, build.ref.sha)
+                continue
+            print(
+                f"[LOG] Resuming build {build.id} of {build.ref.repo}@{build.ref.sha}"
+            )
+            BUILD_QUEUE.resume(build)
+
+    BUILD_QUEUE: BuildQueue | AsyncBuildQueue
+    if CONFIG.async_builds:
+        BUILD_QUEUE = AsyncBuildQueue(
+            run_journaled_build_async,
+            workers=CONFIG.build_workers,
+            coalesce=CONFIG.coalesce_builds,
+            cancel_running=CONFIG.cancel_superseded_builds,
+            on_superseded=notify_superseded,
+            policy=ADMISSION_POLICY,
+            max_queued=CONFIG.max_queued_builds or None,
+            max_queued_per_repo=CONFIG.max_queued_builds_per_repo or None,
+            store=QUEUE_STORE,
+            priorities=PRIORITIES,
+        )
+    else:
+        BUILD_QUEUE = BuildQueue(
+            run_journaled_build,
+            workers=CONFIG.build_workers,
+            coalesce=CONFIG.coalesce_builds,
+            cancel_running=CONFIG.cancel_superseded_builds,
+            on_superseded=notify_superseded,
+            policy=ADMISSION_POLICY,
+            max_queued=CONFIG.max_queued_builds or None,
+            max_queued_per_repo=CONFIG.max_queued_builds_per_repo or None,
+            store=QUEUE_STORE,
+            priorities=PRIORITIES,
+        )
+    BUILD_QUEUE.start()
+    if QUEUE_STORE is not None:
+        resume_builds()
+    if DELIVERIES is not None:
+        # Deliveries accepted before a restart whose builds never finished. Builds
+        # resumed from the queue's store are not queued twice, the queue answers their
+        # commits with the resumed job
+        for delivery in DELIVERIES.unfinished():
+            print(f"[LOG] Resuming build of webhook delivery {delivery.id}")
+            try:
+                BUILD_QUEUE.submit(delivery.ref)
+            except QueueFull as e:
+                print(f"[ERROR] Could not resume delivery {delivery.id}: {e}")
+    METRICS.register(
+        Gauge(
+            "ci_queue_depth",
+            "Number of builds waiting for a worker.",
+            lambda: BUILD_QUEUE.stats().depth,
+        )
+    )
+    METRICS.register(
+        Gauge(
+            "ci_queue_running",
+            "Number of builds currently running.",
+            lambda: BUILD_QUEUE.stats().running,
+        )
+    )
+    METRICS.register(
+        Gauge(
+            "ci_queue_max_wait_seconds",
+            "Longest time a build spent waiting in the queue.",
+            lambda: BUILD_QUEUE.stats().max_wait_time,
+        )
+    )
+    METRICS.register(
+        Gauge(
+            "ci_notifications_pending",
+            "Commit statuses waiting to be sent to GitHub.",
+            NOTIFICATION_HANDLER.pending,
+        )
+    )
+    if AGENT_POOL is not None:
+        METRICS.register(
+            Gauge(
+                "ci_agents",
+                "Build agents that are registered and alive.",
+                lambda: len(AGENT_POOL.agents()),
+            )
+        )
+        METRICS.register(
+            Gauge(
+                "ci_agent_queue_depth",
+                "Builds waiting for a free build agent.",
+                AGENT_POOL.queued,
+            )
+        )
+    METRICS.register(
+        Counter(
+            "ci_github_http_requests_total",
+            "Requests sent to the GitHub API.",
+            lambda: HTTP_CLIENT.stats().requests,
+        )
+    )
+    METRICS.register(
+        Counter(
+            "ci_github_http_connections_opened_total",
+            "Connections opened to the GitHub API.",
+            lambda: HTTP_CLIENT.stats().connections_opened,
+        )
+    )
+
+    @app.route("/webhook", methods=["POST"])
+    @webhook_validation_factory(
+        AUTH_HANDLER, CONFIG.webhook_secret, CONFIG.max_webhook_kb * 1024, DELIVERIES
+    )
+    def webhook(ref: BuildRef) -> FlaskResponse:
+        """
+        Accepts a validated webhook and queues a build for it.
+
+        Responds with 202 as soon as the build is queued, the build itself and its
+        commit statuses are handled by the build queue workers. While the queue is full
+        the webhook is rejected with 503, or with 429 if only the repository's share of
+        the queue is used up, and a Retry-After header.
+        """
+        try:
+            job = BUILD_QUEUE.submit(ref)
+        except QueueFull as e:
+            print(f"[ERROR] Rejected build of {ref.repo}@{ref.sha}: {e}")
+            response = jsonify({"error": str(e)})
+            response.headers["Retry-After"] = str(RETRY_AFTER)
+            return response, 429 if e.repo is not None else 503
+        return jsonify(
+            {
+                "received": True,
+                "repo": ref.repo,
+                "sha": ref.sha,
+                "build_id": job.id,
+            }
+        ), 202
+
+    @app.route("/queue")
+    def queue_stats() -> FlaskResponse:
+        """Exposes queue depth, wait times and per-worker utilisation of the build queue."""
+        return jsonify(asdict(BUILD_QUEUE.stats())), 200
+
+    @app.route("/queue/<build_id>")
+    def queue_job(build_id: str) -> FlaskResponse:
+        """
+        Looks up the progress of a queued build.
+
+        Args:
+            build_id (str): The id returned by the webhook endpoint.
+        """
+        job = BUILD_QUEUE.get(build_id)
+        if job is None:
+            return jsonify({"error": "Unknown build id"}), 404
+
+        return jsonify(
+            {
+                "build_id": job.id,
+                "repo": job.ref.repo,
+                "sha": job.ref.sha,
+                "state": job.state.value,
+                "wait_time": job.wait_time,
+                "report": asdict(job.report) if job.report is not None else None,
+            }
+        ), 200
+
+    @app.route("/logs/live/<build_id>")
+    def follow_log(build_id: str) -> Response | FlaskResponse:
+        """
+        Streams the output of a running build as it is produced, using chunked transfer encoding.
+
+        Clients that reconnect can pass the number of bytes they already received as the
+        `offset` query parameter to resume where they left off. The stream ends once the
+        build has finished.
+
+        Args:
+            build_id (str): The id returned by the webhook endpoint.
+        """
+        offset = request.args.get("offset", default=0, type=int)
+        log = LIVE_LOGS.get(build_id)
+        if log is None:
+            job = BUILD_QUEUE.get(build_id)
+            if job is None:
+                return jsonify({"error": "Unknown build id"}), 404
+            return jsonify(
+                {"error": "Build is not running", "state": job.state.value}
+            ), 409
+
+        return Response(
+            log.follow(offset=max(offset, 0)),
+            mimetype="text/plain",
+            headers={"X-Log-Offset": str(max(offset, 0))},
+        )
+
+    @app.route("/metrics")
+    def metrics() -> Response:
+        """Exposes build, step and queue metrics in the Prometheus text format."""
+        return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
     @app.route("/")
     def home() -> str:
         """Health check endpoint.
@@ -116,21 +526,24 @@ def create_app() -> Flask:
         """
         Route handler for the build history dashboard.
 
-        Triggers the retrieval of all log files and displays the summary list to the user.
+        Queries one page of the build history, optionally filtered by the request's query
+        parameters, and displays the summary list to the user.
         """
-        return list_logs()
+        return list_logs(HISTORY, request.args)
 
     @app.route("/logs/<filename>")
-    def view_log_page(filename: str) -> str:
+    def view_log_page(filename: str) -> Response | str:
         """
         Route handler for individual build details.
 
-        Fetches the specific log content based on the filename provided in the URL.
+        Fetches the specific log content based on the filename provided in the URL. Shows the
+        end of the log unless a range is requested with the `offset` and `limit` query
+        parameters, or the full log with `full=1`.
 
         Args:
             filename (str): The unique name of the log file to be displayed.
         """
-        return view_log(filename)
+        return view_log(filename, request.args)
 
     return app
 
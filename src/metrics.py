@@ -0,0 +1,203 @@
+import bisect
+import math
+import threading
+from typing import Callable, Sequence
+
+from src.models import BuildReport, StepTiming
+
+# Upper bounds of the duration histogram buckets in seconds
+DURATION_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+LabelValues = tuple[str, ...]
+
+
+class Histogram:
+    """
+    Prometheus style histogram with a fixed set of labels.
+
+    Observations are counted per combination of label values into cumulative buckets.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: Sequence[str],
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: dict[LabelValues, float] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """Records a single observation for the given label values."""
+        if len(label_values) != len(self.label_names):
+            raise ValueError(
+                f"{self.name} expects labels {self.label_names}, got {label_values}"
+            )
+
+        with self._lock:
+            # One count per bucket plus the implicit +Inf bucket
+            counts = self._counts.setdefault(
+                label_values, [0] * (len(self.buckets) + 1)
+            )
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sums[label_values] = self._sums.get(label_values, 0.0) + value
+
+    def render(self) -> list[str]:
+        """Returns the histogram in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            for label_values, counts in sorted(self._counts.items()):
+                labels = _format_labels(self.label_names, label_values)
+                cumulative = 0
+                for bound, count in zip((*self.buckets, math.inf), counts, strict=True):
+                    cumulative += count
+                    bucket_labels = _format_labels(
+                        (*self.label_names, "le"), (*label_values, _format_value(bound))
+                    )
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                total = _format_value(self._sums[label_values])
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Prometheus style gauge whose value is read from a callback at render time."""
+
+    TYPE = "gauge"
+
+    def __init__(self, name: str, description: str, read: Callable[[], float]) -> None:
+        self.name = name
+        self.description = description
+        self._read = read
+
+    def render(self) -> list[str]:
+        """Returns the gauge in the Prometheus text exposition format."""
+        return [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.TYPE}",
+            f"{self.name} {_format_value(self._read())}",
+        ]
+
+
+class Counter(Gauge):
+    """
+    Prometheus style counter whose value is read from a callback at render time.
+
+    The callback must return a value that only ever increases.
+    """
+
+    TYPE = "counter"
+
+
+class MetricsRegistry:
+    """Collection of metrics exposed together on the `/metrics` endpoint."""
+
+    def __init__(self) -> None:
+        self._metrics: list[Histogram | Gauge] = []
+
+    def register(self, metric: Histogram | Gauge) -> None:
+        """Adds a metric to the registry."""
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text exposition format."""
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+class BuildMetrics:
+    """
+    Histograms of build and step durations, labelled by repository, and of the time
+    builds waited in the queue, labelled by priority class.
+
+    The step histograms are fed from the timeline of each finished build, so slow or
+    CPU heavy steps can be compared across builds and repositories.
+    """
+
+    def __init__(self, registry: MetricsRegistry) -> None:
+        self.build_duration = Histogram(
+            "ci_build_duration_seconds",
+            "Wall-clock duration of builds.",
+            ("repo", "status"),
+        )
+        self.step_duration = Histogram(
+            "ci_build_step_duration_seconds",
+            "Wall-clock duration of build steps.",
+            ("repo", "step"),
+        )
+        self.step_cpu = Histogram(
+            "ci_build_step_cpu_seconds",
+            "User and system CPU time of build steps.",
+            ("repo", "step"),
+        )
+        self.step_max_rss = Histogram(
+            "ci_build_step_max_rss_bytes",
+            "Peak resident set size of build steps.",
+            ("repo", "step"),
+            buckets=tuple(2**i * 1024 * 1024 for i in range(4, 15)),
+        )
+        self.queue_wait = Histogram(
+            "ci_queue_wait_seconds",
+            "Time builds waited in the queue before they started.",
+            ("priority",),
+        )
+        for metric in (
+            self.build_duration,
+            self.step_duration,
+            self.step_cpu,
+            self.step_max_rss,
+            self.queue_wait,
+        ):
+            registry.register(metric)
+
+    def observe_build(
+        self,
+        repo: str,
+        report: BuildReport,
+        duration: float,
+        timeline: Sequence[StepTiming],
+    ) -> None:
+        """Records a finished build and all of its steps."""
+        self.build_duration.observe(duration, repo, report.state.value)
+        for step in timeline:
+            self.step_duration.observe(step.duration, repo, step.name)
+            self.step_cpu.observe(step.cpu_user + step.cpu_system, repo, step.name)
+            if step.exit_code is not None:
+                self.step_max_rss.observe(step.max_rss_kb * 1024, repo, step.name)
+
+    def observe_wait(self, priority: str, wait_time: float) -> None:
+        """Records the time a build of the given priority class waited to start."""
+        self.queue_wait.observe(wait_time, priority)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
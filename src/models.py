@@ -1,7 +1,8 @@
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass, field
 from enum import Enum
 import json
 from datetime import datetime
+from typing import Any, Optional
 
 
 @dataclass(frozen=True)
@@ -17,6 +18,8 @@ class BuildRef:
         sha (str):  The full commit SHA of the commit to build.
         installation_id (Optional[int]): The GitHub App installation ID if the event was triggered by a
                         GitHub App installation.
+        default_branch (Optional[str]): The repository's default branch (e.g., "main"), if the
+                        webhook payload named it.
 
     Source: https://gist.github.com/walkingtospace/0dcfe43116ca6481f129cdaa0e112dc4
     Note:   The github documentation does not specify the exact format of the repository
@@ -27,6 +30,7 @@ class BuildRef:
     ref: str
     sha: str
     installation_id: int | None = None
+    default_branch: str | None = None
 
     @property
     def branch(self) -> str:
@@ -39,6 +43,14 @@ class BuildRef:
         """
         return self.ref.removeprefix("refs/heads/")
 
+    @property
+    def is_default_branch(self) -> bool:
+        """Whether the ref is the repository's default branch, False if it is unknown."""
+        return (
+            self.default_branch is not None
+            and self.ref == f"refs/heads/{self.default_branch}"
+        )
+
     @property
     def ssh_url(self) -> str:
         """
@@ -83,6 +95,31 @@ class BuildReport:
     context: str = "Group 10 CI/CD Pipeline"
 
 
+@dataclass(frozen=True)
+class StepTiming:
+    """
+    Resource usage of a single build step.
+
+    Attributes:
+        name (str): Name of the build step (e.g. "Unit Tests").
+        started_at (float): Unix timestamp of the start of the step.
+        duration (float): Wall-clock duration of the step in seconds.
+        cpu_user (float): User CPU time of the step's process tree in seconds.
+        cpu_system (float): System CPU time of the step's process tree in seconds.
+        max_rss_kb (int): Peak resident set size of the step's largest process in kilobytes.
+        exit_code (Optional[int]): Exit code of the step's command, None for steps that do
+            not run a command.
+    """
+
+    name: str
+    started_at: float
+    duration: float
+    cpu_user: float = 0.0
+    cpu_system: float = 0.0
+    max_rss_kb: int = 0
+    exit_code: Optional[int] = None
+
+
 class LogType(str, Enum):
     """Types of entries in the build history."""
 
@@ -108,7 +145,17 @@ class LogEntry:
         date_time (datetime): The timestamp when the build was processed.
         status (BuildStatus): The final outcome of the build (SUCCESS, FAILURE, etc.).
         gradle_output (str): The raw console output/logs generated by the
-            Gradle build/test process.
+            Gradle build/test process. If `output_path` is set, this only holds the
+            tail of the output.
+        output_path (Optional[str]): File holding the complete build output. Used to
+            stream large outputs to disk instead of keeping them in memory.
+        duration (Optional[float]): Wall-clock duration of the build in seconds.
+        first_failure_offset (Optional[int]): Byte offset in the output of the first
+            failed build step, if any.
+        timeline (list[StepTiming]): Timing and resource usage of every executed build step.
+        config_hash (Optional[str]): Hash of the build configuration the build ran with.
+        build_id (Optional[str]): Identifier of the build's job, which tells repeated
+            builds of the same commit apart.
     """
 
     type: LogType
@@ -118,17 +165,27 @@ class LogEntry:
     date_time: datetime
     status: BuildStatus
     gradle_output: str
+    output_path: Optional[str] = None
+    duration: Optional[float] = None
+    first_failure_offset: Optional[int] = None
+    timeline: list[StepTiming] = field(default_factory=list)
+    config_hash: Optional[str] = None
+    build_id: Optional[str] = None
 
     def generate_log_file_name(self) -> str:
         """Generates a unique filename for storing raw logs on disk.
 
-        Uses the commit SHA and log type to ensure that multiple builds of
-        different commits do not overwrite each other's log files.
+        Uses the commit SHA, build id and log type to ensure that builds of
+        different commits, and repeated builds of the same commit, do not
+        overwrite each other's log files.
 
         Returns:
-            str: A filename in the format '{sha}_{type}.log'.
+            str: A filename in the format '{sha}_{build_id}_{type}.log', or
+                '{sha}_{type}.log' if the build id is not known.
         """
-        return f"{self.commit_SHA}_{self.type.value}.log"
+        if self.build_id is None:
+            return f"{self.commit_SHA}_{self.type.value}.log"
+        return f"{self.commit_SHA}_{self.build_id}_{self.type.value}.log"
 
     def __str__(self) -> str:
         """Serializes the log entry into a JSON-formatted string.
@@ -140,14 +197,35 @@ class LogEntry:
             str: A JSON string representation of the object, with the
                 timestamp converted to Unix milliseconds.
         """
-        json_object = {
+        return json.dumps(self._json_object())
+
+    def to_metadata(self) -> dict[str, Any]:
+        """Returns the JSON-serialisable fields of the entry, without the build output.
+
+        Returns:
+            dict[str, Any]: The same fields as the JSON serialisation of `__str__`,
+                except `gradle_output`, plus `duration`, `first_failure_offset`,
+                `config_hash` and `build_id` if known and the `timeline` of build steps.
+        """
+        metadata: dict[str, Any] = {
             "type": self.type.value,
             "repo_url": self.repo_url,
             "refspec": self.refspec,
             "commit_SHA": self.commit_SHA,
             "date_time": int(self.date_time.timestamp() * 1000),
             "status": self.status.value,
-            "gradle_output": self.gradle_output,
         }
-
-        return json.dumps(json_object)
+        if self.duration is not None:
+            metadata["duration"] = self.duration
+        if self.first_failure_offset is not None:
+            metadata["first_failure_offset"] = self.first_failure_offset
+        if self.config_hash is not None:
+            metadata["config_hash"] = self.config_hash
+        if self.build_id is not None:
+            metadata["build_id"] = self.build_id
+        if self.timeline:
+            metadata["timeline"] = [asdict(step) for step in self.timeline]
+        return metadata
+
+    def _json_object(self) -> dict[str, Any]:
+        return {**self.to_metadata(), "gradle_output": self.gradle_output}
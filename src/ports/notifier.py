@@ -10,6 +10,7 @@ class NotificationStatus(Enum):
 
     SENT = "sent"
     FAILED = "failed"
+    QUEUED = "queued"
 
 
 @dataclass(frozen=True)
@@ -17,12 +18,17 @@ class NotificationResult:
     """Result of a notification attempt.
 
     Attributes:
-        status: Whether the notification was sent or failed.
+        status: Whether the notification was sent, failed or queued to be sent later.
         message: Optional error message if notification failed.
+        retryable: Whether a failed notification may succeed if sent again.
+        retry_after: Seconds to wait before sending a failed notification again, if the
+            receiving side asked for it.
     """
 
     status: NotificationStatus
     message: Optional[str] = None
+    retryable: bool = False
+    retry_after: Optional[float] = None
 
 
 class Notifier(Protocol):
@@ -0,0 +1,307 @@
+"""
+Decides which queued build may start next.
+
+Builds reserve CPU cores and memory on the host while they run, and are only started
+while the host has enough of both left, so concurrent builds do not oversubscribe it.
+Per-repository and per-installation caps keep a single busy project from taking every
+worker, and builds of the repository with the fewest running builds start first. Builds
+of higher priority classes, e.g. of the default branch, start before all others, and
+builds that waited long enough are promoted so they are not starved.
+"""
+
+import os
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from typing import TYPE_CHECKING, Optional
+
+from src.infra.time.clock import Clock, SystemClock
+from src.models import BuildRef
+
+if TYPE_CHECKING:
+    from src.build_queue import BuildJob
+
+# Class of the builds that match none of the configured priority classes
+DEFAULT_PRIORITY = "other"
+# Stands for the repository's default branch in priority class patterns
+DEFAULT_BRANCH_PATTERN = "@default"
+
+
+@dataclass(frozen=True)
+class AdmissionPolicy:
+    """
+    Resources reserved by every build and limits on concurrent builds.
+
+    Attributes:
+        cpus_per_build (int): CPU cores reserved by a running build, 0 to not account
+            for CPUs.
+        memory_mb_per_build (int): Memory reserved by a running build in megabytes, 0 to
+            not account for memory.
+        total_cpus (int): CPU cores available to builds.
+        total_memory_mb (int): Memory available to builds in megabytes.
+        max_per_repo (Optional[int]): Concurrent builds of a repository, None for no cap.
+        max_per_installation (Optional[int]): Concurrent builds of the repositories of a
+            GitHub App installation, None for no cap.
+    """
+
+    cpus_per_build: int = 0
+    memory_mb_per_build: int = 0
+    total_cpus: int = 0
+    total_memory_mb: int = 0
+    max_per_repo: Optional[int] = None
+    max_per_installation: Optional[int] = None
+
+    @classmethod
+    def for_host(
+        cls,
+        cpus_per_build: int = 1,
+        memory_mb_per_build: int = 0,
+        max_per_repo: Optional[int] = None,
+        max_per_installation: Optional[int] = None,
+    ) -> "AdmissionPolicy":
+        """Creates a policy sharing the cores and physical memory of this machine."""
+        return cls(
+            cpus_per_build=cpus_per_build,
+            memory_mb_per_build=memory_mb_per_build,
+            total_cpus=os.cpu_count() or 1,
+            total_memory_mb=host_memory_mb(),
+            max_per_repo=max_per_repo,
+            max_per_installation=max_per_installation,
+        )
+
+
+@dataclass(frozen=True)
+class PriorityClass:
+    """
+    Builds whose repository and ref match one of a set of patterns.
+
+    Attributes:
+        name (str): Name of the class, shown in the queue statistics and metrics.
+        patterns (tuple[str, ...]): Shell style patterns of the form `[repo:]ref`, e.g.
+            "refs/tags/*" or "acme/*:refs/heads/release/*". The ref "@default" matches
+            the repository's default branch.
+    """
+
+    name: str
+    patterns: tuple[str, ...]
+
+    def matches(self, ref: BuildRef) -> bool:
+        """Whether a build of the given reference belongs to the class."""
+        for pattern in self.patterns:
+            repo_pattern, _, ref_pattern = pattern.rpartition(":")
+            if repo_pattern and not fnmatchcase(ref.repo, repo_pattern):
+                continue
+            if ref_pattern == DEFAULT_BRANCH_PATTERN:
+                if ref.is_default_branch:
+                    return True
+            elif fnmatchcase(ref.ref, ref_pattern):
+                return True
+        return False
+
+
+@dataclass(frozen=True)
+class Priorities:
+    """
+    Priority classes of builds, highest first. Builds matching none of them belong to
+    the lowest class, `DEFAULT_PRIORITY`.
+
+    Attributes:
+        classes (tuple[PriorityClass, ...]): The classes, a build belongs to the first
+            one it matches.
+        aging (Optional[float]): Seconds a build waits before it is promoted by one
+            class, None to never promote builds.
+    """
+
+    classes: tuple[PriorityClass, ...] = ()
+    aging: Optional[float] = None
+
+    @classmethod
+    def parse(cls, spec: str, aging: Optional[float] = None) -> "Priorities":
+        """
+        Parses priority classes written as `name=pattern,pattern;name=pattern`, highest
+        first, e.g. "main=@default,refs/tags/*;release=refs/heads/release/*".
+
+        Raises:
+            ValueError: If a class has no name or no patterns, or a name is used twice.
+        """
+        classes: list[PriorityClass] = []
+        for entry in spec.split(";"):
+            if not entry.strip():
+                continue
+            name, _, patterns = entry.partition("=")
+            name = name.strip()
+            parsed = tuple(p.strip() for p in patterns.split(",") if p.strip())
+            if not name or not parsed:
+                raise ValueError(
+                    f"Invalid priority class {entry.strip()!r}, "
+                    "expected name=pattern,pattern"
+                )
+            if name == DEFAULT_PRIORITY or any(c.name == name for c in classes):
+                raise ValueError(f"Priority class {name!r} is defined more than once")
+            classes.append(PriorityClass(name, parsed))
+        return cls(tuple(classes), aging)
+
+    @property
+    def names(self) -> list[str]:
+        """Names of all classes, highest first, including `DEFAULT_PRIORITY`."""
+        return [c.name for c in self.classes] + [DEFAULT_PRIORITY]
+
+    def classify(self, ref: BuildRef) -> str:
+        """Returns the name of the class a build of the given reference belongs to."""
+        for priority_class in self.classes:
+            if priority_class.matches(ref):
+                return priority_class.name
+        return DEFAULT_PRIORITY
+
+
+class BuildScheduler:
+    """
+    Holds the queued builds and hands out the next one that may start.
+
+    Builds of a higher priority class start first, where a build is promoted by one
+    class for every `aging` seconds it waited, up to the highest class. Builds of a
+    repository and class start in the order they were queued. Among those of the same
+    class, builds of the repository with the fewest running builds go first, ties go to
+    the build that waited longest. A build is only admitted while the reserved cores and memory of the running
+    builds leave room for it and the caps of its repository and installation are not
+    reached. A build is always admitted when nothing else runs, so a build reserving more
+    than the host has still runs, alone.
+
+    Jobs that got their report while queued, e.g. superseded ones, are handed out right
+    away without reserving anything, so the caller can skip them.
+
+    The scheduler is not thread safe, the build queue calls it with its lock held.
+    """
+
+    def __init__(
+        self,
+        policy: Optional[AdmissionPolicy] = None,
+        priorities: Optional[Priorities] = None,
+        clock: Optional[Clock] = None,
+    ) -> None:
+        self._policy = policy if policy is not None else AdmissionPolicy()
+        self._priorities = priorities if priorities is not None else Priorities()
+        self._clock = clock if clock is not None else SystemClock()
+        self._class_index = {name: i for i, name in enumerate(self._priorities.names)}
+        # Queued jobs per repository and class index
+        self._queued: OrderedDict[tuple[str, int], deque["BuildJob"]] = OrderedDict()
+        self._running: dict[str, "BuildJob"] = {}
+        self._per_repo: dict[str, int] = {}
+        self._per_installation: dict[int, int] = {}
+        self._cpus = 0
+        self._memory_mb = 0
+
+    def __len__(self) -> int:
+        return sum(len(jobs) for jobs in self._queued.values())
+
+    @property
+    def priorities(self) -> list[str]:
+        """Names of the priority classes, highest first."""
+        return self._priorities.names
+
+    def classify(self, ref: BuildRef) -> str:
+        """Returns the priority class of a build of the given reference."""
+        return self._priorities.classify(ref)
+
+    def add(self, job: "BuildJob") -> None:
+        """
+        Queues a job behind the other queued jobs of its repository and its priority
+        class, `job.priority`.
+        """
+        key = (job.ref.repo, self._index(job))
+        self._queued.setdefault(key, deque()).append(job)
+
+    def take(self) -> Optional["BuildJob"]:
+        """
+        Removes and returns the next job that may start, reserving its resources, or
+        None if no queued job may start until a running one is released.
+        """
+        now = self._clock.time()
+        best: Optional["BuildJob"] = None
+        best_key: Optional[tuple[str, int]] = None
+        for key, jobs in self._queued.items():
+            job = jobs[0]
+            if job.report is not None:
+                self._pop(key)
+                return job
+            if not self._admits(job):
+                continue
+            if best is None or self._rank(job, now) < self._rank(best, now):
+                best, best_key = job, key
+        if best is None or best_key is None:
+            return None
+
+        self._pop(best_key)
+        self._reserve(best, 1)
+        self._running[best.id] = best
+        return best
+
+    def release(self, job: "BuildJob") -> None:
+        """Returns the resources reserved by a job once it stopped running."""
+        if self._running.pop(job.id, None) is not None:
+            self._reserve(job, -1)
+
+    def _admits(self, job: "BuildJob") -> bool:
+        if not self._running:
+            return True
+        policy = self._policy
+        if policy.cpus_per_build and (
+            self._cpus + policy.cpus_per_build > policy.total_cpus
+        ):
+            return False
+        if policy.memory_mb_per_build and (
+            self._memory_mb + policy.memory_mb_per_build > policy.total_memory_mb
+        ):
+            return False
+        if (
+            policy.max_per_repo is not None
+            and self._per_repo.get(job.ref.repo, 0) >= policy.max_per_repo
+        ):
+            return False
+        installation = job.ref.installation_id
+        return (
+            policy.max_per_installation is None
+            or installation is None
+            or self._per_installation.get(installation, 0) < policy.max_per_installation
+        )
+
+    def _index(self, job: "BuildJob") -> int:
+        return self._class_index.get(job.priority, len(self._class_index) - 1)
+
+    def _rank(self, job: "BuildJob", now: float) -> tuple[int, int, float]:
+        index = self._index(job)
+        if self._priorities.aging:
+            waited = max(0.0, now - job.enqueued_at)
+            index = max(0, index - int(waited // self._priorities.aging))
+        return index, self._per_repo.get(job.ref.repo, 0), job.enqueued_at
+
+    def _pop(self, key: tuple[str, int]) -> None:
+        jobs = self._queued[key]
+        jobs.popleft()
+        if not jobs:
+            del self._queued[key]
+
+    def _reserve(self, job: "BuildJob", sign: int) -> None:
+        self._cpus += sign * self._policy.cpus_per_build
+        self._memory_mb += sign * self._policy.memory_mb_per_build
+        repo = job.ref.repo
+        self._per_repo[repo] = self._per_repo.get(repo, 0) + sign
+        if not self._per_repo[repo]:
+            del self._per_repo[repo]
+        installation = job.ref.installation_id
+        if installation is not None:
+            count = self._per_installation.get(installation, 0) + sign
+            if count:
+                self._per_installation[installation] = count
+            else:
+                self._per_installation.pop(installation, None)
+
+
+def host_memory_mb() -> int:
+    """Returns the physical memory of this machine in megabytes, 0 if unknown."""
+    try:
+        pages = os.sysconf("SC_PHYS_PAGES")
+        page_size = os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError):
+        return 0
+    return pages * page_size // (1024 * 1024)
@@ -0,0 +1,109 @@
+"""
+Splits a project's test suite into shards that run concurrently.
+
+Tests are sharded by module, so module and class scoped fixtures are still set up once.
+Modules are balanced across shards using their durations in previous builds, and the
+JUnit reports of all shards are merged into a single summary.
+"""
+
+import heapq
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from typing import Optional
+
+# Assumed duration of a module without history, when no module has any history either
+_DEFAULT_DURATION = 1.0
+
+
+@dataclass(frozen=True)
+class JunitSummary:
+    """
+    Results of a test run, merged from the JUnit reports of its shards.
+
+    Attributes:
+        tests (int): Number of tests that ran.
+        skipped (int): Number of skipped tests.
+        failed (list[str]): Tests that failed or errored, as "file::name".
+        durations (dict[str, float]): Total duration of the tests of every module.
+    """
+
+    tests: int = 0
+    skipped: int = 0
+    failed: list[str] = field(default_factory=list)
+    durations: dict[str, float] = field(default_factory=dict)
+
+
+def parse_collected_modules(output: str) -> list[str]:
+    """
+    Returns the test modules listed by `pytest --collect-only -q`, in collection order.
+    """
+    modules: dict[str, None] = {}
+    for line in output.splitlines():
+        if "::" in line:
+            modules[line.split("::", 1)[0]] = None
+    return list(modules)
+
+
+def plan_shards(
+    modules: list[str], durations: dict[str, float], shard_count: int
+) -> list[list[str]]:
+    """
+    Assigns test modules to shards so that the shards take about equally long.
+
+    Modules are assigned longest first to the shard with the least work so far. Modules
+    without a recorded duration are assumed to take as long as an average module.
+
+    Args:
+        modules: Test modules to distribute.
+        durations: Durations of modules in a previous run, in seconds.
+        shard_count: Number of shards, some are left empty if there are fewer modules.
+
+    Returns:
+        list[list[str]]: The modules of each shard, in collection order.
+    """
+    known = [durations[module] for module in modules if module in durations]
+    default = sum(known) / len(known) if known else _DEFAULT_DURATION
+    order = {module: i for i, module in enumerate(modules)}
+
+    shards: list[list[str]] = [[] for _ in range(shard_count)]
+    loads = [(0.0, i) for i in range(shard_count)]
+    for module in sorted(modules, key=lambda m: (-durations.get(m, default), order[m])):
+        load, index = heapq.heappop(loads)
+        shards[index].append(module)
+        heapq.heappush(loads, (load + durations.get(module, default), index))
+
+    return [sorted(shard, key=order.__getitem__) for shard in shards]
+
+
+def read_junit_reports(paths: list[str]) -> Optional[JunitSummary]:
+    """
+    Merges the JUnit XML reports written by pytest with `junit_family=xunit1`.
+
+    Returns:
+        Optional[JunitSummary]: The merged results, or None if no report was written.
+    """
+    tests = skipped = 0
+    failed: list[str] = []
+    durations: dict[str, float] = {}
+    found = False
+
+    for path in paths:
+        try:
+            root = ET.parse(path).getroot()
+        except FileNotFoundError:
+            continue
+        found = True
+        for case in root.iter("testcase"):
+            module = case.get("file") or case.get("classname") or ""
+            durations[module] = durations.get(module, 0.0) + float(case.get("time", 0))
+            if case.find("skipped") is not None:
+                skipped += 1
+            elif case.find("failure") is not None or case.find("error") is not None:
+                failed.append(f"{module}::{case.get('name')}")
+            tests += 1
+
+    if not found:
+        return None
+    return JunitSummary(
+        tests=tests, skipped=skipped, failed=failed, durations=durations
+    )
@@ -0,0 +1,131 @@
+"""
+Selects the tests affected by a change to a project.
+
+Every build that runs its tests under coverage records which source files each test
+module executed, see `parse_coverage_contexts`. A later build then only runs the test
+modules that executed one of the files it changed, see `select_tests`. Changes that
+the recorded coverage cannot account for, such as to the project's configuration or to
+files no test is known to execute, run the whole suite instead.
+"""
+
+import os
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from typing import Any, Optional
+
+# Files whose changes can affect any test, e.g. by changing dependencies or pytest
+# options, matched against the file name
+_CONFIG_FILES = (
+    "pyproject.toml",
+    "setup.py",
+    "setup.cfg",
+    "tox.ini",
+    "pytest.ini",
+    "conftest.py",
+    ".coveragerc",
+    "noxfile.py",
+    "requirements*.txt",
+    "Pipfile*",
+    "*.lock",
+)
+
+# Files no test reads, changing them does not run any test
+_DOC_SUFFIXES = (".md", ".rst")
+
+
+@dataclass(frozen=True)
+class TestSelection:
+    """
+    Test modules to run for a change.
+
+    Attributes:
+        modules (Optional[list[str]]): The affected test modules in collection order,
+            or None to run the whole suite.
+        reason (str): Why these tests were selected, for the build log.
+    """
+
+    # Not a test class, despite its name
+    __test__ = False
+
+    modules: Optional[list[str]]
+    reason: str
+
+
+def is_config_file(path: str) -> bool:
+    """Whether a change to the given file can affect any test."""
+    name = os.path.basename(path)
+    return any(fnmatchcase(name, pattern) for pattern in _CONFIG_FILES)
+
+
+def select_tests(
+    changed: list[str], impact: dict[str, set[str]], test_modules: list[str]
+) -> TestSelection:
+    """
+    Selects the test modules affected by changes to the given files.
+
+    A changed test module is run itself, a changed source file runs the test modules
+    that executed it. Changes to configuration files, to Python files missing from the
+    impact index and to other files tests may read run the whole suite.
+
+    Args:
+        changed: Paths of the changed files, relative to the repository root.
+        impact: Test modules that executed each source file in earlier builds.
+        test_modules: The project's test modules, in collection order.
+    """
+    if not impact:
+        return TestSelection(None, "No test impact was recorded yet, running all tests")
+
+    known_tests = set(test_modules)
+    affected: set[str] = set()
+    for path in changed:
+        if is_config_file(path):
+            return TestSelection(None, f"{path} changed, running all tests")
+        if path in known_tests:
+            affected.add(path)
+        elif path in impact:
+            affected.update(impact[path])
+        elif path.endswith(_DOC_SUFFIXES):
+            continue
+        else:
+            return TestSelection(
+                None, f"{path} is not in the test impact index, running all tests"
+            )
+
+    modules = [module for module in test_modules if module in affected]
+    return TestSelection(
+        modules,
+        f"{len(changed)} changed files affect {len(modules)} of "
+        f"{len(test_modules)} test modules",
+    )
+
+
+def parse_coverage_contexts(
+    report: dict[str, Any], test_modules: list[str]
+) -> dict[str, set[str]]:
+    """
+    Returns the source files each test module executed, from a `coverage json
+    --show-contexts` report of a test run with `dynamic_context = test_function`.
+
+    A context is attributed to the test module whose own lines ran in it. Code that ran
+    outside of any test, e.g. while the test modules were imported, is not attributed.
+
+    Returns:
+        dict[str, set[str]]: The executed files of every test module that ran,
+            including the test module itself.
+    """
+    files: dict[str, Any] = report.get("files", {})
+    owners: dict[str, str] = {}
+    for module in test_modules:
+        for contexts in files.get(module, {}).get("contexts", {}).values():
+            for context in contexts:
+                if context:
+                    owners[context] = module
+
+    executed: dict[str, set[str]] = {}
+    for path, data in files.items():
+        for contexts in data.get("contexts", {}).values():
+            for context in contexts:
+                owner = owners.get(context)
+                if owner is not None:
+                    executed.setdefault(owner, {owner}).add(path)
+    return executed
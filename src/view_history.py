@@ -1,90 +1,273 @@
-import os, json
-from flask import render_template_string
-from src.models import LogEntry
+import codecs
+import html
+from datetime import datetime
+from typing import Any, Iterator, Mapping, Optional
+from urllib.parse import urlencode
 
+from flask import Response, render_template_string
 
-def list_logs() -> str:
+from src.infra.history.historyStore import (
+    BuildHistoryStore,
+    HistoryQuery,
+    HistoryRecord,
+    repo_name_from_url,
+)
+from src.infra.history.logStore import ChunkedLogReader, LogStore
+from src.models import BuildStatus, LogEntry
+
+# Number of builds shown per page of the dashboard
+PAGE_SIZE = 50
+
+LOG_STORE = LogStore("logs")
+
+# Default and maximum number of bytes of output shown on one page of a log
+DEFAULT_PAGE_BYTES = 64 * 1024
+MAX_PAGE_BYTES = 1024 * 1024
+
+LOG_PAGE = """
+        <body style="font-family:monospace; padding:20px;">
+            <h3>📄 {{ meta }}</h3>
+            {% if size is defined %}
+            <p>
+                Bytes {{ start }}–{{ end }} of {{ size }}
+                {% if failure_url %} | <a href="{{ failure_url }}">Jump to first failure</a>{% endif %}
+                {% if first_url %} | <a href="{{ first_url }}">First</a>{% endif %}
+                {% if previous_url %} | <a href="{{ previous_url }}">Previous</a>{% endif %}
+                {% if next_url %} | <a href="{{ next_url }}">Next</a>{% endif %}
+                | <a href="{{ tail_url }}">Tail</a>
+                {% if full_url %} | <a href="{{ full_url }}">Full log</a>{% endif %}
+            </p>
+            {% endif %}
+            <pre style="padding:15px; border-radius:5px; overflow-x:auto;">{{ logs }}</pre>
+            <a href="/logs">← Back</a>
+        </body>
+    """
+
+# Placeholder splitting the rendered log page around the streamed output
+_SPLIT_MARKER = "\x00LOG_OUTPUT\x00"
+
+
+def list_logs(store: BuildHistoryStore, args: Mapping[str, str]) -> str:
     """
-    Scans the logs directory and renders an HTML dashboard listing all historical builds.
+    Queries the build history index and renders an HTML dashboard listing historical builds.
+
+    Args:
+        store (BuildHistoryStore): Index of all recorded builds.
+        args (Mapping[str, str]): Query parameters of the request. Supports the filters
+            `repo`, `branch`, `status`, `since` and `until` (dates as YYYY-MM-DD), and
+            the pagination `cursor`.
 
     Returns:
-        str: An HTML table displaying build commits and links to detailed reports.
+        str: An HTML table displaying one page of builds and links to detailed reports.
     """
-    os.makedirs("logs", exist_ok=True)
+    filters = {
+        key: args[key].strip()
+        for key in ("repo", "branch", "status", "since", "until")
+        if args.get(key, "").strip()
+    }
 
-    log_files = sorted(os.listdir("logs"), reverse=True)
+    try:
+        query = HistoryQuery(
+            repo=filters.get("repo"),
+            branch=filters.get("branch"),
+            status=BuildStatus(filters["status"]) if "status" in filters else None,
+            since=_parse_date(filters.get("since")),
+            until=_parse_date(filters.get("until")),
+            limit=PAGE_SIZE,
+            cursor=args.get("cursor") or None,
+        )
+        page = store.query(query)
+    except ValueError as e:
+        return render_template_string(
+            "<p>Invalid filter: {{ error }}</p>", error=str(e)
+        )
+
+    next_url = None
+    if page.next_cursor is not None:
+        next_url = "/logs?" + urlencode({**filters, "cursor": page.next_cursor})
 
-    html = """
+    template = """
     <html>
     <head><title>CI Build History</title></head>
     <body style="font-family: sans-serif; margin: 40px;">
         <h1> Build History</h1>
+        <form method="get" action="/logs" style="margin-bottom: 20px;">
+            <input name="repo" placeholder="owner/repo" value="{{ filters.get('repo', '') }}">
+            <input name="branch" placeholder="branch" value="{{ filters.get('branch', '') }}">
+            <select name="status">
+                <option value="">any status</option>
+                {% for status in statuses %}
+                <option value="{{ status }}" {% if filters.get('status') == status %}selected{% endif %}>{{ status }}</option>
+                {% endfor %}
+            </select>
+            <input name="since" type="date" value="{{ filters.get('since', '') }}">
+            <input name="until" type="date" value="{{ filters.get('until', '') }}">
+            <button type="submit">Filter</button>
+        </form>
         <table border="1" cellpadding="10" style="border-collapse: collapse; width: 100%;">
             <tr style="background: #eee;">
                 <th>Commit</th>
-                
+                <th>Repository</th>
+                <th>Branch</th>
+                <th>Status</th>
+                <th>Finished</th>
+                <th>Duration</th>
                 <th>Link</th>
             </tr>
-            {% for log in logs %}
+            {% for build in builds %}
             <tr>
-                <td>{{ log.split('_')[0] }}</td>
-                
-                <td><a href="/logs/{{ log }}">Link</a></td>
+                <td>{{ build.commit_sha }}</td>
+                <td>{{ build.repo }}</td>
+                <td>{{ build.branch }}</td>
+                <td>{{ build.status.value }}</td>
+                <td>{{ build.finished_at.strftime('%Y-%m-%d %H:%M:%S') }}</td>
+                <td>{{ '%.1f s' % build.duration if build.duration is not none else '' }}</td>
+                <td><a href="/logs/{{ build.log_file }}">Link</a></td>
             </tr>
             {% endfor %}
         </table>
+        {% if next_url %}<p><a href="{{ next_url }}">Older builds →</a></p>{% endif %}
     </body>
     </html>
     """
 
-    return render_template_string(html, logs=log_files)
+    return render_template_string(
+        template,
+        builds=page.records,
+        filters=filters,
+        statuses=[status.value for status in BuildStatus],
+        next_url=next_url,
+    )
 
 
-def view_log(filename: str) -> str:
+def view_log(filename: str, args: Mapping[str, str]) -> Response | str:
     """
     Retrieves and displays the details of a specific build log.
 
+    Only a slice of the output is rendered, read through the log's chunk index so the
+    cost of a page does not depend on the size of the log. Without an explicit range the
+    end of the log is shown. Navigation links page through the log and jump to the first
+    failed build step.
+
     Args:
         filename (str): The name of the log file to read.
+        args (Mapping[str, str]): Query parameters of the request. Supports `offset` and
+            `limit` (in bytes) to select a range, and `full=1` to stream the whole log.
 
     Returns:
-        str: A formatted HTML page showing build metadata and console output.
+        Response | str: A formatted HTML page showing build metadata and console output.
     """
-    path = os.path.join("logs", filename)
-    if not os.path.exists(path):
+    path = LOG_STORE.path_for(filename)
+    if path is None:
         return "Not Found"
 
-    with open(path, "r") as f:
-        raw_content = f.read()
+    data = LOG_STORE.metadata(filename)
+    reader = LOG_STORE.reader(data) if data is not None else None
+    meta = f"SHA: {data.get('commit_SHA')}" if data is not None else "Raw Log File"
+
+    if reader is not None and args.get("full") == "1":
+        return _stream_log(meta, reader)
+
+    output: ChunkedLogReader | _InlineLog = (
+        reader if reader is not None else _InlineLog(_inline_output(path, data))
+    )
+    size = output.size
 
     try:
-        data = json.loads(raw_content)
-        meta = f"SHA: {data.get('commit_SHA')}"
-        logs = data.get("gradle_output", "No logs found.")
-    except:
-        meta, logs = "Raw Log File", raw_content
+        limit = min(max(int(args.get("limit", DEFAULT_PAGE_BYTES)), 1), MAX_PAGE_BYTES)
+        offset = int(args["offset"]) if "offset" in args else size - limit
+    except ValueError:
+        return "Invalid range"
+    offset = min(max(offset, 0), size)
+
+    first_failure = data.get("first_failure_offset") if data is not None else None
+
+    def page_url(page_offset: int) -> str:
+        return f"/logs/{filename}?" + urlencode({"offset": page_offset, "limit": limit})
 
     return render_template_string(
-        """
-        <body style="font-family:monospace; padding:20px;">
-            <h3>📄 {{ meta }}</h3>
-            <pre style="padding:15px; border-radius:5px; overflow-x:auto;">{{ logs }}</pre>
-            <a href="/logs">← Back</a>
-        </body>
-    """,
+        LOG_PAGE,
         meta=meta,
-        logs=logs,
+        logs=output.read(offset, limit).decode(errors="replace"),
+        start=offset,
+        end=min(offset + limit, size),
+        size=size,
+        first_url=page_url(0) if offset > 0 else None,
+        previous_url=page_url(max(offset - limit, 0)) if offset > 0 else None,
+        next_url=page_url(offset + limit) if offset + limit < size else None,
+        tail_url=f"/logs/{filename}?" + urlencode({"limit": limit}),
+        failure_url=page_url(first_failure) if first_failure is not None else None,
+        full_url=f"/logs/{filename}?full=1" if reader is not None else None,
     )
 
 
-def save_log_to_file(entry: LogEntry) -> None:
+def _stream_log(meta: str, reader: ChunkedLogReader) -> Response:
+    head, tail = render_template_string(LOG_PAGE, meta=meta, logs=_SPLIT_MARKER).split(
+        _SPLIT_MARKER
+    )
+
+    def generate() -> Iterator[str]:
+        yield head
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        for chunk in reader.iter_range():
+            yield html.escape(decoder.decode(chunk))
+        yield html.escape(decoder.decode(b"", final=True))
+        yield tail
+
+    return Response(generate(), mimetype="text/html")
+
+
+class _InlineLog:
+    """Output of a log in the old format, inlined into its JSON document."""
+
+    def __init__(self, output: str) -> None:
+        self._content = output.encode()
+        self.size = len(self._content)
+
+    def read(self, offset: int, limit: int) -> bytes:
+        return self._content[offset : offset + limit]
+
+
+def _inline_output(path: str, data: Optional[dict[str, Any]]) -> str:
+    if data is not None:
+        return str(data.get("gradle_output", "No logs found."))
+    with open(path, "r", errors="replace") as f:
+        return f.read()
+
+
+def save_log_to_file(entry: LogEntry, store: Optional[BuildHistoryStore] = None) -> str:
     """
     Persists a BuildReport to the local filesystem as a unique log file.
 
     Args:
         entry (LogEntry): The object containing commit info, status, and build logs.
+        store (Optional[BuildHistoryStore]): History index to record the build in.
+
+    Returns:
+        str: Filename of the log, as used in the `/logs/<filename>` route.
     """
-    """Helper to save the LogEntry string to a file."""
-    filename = entry.generate_log_file_name()
-    with open(f"logs/{filename}", "w") as f:
-        f.write(str(entry))
+    """Helper to save the LogEntry to the log store."""
+    filename = LOG_STORE.save(entry)
+
+    if store is not None:
+        store.add(
+            HistoryRecord(
+                repo=repo_name_from_url(entry.repo_url),
+                refspec=entry.refspec,
+                commit_sha=entry.commit_SHA,
+                status=entry.status,
+                finished_at=entry.date_time,
+                duration=entry.duration,
+                log_file=filename,
+                config_hash=entry.config_hash,
+                build_id=entry.build_id,
+            )
+        )
+
+    return filename
+
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    if value is None:
+        return None
+    return datetime.strptime(value, "%Y-%m-%d")
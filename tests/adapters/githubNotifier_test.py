@@ -62,3 +62,18 @@ def test_notify_transport_error_returns_failed_with_message():
 
     assert result.status == NotificationStatus.FAILED
     assert len(transport.calls) == 0
+
+
+def test_notify_includes_target_url_when_set():
+    transport = FakeTransport()
+    notifier = GithubNotifier(transport=transport)
+    report = BuildReport(
+        state=BuildStatus.SUCCESS, target_url="https://ci.example.com/logs/abc"
+    )
+
+    notifier.notify(
+        BuildRef(repo="owner/repo", ref="refs/heads/main", sha="abc"), report
+    )
+
+    _, _, payload, _ = transport.calls[0]
+    assert payload["target_url"] == "https://ci.example.com/logs/abc"
@@ -0,0 +1,109 @@
+import threading
+import time
+
+from src.adapters.notifier.queued import QueuedNotifier
+from src.models import BuildRef, BuildReport, BuildStatus
+from src.ports.notifier import NotificationResult, NotificationStatus
+
+
+def make_ref(sha: str = "abc123") -> BuildRef:
+    return BuildRef(repo="owner/repo", ref="refs/heads/main", sha=sha)
+
+
+class FakeNotifier:
+    def __init__(self, failures: list[NotificationResult] | None = None) -> None:
+        self.failures = list(failures or [])
+        self.sent: list[tuple[str, BuildStatus]] = []
+        self.attempt_times: list[float] = []
+        self.called = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def notify(self, ref: BuildRef, report: BuildReport) -> NotificationResult:
+        self.called.set()
+        self.release.wait(timeout=5)
+        self.attempt_times.append(time.monotonic())
+        if self.failures:
+            return self.failures.pop(0)
+        self.sent.append((ref.sha, report.state))
+        return NotificationResult(status=NotificationStatus.SENT)
+
+
+def test_notify_returns_queued_and_sends_in_background():
+    inner = FakeNotifier()
+    notifier = QueuedNotifier(inner)
+
+    result = notifier.notify(make_ref(), BuildReport(state=BuildStatus.SUCCESS))
+
+    assert result.status == NotificationStatus.QUEUED
+    assert notifier.flush(timeout=5)
+    assert inner.sent == [("abc123", BuildStatus.SUCCESS)]
+    notifier.close()
+
+
+def test_only_latest_report_per_status_is_sent():
+    inner = FakeNotifier()
+    inner.release.clear()
+    notifier = QueuedNotifier(inner)
+
+    # The first notification blocks the worker, the next ones wait in the queue
+    notifier.notify(make_ref("blocker"), BuildReport(state=BuildStatus.PENDING))
+    assert inner.called.wait(timeout=5)
+    notifier.notify(make_ref(), BuildReport(state=BuildStatus.PENDING))
+    notifier.notify(make_ref(), BuildReport(state=BuildStatus.FAILURE))
+    notifier.notify(make_ref("other"), BuildReport(state=BuildStatus.PENDING))
+    inner.release.set()
+
+    assert notifier.flush(timeout=5)
+    assert inner.sent == [
+        ("blocker", BuildStatus.PENDING),
+        ("abc123", BuildStatus.FAILURE),
+        ("other", BuildStatus.PENDING),
+    ]
+    notifier.close()
+
+
+def test_failed_notifications_are_retried_with_backoff():
+    failure = NotificationResult(status=NotificationStatus.FAILED, retryable=True)
+    inner = FakeNotifier(failures=[failure, failure])
+    notifier = QueuedNotifier(inner, backoff=0.05)
+
+    notifier.notify(make_ref(), BuildReport(state=BuildStatus.SUCCESS))
+
+    assert notifier.flush(timeout=5)
+    assert inner.sent == [("abc123", BuildStatus.SUCCESS)]
+    first, second, third = inner.attempt_times
+    assert second - first >= 0.025
+    assert third - second >= 0.05
+    notifier.close()
+
+
+def test_rate_limited_notifications_wait_for_retry_after():
+    rate_limited = NotificationResult(
+        status=NotificationStatus.FAILED, retryable=True, retry_after=0.3
+    )
+    inner = FakeNotifier(failures=[rate_limited])
+    notifier = QueuedNotifier(inner, backoff=0.01)
+
+    notifier.notify(make_ref(), BuildReport(state=BuildStatus.SUCCESS))
+
+    assert notifier.flush(timeout=5)
+    first, second = inner.attempt_times
+    assert second - first >= 0.3
+    notifier.close()
+
+
+def test_permanent_failures_and_exhausted_retries_are_dropped():
+    permanent = NotificationResult(status=NotificationStatus.FAILED, retryable=False)
+    transient = NotificationResult(status=NotificationStatus.FAILED, retryable=True)
+    inner = FakeNotifier(failures=[permanent, transient, transient])
+    notifier = QueuedNotifier(inner, max_attempts=2, backoff=0.01)
+
+    notifier.notify(make_ref("a"), BuildReport(state=BuildStatus.SUCCESS))
+    assert notifier.flush(timeout=5)
+    notifier.notify(make_ref("b"), BuildReport(state=BuildStatus.SUCCESS))
+    assert notifier.flush(timeout=5)
+
+    assert inner.sent == []
+    assert len(inner.attempt_times) == 3
+    notifier.close()
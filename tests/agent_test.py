@@ -0,0 +1,87 @@
+import threading
+import time
+
+from flask import Flask
+from werkzeug.serving import make_server
+
+from src.agent import BuildAgent
+from src.build_log import BuildLog
+from src.build_queue import BuildJob
+from src.coordinator import AgentPool, agent_blueprint
+from src.models import BuildRef, BuildReport, BuildStatus, StepTiming
+
+TOKEN = "agent-secret"
+
+
+def fake_build(name: str, used_by: list[str]):
+    def build(repo_url, branch, commit_id, options, log, cancel=None):
+        used_by.append(name)
+        log.section("Unit Tests")
+        log.write(f"{commit_id} built by {name}\n")
+        log.record_step(StepTiming(name="Unit Tests", started_at=0, duration=0.2))
+        time.sleep(0.2)
+        log.close()
+        return BuildReport(BuildStatus.SUCCESS, "Build succeeded"), log
+
+    return build
+
+
+def test_builds_are_distributed_across_agents(tmp_path):
+    pool = AgentPool()
+    app = Flask(__name__)
+    app.register_blueprint(agent_blueprint(pool, TOKEN))
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    stop = threading.Event()
+    used_by: list[str] = []
+    agents = [
+        BuildAgent(url, TOKEN, name, slots=1, build=fake_build(name, used_by))
+        for name in ("agent-a", "agent-b")
+    ]
+    agent_threads = [
+        threading.Thread(target=agent.run, args=(stop,)) for agent in agents
+    ]
+    for thread in agent_threads:
+        thread.start()
+
+    results: dict[str, BuildReport] = {}
+    logs: dict[str, BuildLog] = {}
+
+    def run(sha: str) -> None:
+        job = BuildJob(
+            id=sha, ref=BuildRef("owner/repo", "refs/heads/main", sha), enqueued_at=0
+        )
+        logs[sha] = BuildLog(str(tmp_path / f"{sha}.log"))
+        results[sha] = pool.run(job, logs[sha])
+
+    builds = [threading.Thread(target=run, args=(f"sha{i}",)) for i in range(4)]
+    for thread in builds:
+        thread.start()
+    for thread in builds:
+        thread.join(timeout=30)
+    stop.set()
+    for thread in agent_threads:
+        thread.join(timeout=30)
+    server.shutdown()
+
+    assert all(report.state == BuildStatus.SUCCESS for report in results.values())
+    assert sorted(set(used_by)) == ["agent-a", "agent-b"]
+    for sha, log in logs.items():
+        with open(log.path) as f:
+            assert f"{sha} built by agent-" in f.read()
+        assert [step.name for step in log.timeline] == ["Unit Tests"]
+
+
+def test_requests_without_agent_token_are_rejected():
+    app = Flask(__name__)
+    app.register_blueprint(agent_blueprint(AgentPool(), TOKEN))
+
+    response = app.test_client().post(
+        "/agents",
+        json={"name": "a", "cores": 1, "memory_mb": 1, "slots": 1},
+        headers={"Authorization": "Bearer wrong"},
+    )
+
+    assert response.status_code == 401
@@ -0,0 +1,116 @@
+import threading
+
+from src.build_log import BuildLog, LiveLogRegistry, StageLogs
+
+
+def test_log_writes_output_to_disk(tmp_path):
+    log = BuildLog(str(tmp_path / "build.log"))
+
+    log.section("Step")
+    log.write(b"bytes\n")
+    log.write("text\n")
+    log.close()
+
+    assert b"".join(log.read_chunks(chunk_size=4)) == b"\n---Step---\nbytes\ntext\n"
+    assert log.size == len("\n---Step---\nbytes\ntext\n")
+    assert log.closed
+
+
+def test_log_tail_is_bounded(tmp_path):
+    log = BuildLog(str(tmp_path / "build.log"), tail_bytes=8)
+
+    for i in range(100):
+        log.write(f"line {i}\n")
+
+    assert log.tail() == "line 99\n"
+    assert log.size == sum(len(f"line {i}\n") for i in range(100))
+
+
+def test_output_written_after_close_is_dropped(tmp_path):
+    log = BuildLog(str(tmp_path / "build.log"))
+    log.write("output\n")
+    log.close()
+
+    log.write("late\n")
+
+    assert b"".join(log.read_chunks()) == b"output\n"
+    assert log.size == len("output\n")
+
+
+def test_discard_removes_file(tmp_path):
+    log = BuildLog.temporary(str(tmp_path))
+    log.write("output")
+
+    log.discard()
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_follow_resumes_at_offset_and_waits_for_new_output(tmp_path):
+    log = BuildLog(str(tmp_path / "build.log"))
+    log.write("first\n")
+    received: list[bytes] = []
+
+    def follow() -> None:
+        received.extend(log.follow(offset=2, poll_interval=0.01))
+
+    follower = threading.Thread(target=follow)
+    follower.start()
+    log.write("second\n")
+    log.close()
+    follower.join(timeout=5)
+
+    assert not follower.is_alive()
+    assert b"".join(received) == b"rst\nsecond\n"
+
+
+def test_follow_after_registry_removal_ends_immediately(tmp_path):
+    registry = LiveLogRegistry(str(tmp_path / "live"))
+    log = registry.create("build-1")
+    log.write("output")
+
+    assert registry.get("build-1") is log
+    registry.remove("build-1")
+
+    assert registry.get("build-1") is None
+    assert list(log.follow()) == []
+
+
+def test_first_failure_points_at_section_of_first_failed_step(tmp_path):
+    log = BuildLog(str(tmp_path / "build.log"))
+    log.section("Passing")
+    log.write("ok\n")
+    failing_offset = log.size
+    log.section("Failing")
+    log.write("broken\n")
+    log.mark_failure()
+    log.section("Later")
+    log.mark_failure()
+
+    assert log.first_failure_offset == failing_offset
+
+
+def test_stage_logs_present_output_in_declared_order(tmp_path):
+    log = BuildLog(str(tmp_path / "build.log"))
+    stages = StageLogs(log, ["first", "second", "third"])
+    first = stages.open("first")
+    second = stages.open("second")
+    third = stages.open("third")
+
+    third.write("third\n")
+    stages.finish("third")
+    second.write("second ")
+    first.section("first")
+    first.write("first\n")
+    stages.finish("first")
+    # Now at the head, so further output goes straight to the build log
+    second.section("second")
+    second.mark_failure()
+    stages.finish("second")
+    stages.close()
+    log.close()
+
+    with open(log.path) as f:
+        content = f.read()
+    assert content == "\n---first---\nfirst\nsecond \n---second---\nthird\n"
+    assert log.first_failure_offset == content.index("\n---second---")
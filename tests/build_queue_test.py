@@ -0,0 +1,428 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.build_queue import (
+    AsyncBuildQueue,
+    BuildJob,
+    BuildJobState,
+    BuildQueue,
+    QueueFull,
+)
+from src.infra.history.queueStore import BuildQueueStore
+from src.models import BuildRef, BuildReport, BuildStatus
+from src.scheduler import AdmissionPolicy, Priorities
+from tests.mocks.clockMock import ClockMock
+
+
+def make_ref(sha: str = "abc123") -> BuildRef:
+    return BuildRef(repo="owner/repo", ref="refs/heads/main", sha=sha)
+
+
+class BlockingHandler:
+    def __init__(self) -> None:
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.refs: list[BuildRef] = []
+
+    def __call__(self, job: BuildJob) -> BuildReport:
+        self.refs.append(job.ref)
+        self.started.set()
+        self.release.wait(timeout=5)
+        return BuildReport(state=BuildStatus.SUCCESS, description="ok")
+
+
+def test_submit_returns_before_build_runs():
+    handler = BlockingHandler()
+    build_queue = BuildQueue(handler, workers=1)
+    build_queue.start()
+
+    job = build_queue.submit(make_ref())
+    assert handler.started.wait(timeout=5)
+    assert build_queue.get(job.id).state == BuildJobState.RUNNING
+
+    handler.release.set()
+    build_queue.shutdown()
+
+    finished = build_queue.get(job.id)
+    assert finished.state == BuildJobState.FINISHED
+    assert finished.report.state == BuildStatus.SUCCESS
+
+
+def test_jobs_are_processed_in_order():
+    seen: list[str] = []
+
+    def handler(job: BuildJob) -> BuildReport:
+        seen.append(job.ref.sha)
+        return BuildReport(state=BuildStatus.SUCCESS)
+
+    build_queue = BuildQueue(handler, workers=1)
+    for sha in ["a", "b", "c"]:
+        build_queue.submit(make_ref(sha))
+    build_queue.start()
+    build_queue.shutdown()
+
+    assert seen == ["a", "b", "c"]
+    assert build_queue.stats().completed == 3
+
+
+def test_handler_exception_finishes_job_with_error():
+    def handler(job: BuildJob) -> BuildReport:
+        raise RuntimeError("boom")
+
+    build_queue = BuildQueue(handler, workers=1)
+    build_queue.start()
+    job = build_queue.submit(make_ref())
+    build_queue.shutdown()
+
+    assert job.state == BuildJobState.FINISHED
+    assert job.report.state == BuildStatus.ERROR
+
+
+def test_stats_report_depth_and_utilisation():
+    handler = BlockingHandler()
+    clock = ClockMock(fixed_time=100)
+    build_queue = BuildQueue(handler, workers=1, clock=clock)
+    build_queue.start()
+
+    build_queue.submit(make_ref("a"))
+    assert handler.started.wait(timeout=5)
+    build_queue.submit(make_ref("b"))
+
+    stats = build_queue.stats()
+    assert stats.depth == 1
+    assert stats.running == 1
+    assert len(stats.workers) == 1
+    assert stats.workers[0].busy
+
+    handler.release.set()
+    build_queue.shutdown()
+
+    stats = build_queue.stats()
+    assert stats.depth == 0
+    assert stats.running == 0
+    assert stats.completed == 2
+    assert stats.avg_wait_time == 0
+
+
+def test_coalescing_drops_superseded_queued_builds():
+    handler = BlockingHandler()
+    superseded: list[str] = []
+    build_queue = BuildQueue(
+        handler,
+        workers=1,
+        coalesce=True,
+        on_superseded=lambda job: superseded.append(job.ref.sha),
+    )
+    build_queue.start()
+
+    running = build_queue.submit(make_ref("a"))
+    assert handler.started.wait(timeout=5)
+    queued = [build_queue.submit(make_ref(sha)) for sha in ["b", "c", "d"]]
+    other_branch = build_queue.submit(
+        BuildRef(repo="owner/repo", ref="refs/heads/feature", sha="e")
+    )
+
+    assert build_queue.stats().depth == 2
+    handler.release.set()
+    build_queue.shutdown()
+
+    assert [ref.sha for ref in handler.refs] == ["a", "d", "e"]
+    assert superseded == ["b", "c"]
+    assert not running.cancelled.is_set()
+    assert queued[0].superseded_by == "c"
+    assert queued[0].report.state == BuildStatus.ERROR
+    assert queued[0].report.description == "Superseded by c"
+    assert other_branch.superseded_by is None
+    assert build_queue.stats().superseded == 2
+
+
+def test_coalescing_cancels_running_build():
+    handler = BlockingHandler()
+    build_queue = BuildQueue(handler, workers=1, coalesce=True, cancel_running=True)
+    build_queue.start()
+
+    running = build_queue.submit(make_ref("a"))
+    assert handler.started.wait(timeout=5)
+    build_queue.submit(make_ref("b"))
+
+    assert running.cancelled.is_set()
+    assert running.superseded_by == "b"
+
+    handler.release.set()
+    build_queue.shutdown()
+    assert [ref.sha for ref in handler.refs] == ["a", "b"]
+
+
+def test_submitting_active_commit_returns_existing_job():
+    handler = BlockingHandler()
+    build_queue = BuildQueue(handler, workers=1)
+    build_queue.start()
+
+    running = build_queue.submit(make_ref("a"))
+    assert handler.started.wait(timeout=5)
+    queued = build_queue.submit(make_ref("b"))
+
+    assert build_queue.submit(make_ref("a")) is running
+    assert (
+        build_queue.submit(BuildRef(repo="owner/repo", ref="refs/tags/v1", sha="b"))
+        is queued
+    )
+
+    handler.release.set()
+    build_queue.shutdown()
+
+    assert [ref.sha for ref in handler.refs] == ["a", "b"]
+    assert build_queue.stats().deduplicated == 2
+    # Finished commits are built again, results are reused by the handler
+    assert build_queue.submit(make_ref("a")) is not running
+
+
+def test_policy_caps_concurrent_builds_of_a_repository():
+    started: list[str] = []
+    release = threading.Event()
+    both_started = threading.Barrier(3, timeout=5)
+
+    def handler(job: BuildJob) -> BuildReport:
+        started.append(job.ref.sha)
+        if job.ref.sha in ("a1", "b1"):
+            both_started.wait()
+            release.wait(timeout=5)
+        return BuildReport(state=BuildStatus.SUCCESS)
+
+    build_queue = BuildQueue(handler, workers=3, policy=AdmissionPolicy(max_per_repo=1))
+    for sha, repo in [("a1", "org/a"), ("a2", "org/a"), ("b1", "org/b")]:
+        build_queue.submit(BuildRef(repo=repo, ref="refs/heads/main", sha=sha))
+    build_queue.start()
+
+    # Only the first build of each repository starts, a worker stays idle
+    both_started.wait()
+    assert sorted(started) == ["a1", "b1"]
+    release.set()
+    build_queue.shutdown()
+
+    assert started[2] == "a2"
+    assert build_queue.stats().completed == 3
+
+
+def test_async_queue_applies_policy():
+    running: dict[str, int] = {}
+    peak = 0
+
+    async def handler(job: BuildJob) -> BuildReport:
+        nonlocal peak
+        running[job.ref.repo] = running.get(job.ref.repo, 0) + 1
+        peak = max(peak, running[job.ref.repo])
+        await asyncio.sleep(0.02)
+        running[job.ref.repo] -= 1
+        return BuildReport(state=BuildStatus.SUCCESS)
+
+    build_queue = AsyncBuildQueue(
+        handler, workers=4, policy=AdmissionPolicy(max_per_repo=1)
+    )
+    jobs = [
+        build_queue.submit(BuildRef(repo=repo, ref="refs/heads/main", sha=sha))
+        for sha, repo in [("a1", "org/a"), ("a2", "org/a"), ("b1", "org/b")]
+    ]
+    build_queue.start()
+    build_queue.shutdown()
+
+    assert peak == 1
+    assert all(job.report.state == BuildStatus.SUCCESS for job in jobs)
+
+
+def test_full_queue_rejects_builds():
+    handler = BlockingHandler()
+    build_queue = BuildQueue(
+        handler, workers=1, coalesce=True, max_queued=2, max_queued_per_repo=1
+    )
+    build_queue.start()
+
+    build_queue.submit(make_ref("a"))
+    assert handler.started.wait(timeout=5)
+    build_queue.submit(make_ref("b"))
+    with pytest.raises(QueueFull) as repo_full:
+        build_queue.submit(BuildRef(repo="owner/repo", ref="refs/heads/dev", sha="c"))
+    # Replacing the queued build of the same branch does not grow the queue
+    build_queue.submit(make_ref("d"))
+    build_queue.submit(BuildRef(repo="other/repo", ref="refs/heads/main", sha="e"))
+    with pytest.raises(QueueFull) as queue_full:
+        build_queue.submit(BuildRef(repo="third/repo", ref="refs/heads/main", sha="f"))
+
+    assert repo_full.value.repo == "owner/repo"
+    assert queue_full.value.repo is None
+    handler.release.set()
+    build_queue.shutdown()
+    assert [ref.sha for ref in handler.refs] == ["a", "d", "e"]
+
+
+def test_stored_builds_are_resumed_by_a_new_queue(tmp_path):
+    store = BuildQueueStore(str(tmp_path / "queue.sqlite3"))
+    handler = BlockingHandler()
+    stopped = BuildQueue(handler, workers=1, coalesce=False, store=store)
+    stopped.start()
+    running = stopped.submit(make_ref("a"))
+    assert handler.started.wait(timeout=5)
+    queued = stopped.submit(make_ref("b"))
+    superseding = BuildQueue(handler, workers=1, coalesce=True, store=store)
+    superseding.submit(make_ref("c"))
+    superseding.submit(make_ref("d"))
+
+    # The first queue's builds are left behind as if the server had stopped
+    pending = store.pending()
+    assert [(b.ref.sha, b.running, b.attempts) for b in pending] == [
+        ("a", True, 1),
+        ("b", False, 0),
+        ("d", False, 0),
+    ]
+
+    seen: list[str] = []
+
+    def record(job: BuildJob) -> BuildReport:
+        seen.append(job.ref.sha)
+        return BuildReport(state=BuildStatus.SUCCESS)
+
+    resumed = BuildQueue(record, workers=1, store=store)
+    jobs = [resumed.resume(build) for build in pending]
+    assert resumed.resume(pending[1]) is jobs[1]
+    resumed.start()
+    resumed.shutdown()
+
+    assert [job.id for job in jobs[:2]] == [running.id, queued.id]
+    assert seen == ["a", "b", "d"]
+    assert store.pending() == []
+    handler.release.set()
+    stopped.shutdown()
+    store.close()
+
+
+def test_stats_report_wait_times_per_priority_class():
+    clock = ClockMock(fixed_time=0)
+    seen: list[str] = []
+
+    def handler(job: BuildJob) -> BuildReport:
+        seen.append(job.ref.sha)
+        return BuildReport(state=BuildStatus.SUCCESS)
+
+    build_queue = BuildQueue(
+        handler,
+        workers=1,
+        clock=clock,
+        coalesce=False,
+        priorities=Priorities.parse("main=@default,refs/tags/*"),
+    )
+    refs = [
+        BuildRef(repo="owner/repo", ref=ref, sha=sha, default_branch="main")
+        for sha, ref in [
+            ("feature", "refs/heads/feature"),
+            ("main", "refs/heads/main"),
+            ("tag", "refs/tags/v1.0"),
+        ]
+    ]
+    jobs = [build_queue.submit(ref) for ref in refs]
+    assert build_queue.stats().priorities["main"].depth == 2
+    clock._fixed_time = 10
+    build_queue.start()
+    build_queue.shutdown()
+
+    assert [job.priority for job in jobs] == ["other", "main", "main"]
+    assert seen == ["main", "tag", "feature"]
+    stats = build_queue.stats().priorities
+    assert list(stats) == ["main", "other"]
+    assert stats["main"].started == 2
+    assert stats["main"].depth == 0
+    assert stats["other"].max_wait_time == 10
+
+
+def test_async_queue_runs_builds_concurrently_on_one_loop():
+    running = 0
+    peak = 0
+    threads: set[str] = set()
+
+    async def handler(job: BuildJob) -> BuildReport:
+        nonlocal running, peak
+        threads.add(threading.current_thread().name)
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+        return BuildReport(state=BuildStatus.SUCCESS)
+
+    build_queue = AsyncBuildQueue(handler, workers=4)
+    jobs = [build_queue.submit(make_ref(sha)) for sha in "abcdef"]
+    build_queue.start()
+    build_queue.shutdown()
+
+    assert all(job.report.state == BuildStatus.SUCCESS for job in jobs)
+    assert peak == 4
+    assert threads == {"build-loop"}
+    assert build_queue.stats().completed == 6
+
+
+def test_async_queue_handler_exception_finishes_job_with_error():
+    async def handler(job: BuildJob) -> BuildReport:
+        raise RuntimeError("boom")
+
+    build_queue = AsyncBuildQueue(handler, workers=1)
+    build_queue.start()
+    job = build_queue.submit(make_ref())
+    build_queue.shutdown()
+
+    assert job.state == BuildJobState.FINISHED
+    assert job.report.state == BuildStatus.ERROR
+
+
+def test_async_queue_writes_to_the_store_off_the_loop(tmp_path):
+    threads: set[str] = set()
+
+    class RecordingStore(BuildQueueStore):
+        def start(self, build_id: str) -> None:
+            threads.add(threading.current_thread().name)
+            super().start(build_id)
+
+        def remove(self, build_id: str) -> None:
+            threads.add(threading.current_thread().name)
+            super().remove(build_id)
+
+    async def handler(job: BuildJob) -> BuildReport:
+        return BuildReport(state=BuildStatus.SUCCESS)
+
+    store = RecordingStore(str(tmp_path / "queue.sqlite3"))
+    build_queue = AsyncBuildQueue(handler, workers=2, store=store)
+    jobs = [build_queue.submit(make_ref(sha)) for sha in "abc"]
+    build_queue.start()
+    build_queue.shutdown()
+
+    assert all(job.report.state == BuildStatus.SUCCESS for job in jobs)
+    assert threads and "build-loop" not in threads
+    assert store.pending() == []
+    store.close()
+
+
+def test_queue_writes_to_the_store_outside_its_lock(tmp_path):
+    locked: list[bool] = []
+    build_queue: BuildQueue
+
+    class RecordingStore(BuildQueueStore):
+        def add(self, *args, **kwargs) -> None:
+            locked.append(build_queue._lock.locked())
+            super().add(*args, **kwargs)
+
+        def remove(self, build_id: str) -> None:
+            locked.append(build_queue._lock.locked())
+            super().remove(build_id)
+
+    store = RecordingStore(str(tmp_path / "queue.sqlite3"))
+    build_queue = BuildQueue(
+        BlockingHandler(), workers=1, coalesce=True, max_queued=1, store=store
+    )
+    build_queue.submit(make_ref("a"))
+    superseding = build_queue.submit(make_ref("b"))
+    assert build_queue.submit(make_ref("b")) is superseding
+    with pytest.raises(QueueFull):
+        build_queue.submit(BuildRef(repo="owner/repo", ref="refs/heads/dev", sha="c"))
+
+    assert [build.ref.sha for build in store.pending()] == ["b"]
+    assert locked and not any(locked)
+    store.close()
@@ -1,4 +1,18 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
 import src.builder as builder
+from src.build_log import BuildLog
+from src.config import ServerConfig
+from src.infra.cache.mirrorCache import GitMirrorCache
+from src.infra.history.impactStore import TestImpactStore
 from src.models import BuildStatus
 
 
@@ -8,7 +22,17 @@ class FakeRunCommand:
         self.raise_generic = raise_generic
         self.steps: list[str] = []
 
-    def __call__(self, step_name: str, command: list[str], cwd: str, log: list[str]):
+    def __call__(
+        self,
+        step_name: str,
+        command: list[str],
+        cwd: str,
+        log: BuildLog,
+        cancel: threading.Event | None = None,
+        ok_exit_codes: tuple[int, ...] = (0,),
+        memory_limit_mb: int | None = None,
+        timeout: float | None = None,
+    ):
         self.steps.append(step_name)
 
         if self.raise_generic:
@@ -17,21 +41,43 @@ class FakeRunCommand:
 
         if self.fail_step is not None and step_name == self.fail_step:
             # Simulate a build step failure
-            raise builder.BuildError(f"{step_name} failed", "\n".join(log))
+            raise builder.BuildError(f"{step_name} failed", log.tail())
 
-        log.append(f"{step_name} OK")
+        log.write(f"{step_name} OK\n")
         return log
 
 
+def test_build_options_from_config(tmp_path):
+    config = ServerConfig(
+        mirror_cache_dir=str(tmp_path / "mirrors"),
+        venv_cache_dir=None,
+        history_db=str(tmp_path / "history.sqlite3"),
+        test_shards=2,
+        build_memory_mb=0,
+        test_impact=True,
+        full_test_interval_hours=24,
+    )
+
+    options = builder.BuildOptions.from_config(config)
+
+    assert isinstance(options.mirror_cache, GitMirrorCache)
+    assert options.venv_cache is None
+    assert options.test_durations is not None
+    assert isinstance(options.test_impact, TestImpactStore)
+    assert options.memory_limit_mb is None
+    assert options.full_test_interval == 24 * 60 * 60
+
+
 def test_build_project_success(monkeypatch):
     fake = FakeRunCommand()
     monkeypatch.setattr(builder, "run_command", fake)
 
-    report, _ = builder.build_project(
+    report, log = builder.build_project(
         repo_url="https://example.com/owner/repo.git",
         branch="refs/heads/main",
         commit_id="abc123",
     )
+    log.discard()
 
     assert report.state == BuildStatus.SUCCESS
     assert "Git Clone" in fake.steps
@@ -80,3 +126,582 @@ def test_build_project_reports_system_error(monkeypatch):
     )
 
     assert report.state == BuildStatus.ERROR
+
+
+def test_build_project_clones_through_mirror_cache(monkeypatch, tmp_path):
+    fake = FakeRunCommand()
+    monkeypatch.setattr(builder, "run_command", fake)
+    cache = GitMirrorCache(str(tmp_path / "mirrors"), max_bytes=1 << 30)
+
+    report, _ = builder.build_project(
+        repo_url="https://example.com/owner/repo.git",
+        branch="refs/heads/main",
+        commit_id="abc123",
+        options=builder.BuildOptions(mirror_cache=cache),
+    )
+
+    assert report.state == BuildStatus.SUCCESS
+    # The venv is created concurrently, so only the checkout's steps are ordered
+    checkout = [step for step in fake.steps if "venv" not in step and "pip" not in step]
+    assert checkout[:2] == ["Update Mirror", "Git Clone"]
+    assert cache.stats().misses == 1
+
+
+class FakeVenvCache:
+    def __init__(self, hit: bool):
+        self.hit = hit
+        self.stored: list[str] = []
+
+    def key_for(self, project_dir: str) -> str:
+        return "key"
+
+    def restore(self, key: str, dest: str) -> bool:
+        return self.hit
+
+    def store(self, key: str, venv_dir: str) -> None:
+        self.stored.append(key)
+
+
+def test_build_project_venv_cache_hit_skips_venv_setup(monkeypatch):
+    fake = FakeRunCommand()
+    monkeypatch.setattr(builder, "run_command", fake)
+    cache = FakeVenvCache(hit=True)
+
+    report, _ = builder.build_project(
+        repo_url="https://example.com/owner/repo.git",
+        branch="refs/heads/main",
+        commit_id="abc123",
+        options=builder.BuildOptions(venv_cache=cache),
+    )
+
+    assert report.state == BuildStatus.SUCCESS
+    assert "Create venv" not in fake.steps
+    assert "Install requirements" in fake.steps
+    assert cache.stored == []
+
+
+def test_build_project_venv_cache_miss_stores_snapshot(monkeypatch):
+    fake = FakeRunCommand()
+    monkeypatch.setattr(builder, "run_command", fake)
+    cache = FakeVenvCache(hit=False)
+
+    report, _ = builder.build_project(
+        repo_url="https://example.com/owner/repo.git",
+        branch="refs/heads/main",
+        commit_id="abc123",
+        options=builder.BuildOptions(venv_cache=cache),
+    )
+
+    assert report.state == BuildStatus.SUCCESS
+    assert "Create venv" in fake.steps
+    assert cache.stored == ["key"]
+
+
+def test_run_command_streams_interleaved_output_to_log(tmp_path):
+    log = BuildLog(str(tmp_path / "build.log"))
+
+    builder.run_command(
+        "Echo",
+        ["sh", "-c", "echo out1; echo err1 >&2; echo out2"],
+        cwd=str(tmp_path),
+        log=log,
+    )
+    log.close()
+
+    with open(log.path) as f:
+        assert f.read() == "\n---Echo---\nout1\nerr1\nout2\n"
+
+
+def test_run_command_raises_with_log_tail_on_failure(tmp_path):
+    log = BuildLog(str(tmp_path / "build.log"))
+
+    with pytest.raises(builder.BuildError) as exc:
+        builder.run_command(
+            "Fail", ["sh", "-c", "echo broken; exit 3"], cwd=str(tmp_path), log=log
+        )
+
+    assert "exit=3" in str(exc.value)
+    assert exc.value.log_content.endswith("broken\n")
+    assert log.first_failure_offset == 0
+
+
+def test_run_command_records_step_timing(tmp_path):
+    log = BuildLog(str(tmp_path / "build.log"))
+
+    builder.run_command("Echo", ["sh", "-c", "echo hi"], cwd=str(tmp_path), log=log)
+    with pytest.raises(builder.BuildError):
+        builder.run_command("Fail", ["sh", "-c", "exit 2"], cwd=str(tmp_path), log=log)
+
+    echo, fail = log.timeline
+    assert echo.name == "Echo"
+    assert echo.exit_code == 0
+    assert echo.duration >= 0
+    assert echo.max_rss_kb > 0
+    assert fail.name == "Fail"
+    assert fail.exit_code == 2
+
+
+def test_run_command_limits_memory_of_processes(tmp_path):
+    log = BuildLog(str(tmp_path / "build.log"))
+    # The shell starts the interpreter after the limit was applied, which it inherits
+    command = [
+        "sh",
+        "-c",
+        f"sleep 0.2; {sys.executable} -c 'bytearray(1024 * 1024 * 1024)'",
+    ]
+
+    with pytest.raises(builder.BuildError) as exc:
+        builder.run_command(
+            "Allocate", command, cwd=str(tmp_path), log=log, memory_limit_mb=256
+        )
+
+    assert "MemoryError" in exc.value.log_content
+
+
+def test_run_command_kills_process_group_when_cancelled(tmp_path):
+    log = BuildLog(str(tmp_path / "build.log"))
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+
+    start = time.monotonic()
+    with pytest.raises(builder.BuildCancelled):
+        # The grandchild keeps the output pipe open, so it must be killed as well
+        builder.run_command(
+            "Sleep",
+            ["sh", "-c", "sleep 30 & sleep 30; wait"],
+            cwd=str(tmp_path),
+            log=log,
+            cancel=cancel,
+        )
+
+    assert time.monotonic() - start < 10
+    assert log.first_failure_offset is None
+
+
+def test_run_command_kills_process_group_after_timeout(tmp_path):
+    log = BuildLog(str(tmp_path / "build.log"))
+
+    start = time.monotonic()
+    with pytest.raises(builder.BuildTimeout) as exc:
+        builder.run_command(
+            "Sleep",
+            ["sh", "-c", "echo started; sleep 30 & sleep 30; wait"],
+            cwd=str(tmp_path),
+            log=log,
+            timeout=0.3,
+        )
+
+    assert time.monotonic() - start < 10
+    assert str(exc.value) == "Sleep timed out after 0.3s"
+    assert exc.value.log_content.endswith("Sleep timed out after 0.3 seconds\n")
+    assert log.first_failure_offset is not None
+    (step,) = log.timeline
+    assert step.name == "Sleep"
+    assert step.duration >= 0.3
+    assert step.exit_code == -9
+
+
+def test_run_command_times_out_command_that_closed_its_output(tmp_path):
+    log = BuildLog(str(tmp_path / "build.log"))
+
+    start = time.monotonic()
+    with pytest.raises(builder.BuildTimeout):
+        builder.run_command(
+            "Detach",
+            ["sh", "-c", "exec >/dev/null 2>&1; sleep 30"],
+            cwd=str(tmp_path),
+            log=log,
+            timeout=0.3,
+        )
+
+    assert time.monotonic() - start < 10
+
+
+def test_run_command_async_kills_process_group_after_timeout(tmp_path):
+    log = BuildLog(str(tmp_path / "build.log"))
+
+    start = time.monotonic()
+    with pytest.raises(builder.BuildTimeout):
+        asyncio.run(
+            builder.run_command_async(
+                "Sleep",
+                ["sh", "-c", "sleep 30 & sleep 30; wait"],
+                cwd=str(tmp_path),
+                log=log,
+                timeout=0.3,
+            )
+        )
+
+    assert time.monotonic() - start < 10
+    assert log.timeline[0].duration >= 0.3
+
+
+def test_build_timeout_stops_build_and_removes_work_dir(monkeypatch):
+    work_dirs: list[str] = []
+
+    def run_command(
+        step_name,
+        command,
+        cwd,
+        log,
+        cancel=None,
+        ok_exit_codes=(0,),
+        memory_limit_mb=None,
+        timeout=None,
+    ):
+        work_dirs.append(cwd)
+        if step_name == "Git Clone" and cancel.wait(timeout=5):
+            raise builder.BuildCancelled(f"{step_name} cancelled", log.tail())
+        return log
+
+    monkeypatch.setattr(builder, "run_command", run_command)
+    start = time.monotonic()
+    report, log = builder.build_project(
+        "https://example.invalid/repo.git",
+        "main",
+        "slow-sha",
+        builder.BuildOptions(build_timeout=0.2),
+    )
+
+    assert time.monotonic() - start < 5
+    assert report.state == BuildStatus.ERROR
+    assert report.description == "Build timed out after 0.2s"
+    assert log.tail().endswith("Build timed out after 0.2 seconds\n")
+    assert not os.path.exists(work_dirs[0])
+    log.discard()
+
+
+def test_build_project_reports_cancelled_build_as_error():
+    cancel = threading.Event()
+    cancel.set()
+
+    report, _ = builder.build_project(
+        "https://example.invalid/repo.git", "main", "cancelled-sha", cancel=cancel
+    )
+
+    assert report.state == BuildStatus.ERROR
+    assert report.description == "Build cancelled"
+
+
+def test_concurrent_builds_of_same_commit_use_separate_work_dirs(monkeypatch):
+    work_dirs: list[str] = []
+
+    def record_work_dir(
+        step_name,
+        command,
+        cwd,
+        log,
+        cancel=None,
+        ok_exit_codes=(0,),
+        memory_limit_mb=None,
+        timeout=None,
+    ):
+        if step_name == "Git Clone":
+            work_dirs.append(cwd)
+        return log
+
+    monkeypatch.setattr(builder, "run_command", record_work_dir)
+    builder.build_project("https://example.invalid/repo.git", "main", "same-sha")
+    builder.build_project("https://example.invalid/repo.git", "main", "same-sha")
+
+    assert len(set(work_dirs)) == 2
+
+
+def test_run_command_async_streams_output_and_records_step(tmp_path):
+    log = BuildLog(str(tmp_path / "build.log"))
+
+    asyncio.run(
+        builder.run_command_async(
+            "Echo",
+            ["sh", "-c", "echo out; echo err >&2"],
+            cwd=str(tmp_path),
+            log=log,
+        )
+    )
+    with pytest.raises(builder.BuildError):
+        asyncio.run(
+            builder.run_command_async(
+                "Fail", ["sh", "-c", "exit 4"], cwd=str(tmp_path), log=log
+            )
+        )
+    log.close()
+
+    with open(log.path) as f:
+        assert f.read().startswith("\n---Echo---\nout\nerr\n")
+    assert [(step.name, step.exit_code) for step in log.timeline] == [
+        ("Echo", 0),
+        ("Fail", 4),
+    ]
+
+
+def test_run_command_async_kills_process_group_when_cancelled(tmp_path):
+    log = BuildLog(str(tmp_path / "build.log"))
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+
+    start = time.monotonic()
+    with pytest.raises(builder.BuildCancelled):
+        asyncio.run(
+            builder.run_command_async(
+                "Sleep",
+                ["sh", "-c", "sleep 30 & sleep 30; wait"],
+                cwd=str(tmp_path),
+                log=log,
+                cancel=cancel,
+            )
+        )
+
+    assert time.monotonic() - start < 10
+
+
+def test_build_project_async_runs_same_steps(monkeypatch):
+    steps: list[str] = []
+
+    async def fake_run_command_async(
+        step_name,
+        command,
+        cwd,
+        log,
+        cancel=None,
+        ok_exit_codes=(0,),
+        memory_limit_mb=None,
+        timeout=None,
+    ):
+        steps.append(step_name)
+        return log
+
+    monkeypatch.setattr(builder, "run_command_async", fake_run_command_async)
+    report, _ = asyncio.run(
+        builder.build_project_async("https://example.invalid/repo.git", "main", "sha")
+    )
+
+    assert report.state == BuildStatus.SUCCESS
+    assert sorted(steps[:5]) == [
+        "Create venv",
+        "Git Checkout Branch",
+        "Git Checkout Commit",
+        "Git Clone",
+        "Upgrade pip",
+    ]
+    assert steps[5:] == ["Install requirements", "Syntax Checking", "Unit Tests"]
+
+
+def test_independent_stages_run_concurrently_and_log_in_order(monkeypatch):
+    both_started = threading.Barrier(2, timeout=5)
+
+    def run_command(
+        step_name,
+        command,
+        cwd,
+        log,
+        cancel=None,
+        ok_exit_codes=(0,),
+        memory_limit_mb=None,
+        timeout=None,
+    ):
+        # Deadlocks unless cloning and creating the venv overlap
+        if step_name in ("Git Clone", "Create venv"):
+            both_started.wait()
+        log.section(step_name)
+        log.write(f"{step_name} OK\n")
+        return log
+
+    monkeypatch.setattr(builder, "run_command", run_command)
+    report, log = builder.build_project(
+        "https://example.invalid/repo.git", "main", "parallel-sha"
+    )
+
+    with open(log.path) as f:
+        sections = [line for line in f.read().splitlines() if line.startswith("---")]
+    log.discard()
+
+    assert report.state == BuildStatus.SUCCESS
+    assert sections == [
+        "---Git Clone---",
+        "---Git Checkout Branch---",
+        "---Git Checkout Commit---",
+        "---Create venv---",
+        "---Upgrade pip---",
+        "---Install requirements---",
+        "---Syntax Checking---",
+        "---Unit Tests---",
+    ]
+
+
+def test_failed_stage_kills_concurrent_stages(monkeypatch):
+    def run_command(
+        step_name,
+        command,
+        cwd,
+        log,
+        cancel=None,
+        ok_exit_codes=(0,),
+        memory_limit_mb=None,
+        timeout=None,
+    ):
+        if step_name == "Git Clone":
+            log.section(step_name)
+            log.mark_failure()
+            raise builder.BuildError("Git Clone failed", log.tail())
+        if step_name == "Create venv" and not cancel.wait(timeout=5):
+            return log
+        raise builder.BuildCancelled(f"{step_name} cancelled", log.tail())
+
+    monkeypatch.setattr(builder, "run_command", run_command)
+    start = time.monotonic()
+    report, log = builder.build_project(
+        "https://example.invalid/repo.git", "main", "failing-sha"
+    )
+    log.discard()
+
+    assert report.state == BuildStatus.FAILURE
+    assert time.monotonic() - start < 5
+    assert log.first_failure_offset == 0
+
+
+def test_stages_must_be_declared_after_their_dependencies(tmp_path):
+    log = BuildLog(str(tmp_path / "build.log"))
+    stages = [
+        builder.BuildStage("Test", lambda log: iter(()), needs=("Install",)),
+        builder.BuildStage("Install", lambda log: iter(())),
+    ]
+
+    with pytest.raises(ValueError):
+        builder.run_stages(stages, log)
+
+
+class FakeDurations:
+    def __init__(self, durations: dict[str, float]):
+        self.stored = durations
+
+    def durations(self, repo: str) -> dict[str, float]:
+        return dict(self.stored)
+
+    def record(self, repo: str, durations: dict[str, float]) -> None:
+        self.stored.update(durations)
+
+
+def test_sharded_tests_merge_reports_and_record_durations(monkeypatch):
+    collected = "tests/a_test.py::test_a\ntests/b_test.py::test_b\n"
+    monkeypatch.setattr(
+        builder.subprocess,
+        "run",
+        lambda *args, **kwargs: subprocess.CompletedProcess(args, 0, collected, ""),
+    )
+    shards: dict[str, list[str]] = {}
+
+    def run_command(
+        step_name,
+        command,
+        cwd,
+        log,
+        cancel=None,
+        ok_exit_codes=(0,),
+        memory_limit_mb=None,
+        timeout=None,
+    ):
+        if step_name.startswith("Unit Tests"):
+            assert ok_exit_codes == (0, 1)
+            shards[step_name] = command[4:]
+            module = command[4]
+            outcome = "<failure/>" if module == "tests/b_test.py" else ""
+            junit_path = command[3].removeprefix("--junitxml=")
+            with open(junit_path, "w") as f:
+                f.write(
+                    f'<testsuites><testsuite><testcase file="{module}" name="t" '
+                    f'time="2.5">{outcome}</testcase></testsuite></testsuites>'
+                )
+        return log
+
+    monkeypatch.setattr(builder, "run_command", run_command)
+    durations = FakeDurations({"tests/a_test.py": 5.0})
+    report, log = builder.build_project(
+        "https://example.invalid/repo.git",
+        "main",
+        "sharded-sha",
+        options=builder.BuildOptions(test_shards=2, test_durations=durations),
+    )
+    with open(log.path) as f:
+        output = f.read()
+    log.discard()
+
+    assert shards == {
+        "Unit Tests 1/2": ["tests/a_test.py"],
+        "Unit Tests 2/2": ["tests/b_test.py"],
+    }
+    assert report.state == BuildStatus.FAILURE
+    assert "2 tests, 1 failed, 0 skipped" in output
+    assert "FAILED tests/b_test.py::t" in output
+    assert durations.stored == {"tests/a_test.py": 2.5, "tests/b_test.py": 2.5}
+
+
+def test_test_impact_runs_affected_tests_and_records_coverage(monkeypatch, tmp_path):
+    repo_url = "https://example.invalid/repo.git"
+    store = TestImpactStore(str(tmp_path / "history.sqlite3"))
+    store.record(
+        repo_url,
+        {"tests/a_test.py": {"src/a.py"}, "tests/b_test.py": {"src/b.py"}},
+        replace_all=True,
+    )
+    store.record_commit(repo_url, "main", "base-sha", full_run=True)
+    git_commands: list[list[str]] = []
+
+    def run(command, **kwargs):
+        if command[0] == "git":
+            git_commands.append(command)
+            output = "src/a.py\0README.md\0" if command[1] == "diff" else ""
+            return subprocess.CompletedProcess(command, 0, output, "")
+        collected = "tests/a_test.py::test_a\ntests/b_test.py::test_b\n"
+        return subprocess.CompletedProcess(command, 0, collected, "")
+
+    commands: dict[str, list[str]] = {}
+
+    def run_command(
+        step_name,
+        command,
+        cwd,
+        log,
+        cancel=None,
+        ok_exit_codes=(0,),
+        memory_limit_mb=None,
+        timeout=None,
+    ):
+        commands[step_name] = command
+        if step_name == "Coverage Report":
+            report = {
+                "files": {
+                    "src/a.py": {"contexts": {"2": ["a_test.test_a"]}},
+                    "src/new.py": {"contexts": {"5": ["a_test.test_a"]}},
+                    "tests/a_test.py": {"contexts": {"3": ["a_test.test_a"]}},
+                }
+            }
+            with open(command[-1], "w") as f:
+                json.dump(report, f)
+        return log
+
+    monkeypatch.setattr(builder.subprocess, "run", run)
+    monkeypatch.setattr(builder, "run_command", run_command)
+    report, log = builder.build_project(
+        repo_url,
+        "main",
+        "head-sha",
+        options=builder.BuildOptions(test_impact=store),
+    )
+    with open(log.path) as f:
+        output = f.read()
+    log.discard()
+
+    assert report.state == BuildStatus.SUCCESS
+    assert "coverage" in commands["Install requirements"]
+    assert commands["Unit Tests"][1:4] == ["-m", "coverage", "run"]
+    assert commands["Unit Tests"][-1:] == ["tests/a_test.py"]
+    assert ["git", "merge-base", "--is-ancestor", "base-sha", "HEAD"] in git_commands
+    assert "Since base-sh: 2 changed files affect 1 of 2 test modules" in output
+    assert store.impact(repo_url) == {
+        "src/a.py": {"tests/a_test.py"},
+        "src/new.py": {"tests/a_test.py"},
+        "tests/a_test.py": {"tests/a_test.py"},
+        "src/b.py": {"tests/b_test.py"},
+    }
+    assert store.passed_commits(repo_url, "main") == ["head-sha", "base-sha"]
+    store.close()
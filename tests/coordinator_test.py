@@ -0,0 +1,135 @@
+import threading
+
+from src.build_log import BuildLog
+from src.build_queue import BuildJob
+from src.coordinator import AgentPool
+from src.models import BuildRef, BuildReport, BuildStatus, StepTiming
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_job(build_id: str) -> BuildJob:
+    return BuildJob(
+        id=build_id,
+        ref=BuildRef("owner/repo", "refs/heads/main", "a" * 40),
+        enqueued_at=0,
+    )
+
+
+def run_in_background(pool: AgentPool, job: BuildJob, log: BuildLog) -> dict:
+    result: dict = {}
+    thread = threading.Thread(target=lambda: result.update(report=pool.run(job, log)))
+    thread.start()
+    result["thread"] = thread
+    return result
+
+
+def lease_eventually(pool: AgentPool, agent_id: str) -> BuildJob:
+    job = pool.lease(agent_id, timeout=5)
+    assert job is not None
+    return job
+
+
+def test_agent_leases_only_up_to_its_slots(tmp_path):
+    pool = AgentPool()
+    agent = pool.register("agent", cores=2, memory_mb=1024, slots=1)
+    first = run_in_background(pool, make_job("b1"), BuildLog(str(tmp_path / "1.log")))
+    second = run_in_background(pool, make_job("b2"), BuildLog(str(tmp_path / "2.log")))
+
+    leased = lease_eventually(pool, agent.id)
+    assert pool.lease(agent.id) is None
+
+    pool.complete(agent.id, leased.id, BuildReport(BuildStatus.SUCCESS), [])
+    assert lease_eventually(pool, agent.id).id != leased.id
+    pool.complete(
+        agent.id,
+        "b1" if leased.id == "b2" else "b2",
+        BuildReport(BuildStatus.SUCCESS),
+        [],
+    )
+
+    for result in (first, second):
+        result["thread"].join(timeout=5)
+        assert result["report"].state == BuildStatus.SUCCESS
+
+
+def test_builds_of_dead_agent_are_requeued(tmp_path):
+    clock = FakeClock()
+    pool = AgentPool(agent_timeout=30, clock=clock)
+    dead = pool.register("dead", cores=1, memory_mb=1024, slots=1)
+    log = BuildLog(str(tmp_path / "build.log"))
+    result = run_in_background(pool, make_job("b1"), log)
+
+    lease_eventually(pool, dead.id)
+    pool.append_log(dead.id, "b1", b"partial output\n")
+    clock.now = 31
+    alive = pool.register("alive", cores=1, memory_mb=1024, slots=1)
+
+    assert lease_eventually(pool, alive.id).id == "b1"
+    pool.append_log(alive.id, "b1", b"\n---Unit Tests---\nfailed\n")
+    offset = log.size
+    pool.complete(
+        alive.id,
+        "b1",
+        BuildReport(BuildStatus.FAILURE),
+        [StepTiming(name="Unit Tests", started_at=0, duration=1)],
+        first_failure_offset=0,
+    )
+    result["thread"].join(timeout=5)
+
+    with open(log.path) as f:
+        content = f.read()
+    assert result["report"].state == BuildStatus.FAILURE
+    assert "stopped responding" in content
+    assert log.first_failure_offset == offset - len("\n---Unit Tests---\nfailed\n")
+    assert [step.name for step in log.timeline] == ["Unit Tests"]
+    assert [agent.name for agent in pool.agents()] == ["alive"]
+
+
+def test_build_errors_after_max_attempts(tmp_path):
+    clock = FakeClock()
+    pool = AgentPool(agent_timeout=30, max_attempts=1, clock=clock)
+    agent = pool.register("agent", cores=1, memory_mb=1024, slots=1)
+    result = run_in_background(
+        pool, make_job("b1"), BuildLog(str(tmp_path / "build.log"))
+    )
+
+    lease_eventually(pool, agent.id)
+    clock.now = 31
+    result["thread"].join(timeout=5)
+
+    assert result["report"].state == BuildStatus.ERROR
+    assert pool.queued() == 0
+
+
+def test_cancelled_build_is_sent_to_its_agent(tmp_path):
+    pool = AgentPool()
+    agent = pool.register("agent", cores=1, memory_mb=1024, slots=1)
+    job = make_job("b1")
+    result = run_in_background(pool, job, BuildLog(str(tmp_path / "build.log")))
+    lease_eventually(pool, agent.id)
+
+    job.cancelled.set()
+
+    assert pool.heartbeat(agent.id) == ["b1"]
+    assert pool.heartbeat(agent.id) == []
+    pool.complete(agent.id, "b1", BuildReport(BuildStatus.ERROR), [])
+    result["thread"].join(timeout=5)
+    assert result["report"].state == BuildStatus.ERROR
+
+
+def test_cancelled_build_is_dropped_from_queue(tmp_path):
+    pool = AgentPool()
+    job = make_job("b1")
+    job.cancelled.set()
+
+    report = pool.run(job, BuildLog(str(tmp_path / "build.log")))
+
+    assert report.state == BuildStatus.ERROR
+    assert pool.queued() == 0
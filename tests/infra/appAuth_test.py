@@ -1,5 +1,12 @@
+import os
+import threading
+import time
 from typing import Tuple
-from src.infra.githubAuth.appAuth import GithubAppAuth, GithubAppConfig
+from src.infra.githubAuth.appAuth import (
+    GithubAppAuth,
+    GithubAppConfig,
+    GithubTokenResponse,
+)
 from tests.mocks.httpClientMock import MockHttpClient
 from tests.mocks.clockMock import ClockMock
 import pytest
@@ -113,3 +120,101 @@ def test_fetch_installation_token_raises_on_client_exception():
 
     with pytest.raises(TransportError):
         auth._fetch_installation_token(installation_id=123)
+
+
+class BlockingHttpClient(MockHttpClient):
+    """Holds every request until `release` is set, so concurrent callers pile up."""
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.release = threading.Event()
+
+    def post(self, url, data=None, json=None, **kwargs):
+        self.release.wait(timeout=5)
+        return super().post(url, data=data, json=json, **kwargs)
+
+
+def test_concurrent_requests_mint_a_single_token():
+    appConfig = GithubAppConfig(client_id="mock", private_key_pem="key")
+    client = BlockingHttpClient(
+        response_json={"token": "inst_token_1", "expires_at": "2030-01-01T00:00:00Z"},
+    )
+    clock = ClockMock(fixed_time=0)
+    auth = GithubAppAuth(config=appConfig, client=client, clock=clock)
+    auth._get_jwt = lambda: "mock_jwt"
+
+    tokens = []
+    threads = [
+        threading.Thread(
+            target=lambda: tokens.append(
+                auth.get_token(GithubAuthContext(installation_id=123))
+            )
+        )
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    client.release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert tokens == ["inst_token_1"] * 8
+    assert client.called_times == 1
+
+
+def test_token_close_to_expiry_is_refreshed_in_background():
+    appConfig = GithubAppConfig(client_id="mock", private_key_pem="key")
+    client = MockHttpClient(
+        response_json={"token": "inst_token_2", "expires_at": "2030-01-01T00:00:00Z"},
+    )
+    clock = ClockMock(fixed_time=1000)
+    auth = GithubAppAuth(
+        config=appConfig, client=client, clock=clock, refresh_margin=300
+    )
+    auth._get_jwt = lambda: "mock_jwt"
+    auth._installation_token_cache[123] = GithubTokenResponse("inst_token_1", 1200)
+
+    # Still valid, so it is handed out while the replacement is minted
+    assert auth.get_token(GithubAuthContext(installation_id=123)) == "inst_token_1"
+    with auth._installation_lock(123):
+        pass
+
+    assert client.called_times == 1
+    assert auth.get_token(GithubAuthContext(installation_id=123)) == "inst_token_2"
+
+
+def test_installation_tokens_are_persisted(tmp_path):
+    path = str(tmp_path / "tokens.json")
+    appConfig = GithubAppConfig(client_id="mock", private_key_pem="key")
+    client = MockHttpClient(
+        response_json={"token": "inst_token_1", "expires_at": "2030-01-01T00:00:00Z"},
+    )
+    clock = ClockMock(fixed_time=0)
+    auth = GithubAppAuth(config=appConfig, client=client, clock=clock, cache_path=path)
+    auth._get_jwt = lambda: "mock_jwt"
+    auth.get_token(GithubAuthContext(installation_id=123))
+
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+    restarted = GithubAppAuth(
+        config=appConfig, client=client, clock=clock, cache_path=path
+    )
+    assert restarted.get_token(GithubAuthContext(installation_id=123)) == "inst_token_1"
+    assert client.called_times == 1
+
+
+def test_expired_persisted_tokens_are_ignored(tmp_path):
+    path = tmp_path / "tokens.json"
+    path.write_text('{"123": {"token": "old", "expires_at": 1030}}')
+    appConfig = GithubAppConfig(client_id="mock", private_key_pem="key")
+    client = MockHttpClient(
+        response_json={"token": "inst_token_1", "expires_at": "2030-01-01T00:00:00Z"},
+    )
+    clock = ClockMock(fixed_time=1000)
+    auth = GithubAppAuth(
+        config=appConfig, client=client, clock=clock, cache_path=str(path)
+    )
+    auth._get_jwt = lambda: "mock_jwt"
+
+    assert auth.get_token(GithubAuthContext(installation_id=123)) == "inst_token_1"
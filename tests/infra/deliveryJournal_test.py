@@ -0,0 +1,76 @@
+from src.infra.history.deliveryJournal import DeliveryJournal
+from src.models import BuildRef
+from tests.mocks.clockMock import ClockMock
+
+
+def make_ref(sha: str) -> BuildRef:
+    return BuildRef(
+        repo="owner/repo", ref="refs/heads/main", sha=sha, installation_id=7
+    )
+
+
+def test_deliveries_are_accepted_once(tmp_path):
+    journal = DeliveryJournal(str(tmp_path / "deliveries.jsonl"))
+
+    assert journal.accept("d1", make_ref("a"))
+    assert not journal.accept("d1", make_ref("b"))
+    assert "d1" in journal
+    assert "d2" not in journal
+    assert [d.ref.sha for d in journal.unfinished()] == ["a"]
+    journal.close()
+
+
+def test_journal_survives_restart_and_lists_unfinished(tmp_path):
+    path = str(tmp_path / "deliveries.jsonl")
+    clock = ClockMock(fixed_time=100)
+    journal = DeliveryJournal(path, clock=clock)
+    journal.accept("d1", make_ref("a"))
+    journal.accept("d2", make_ref("a"))
+    journal.accept("d3", make_ref("b"))
+    journal.accept("d4", make_ref("c"))
+    journal.finish("owner/repo", "a")
+    journal.drop("d4")
+    journal.close()
+
+    reopened = DeliveryJournal(path, clock=clock)
+
+    assert "d1" in reopened and "d2" in reopened
+    assert "d4" not in reopened
+    (unfinished,) = reopened.unfinished()
+    assert unfinished.id == "d3"
+    assert unfinished.ref == make_ref("b")
+    reopened.close()
+
+
+def test_torn_record_is_skipped(tmp_path):
+    path = tmp_path / "deliveries.jsonl"
+    journal = DeliveryJournal(str(path))
+    journal.accept("d1", make_ref("a"))
+    journal.close()
+    with open(path, "a") as f:
+        f.write('{"op": "accept", "id": "d2", "re')
+
+    reopened = DeliveryJournal(str(path))
+    reopened.accept("d3", make_ref("c"))
+    reopened.close()
+
+    assert [d.id for d in DeliveryJournal(str(path)).unfinished()] == ["d1", "d3"]
+
+
+def test_expired_deliveries_are_compacted_away(tmp_path):
+    path = tmp_path / "deliveries.jsonl"
+    clock = ClockMock(fixed_time=1000)
+    journal = DeliveryJournal(str(path), ttl=60, clock=clock)
+    journal.accept("old", make_ref("a"))
+    journal.finish("owner/repo", "a")
+    clock._fixed_time = 1050
+    journal.accept("new", make_ref("b"))
+    journal.close()
+
+    clock._fixed_time = 1070
+    reopened = DeliveryJournal(str(path), ttl=60, clock=clock)
+
+    assert "old" not in reopened
+    assert "new" in reopened
+    assert len(path.read_text().splitlines()) == 1
+    reopened.close()
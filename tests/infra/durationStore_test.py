@@ -0,0 +1,14 @@
+from src.infra.history.durationStore import TestDurationStore
+
+
+def test_durations_are_stored_per_repository(tmp_path):
+    store = TestDurationStore(str(tmp_path / "history.sqlite3"))
+    store.record("owner/repo", {"tests/a_test.py": 1.5, "tests/b_test.py": 2.0})
+    store.record("owner/repo", {"tests/a_test.py": 3.0})
+    store.record("owner/other", {"tests/a_test.py": 9.0})
+
+    assert store.durations("owner/repo") == {
+        "tests/a_test.py": 3.0,
+        "tests/b_test.py": 2.0,
+    }
+    store.close()
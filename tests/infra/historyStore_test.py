@@ -0,0 +1,172 @@
+import json
+import sqlite3
+from dataclasses import replace
+from datetime import datetime, timedelta
+
+from src.infra.history.historyStore import (
+    BuildHistoryStore,
+    HistoryQuery,
+    HistoryRecord,
+    repo_name_from_url,
+)
+from src.infra.history.logStore import LogStore
+from src.models import BuildStatus, LogEntry, LogType
+
+
+def make_record(
+    i: int,
+    repo: str = "owner/repo",
+    refspec: str = "refs/heads/main",
+    status: BuildStatus = BuildStatus.SUCCESS,
+) -> HistoryRecord:
+    return HistoryRecord(
+        repo=repo,
+        refspec=refspec,
+        commit_sha=f"sha{i}",
+        status=status,
+        finished_at=datetime(2025, 1, 1) + timedelta(minutes=i),
+        duration=float(i),
+        log_file=f"sha{i}_INFO.log",
+    )
+
+
+def test_query_pages_through_history_most_recent_first(tmp_path):
+    store = BuildHistoryStore(str(tmp_path / "history.sqlite3"))
+    for i in range(5):
+        store.add(make_record(i))
+
+    first = store.query(HistoryQuery(limit=2))
+    second = store.query(HistoryQuery(limit=2, cursor=first.next_cursor))
+    last = store.query(HistoryQuery(limit=2, cursor=second.next_cursor))
+
+    assert [r.commit_sha for r in first.records] == ["sha4", "sha3"]
+    assert [r.commit_sha for r in second.records] == ["sha2", "sha1"]
+    assert [r.commit_sha for r in last.records] == ["sha0"]
+    assert last.next_cursor is None
+
+
+def test_query_filters(tmp_path):
+    store = BuildHistoryStore(str(tmp_path / "history.sqlite3"))
+    store.add(make_record(0, repo="owner/other"))
+    store.add(make_record(1, refspec="refs/heads/feature"))
+    store.add(make_record(2, status=BuildStatus.FAILURE))
+    store.add(make_record(3))
+
+    def shas(query: HistoryQuery) -> list[str]:
+        return [r.commit_sha for r in store.query(query).records]
+
+    assert shas(HistoryQuery(repo="owner/other")) == ["sha0"]
+    assert shas(HistoryQuery(branch="feature")) == ["sha1"]
+    assert shas(HistoryQuery(status=BuildStatus.FAILURE)) == ["sha2"]
+    assert shas(
+        HistoryQuery(since=datetime(2025, 1, 1, 0, 1), until=datetime(2025, 1, 1, 0, 3))
+    ) == ["sha2", "sha1"]
+
+
+def test_import_log_directory_indexes_legacy_logs(tmp_path):
+    log_dir = tmp_path / "logs"
+    log_dir.mkdir()
+    (log_dir / "abc_INFO.log").write_text(
+        json.dumps(
+            {
+                "type": "INFO",
+                "repo_url": "https://github.com/owner/repo.git",
+                "refspec": "refs/heads/main",
+                "commit_SHA": "abc",
+                "date_time": 1735689600000,
+                "status": "success",
+                "gradle_output": "output",
+            }
+        )
+    )
+    (log_dir / "broken.log").write_text("not json")
+    store = BuildHistoryStore(str(tmp_path / "history.sqlite3"))
+
+    assert store.is_empty()
+    assert store.import_log_directory(str(log_dir)) == 1
+
+    (record,) = store.query(HistoryQuery()).records
+    assert record.repo == "owner/repo"
+    assert record.log_file == "abc_INFO.log"
+    assert record.status == BuildStatus.SUCCESS
+
+
+def test_import_log_directory_restores_builds_saved_by_the_log_store(tmp_path):
+    log_dir = str(tmp_path / "logs")
+    entry = LogEntry(
+        type=LogType.ERROR,
+        repo_url="https://github.com/owner/repo.git",
+        refspec="refs/heads/main",
+        commit_SHA="abc",
+        date_time=datetime(2025, 1, 1),
+        status=BuildStatus.FAILURE,
+        gradle_output="output",
+        duration=12.5,
+        config_hash="config",
+        build_id="build-1",
+    )
+    filename = LogStore(log_dir).save(entry)
+    store = BuildHistoryStore(str(tmp_path / "history.sqlite3"))
+
+    assert store.import_log_directory(log_dir) == 1
+
+    (record,) = store.query(HistoryQuery()).records
+    assert record.log_file == filename
+    assert record.status == BuildStatus.FAILURE
+    assert record.duration == 12.5
+    assert record.config_hash == "config"
+    assert record.build_id == "build-1"
+
+
+def test_repo_name_from_url():
+    assert repo_name_from_url("https://github.com/owner/repo.git") == "owner/repo"
+    assert repo_name_from_url("https://github.com/owner/repo") == "owner/repo"
+
+
+def test_find_result_returns_latest_conclusive_build(tmp_path):
+    store = BuildHistoryStore(str(tmp_path / "history.sqlite3"))
+    store.add(replace(make_record(0), commit_sha="abc", config_hash="v1"))
+    store.add(
+        replace(
+            make_record(1, status=BuildStatus.FAILURE),
+            commit_sha="abc",
+            config_hash="v1",
+        )
+    )
+    store.add(
+        replace(
+            make_record(2, status=BuildStatus.ERROR), commit_sha="abc", config_hash="v1"
+        )
+    )
+
+    found = store.find_result("owner/repo", "abc", "v1")
+
+    assert found is not None
+    assert found.status == BuildStatus.FAILURE
+    assert found.config_hash == "v1"
+    assert store.find_result("owner/repo", "abc", "v2") is None
+    assert store.find_result("owner/other", "abc", "v1") is None
+
+
+def test_opening_old_database_adds_config_hash_column(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE builds (id INTEGER PRIMARY KEY AUTOINCREMENT, repo TEXT NOT NULL, "
+        "refspec TEXT NOT NULL, branch TEXT NOT NULL, sha TEXT NOT NULL, "
+        "status TEXT NOT NULL, finished_at INTEGER NOT NULL, duration REAL, "
+        "log_file TEXT NOT NULL)"
+    )
+    db.execute(
+        "INSERT INTO builds (repo, refspec, branch, sha, status, finished_at, log_file) "
+        "VALUES ('owner/repo', 'refs/heads/main', 'main', 'abc', 'success', 0, 'f')"
+    )
+    db.commit()
+    db.close()
+
+    store = BuildHistoryStore(path)
+
+    [record] = store.query(HistoryQuery()).records
+    assert record.config_hash is None
+    assert record.build_id is None
+    assert store.find_result("owner/repo", "abc", "v1") is None
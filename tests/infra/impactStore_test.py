@@ -0,0 +1,49 @@
+from src.infra.history.impactStore import TestImpactStore
+
+REPO = "https://example.com/owner/repo.git"
+
+
+def test_recorded_impact_replaces_the_modules_that_ran(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    store = TestImpactStore(path)
+    store.record(
+        REPO,
+        {"tests/a_test.py": {"src/a.py"}, "tests/b_test.py": {"src/a.py", "src/b.py"}},
+        replace_all=True,
+    )
+    store.record(REPO, {"tests/a_test.py": {"src/c.py"}})
+    store.close()
+
+    reopened = TestImpactStore(path)
+
+    assert reopened.impact(REPO) == {
+        "src/a.py": {"tests/b_test.py"},
+        "src/b.py": {"tests/b_test.py"},
+        "src/c.py": {"tests/a_test.py"},
+    }
+    reopened.record(REPO, {"tests/c_test.py": {"src/c.py"}}, replace_all=True)
+    assert reopened.impact(REPO) == {"src/c.py": {"tests/c_test.py"}}
+    assert reopened.impact("other") == {}
+    reopened.close()
+
+
+def test_passed_commits_and_last_full_run(tmp_path, monkeypatch):
+    store = TestImpactStore(str(tmp_path / "history.sqlite3"))
+    now = [1000.0]
+    monkeypatch.setattr("src.infra.history.impactStore.time.time", lambda: now[0])
+
+    assert store.last_full_run(REPO, "main") is None
+    store.record_commit(REPO, "main", "a", full_run=True)
+    for i in range(60):
+        now[0] += 1
+        store.record_commit(REPO, "main", f"c{i}", full_run=False)
+    store.record_commit(REPO, "feature", "f", full_run=False)
+
+    commits = store.passed_commits(REPO, "main")
+    assert commits[0] == "c59"
+    # Older commits are forgotten, except the last full run
+    assert len(commits) == 51
+    assert commits[-1] == "a"
+    assert store.last_full_run(REPO, "main") == 1000.0
+    assert store.last_full_run(REPO, "feature") is None
+    store.close()
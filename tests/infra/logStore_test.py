@@ -0,0 +1,118 @@
+import gzip
+import json
+from datetime import datetime
+
+from src.infra.history.logStore import ChunkedLogReader, ChunkedLogWriter, LogStore
+from src.models import BuildStatus, LogEntry, LogType
+
+
+def make_entry(output: str, output_path: str | None = None) -> LogEntry:
+    return LogEntry(
+        type=LogType.ERROR,
+        repo_url="https://github.com/owner/repo.git",
+        refspec="refs/heads/main",
+        commit_SHA="abc123",
+        date_time=datetime(2025, 1, 1),
+        status=BuildStatus.FAILURE,
+        gradle_output=output,
+        output_path=output_path,
+    )
+
+
+def test_chunks_are_independently_decompressible(tmp_path):
+    path = str(tmp_path / "output.gz")
+    data = b"".join(f"line {i}\n".encode() for i in range(1000))
+    writer = ChunkedLogWriter(path, chunk_size=1000)
+    writer.write(data[:2500])
+    writer.write(data[2500:])
+    chunks = writer.close()
+
+    assert len(chunks) == -(-len(data) // 1000)
+    with open(path, "rb") as f:
+        raw = f.read()
+    # The file as a whole is a valid multi-member gzip file
+    assert gzip.decompress(raw) == data
+
+    middle = chunks[3]
+    member = raw[
+        middle.compressed_offset : middle.compressed_offset + middle.compressed_size
+    ]
+    assert gzip.decompress(member) == data[middle.offset : middle.offset + middle.size]
+
+
+def test_reader_returns_ranges_across_chunks(tmp_path):
+    path = str(tmp_path / "output.gz")
+    data = bytes(range(256)) * 40
+    writer = ChunkedLogWriter(path, chunk_size=1000)
+    writer.write(data)
+    reader = ChunkedLogReader(path, writer.close())
+
+    assert reader.size == len(data)
+    assert reader.read() == data
+    assert reader.read(950, 1100) == data[950:2050]
+    assert reader.read(len(data) - 5, 100) == data[-5:]
+    assert reader.read(len(data) + 1, 10) == b""
+
+
+def test_store_separates_metadata_and_compressed_output(tmp_path):
+    output = "PASSED test_something\n" * 10_000
+    output_path = tmp_path / "build.log"
+    output_path.write_text(output)
+    store = LogStore(str(tmp_path / "logs"), chunk_size=4096)
+
+    filename = store.save(make_entry("tail", str(output_path)))
+
+    metadata = store.metadata(filename)
+    assert metadata is not None
+    assert metadata["commit_SHA"] == "abc123"
+    assert "gradle_output" not in metadata
+    assert metadata["output"]["size"] == len(output)
+
+    reader = store.reader(metadata)
+    assert reader is not None
+    assert reader.read().decode() == output
+    compressed_size = (tmp_path / "logs" / metadata["output"]["file"]).stat().st_size
+    assert compressed_size < len(output) / 10
+    # Both files were moved into place, no temporary files are left behind
+    assert not list((tmp_path / "logs").glob("*.tmp"))
+
+
+def test_store_keeps_logs_of_repeated_builds_of_a_commit(tmp_path):
+    store = LogStore(str(tmp_path / "logs"))
+    first = make_entry("first build")
+    first.build_id = "build-1"
+    second = make_entry("second build")
+    second.build_id = "build-2"
+
+    first_file = store.save(first)
+    second_file = store.save(second)
+
+    assert first_file != second_file
+    for filename, output in (
+        (first_file, "first build"),
+        (second_file, "second build"),
+    ):
+        reader = store.reader(store.metadata(filename) or {})
+        assert reader is not None
+        assert reader.read().decode() == output
+
+
+def test_store_reads_logs_in_old_format(tmp_path):
+    log_dir = tmp_path / "logs"
+    log_dir.mkdir()
+    (log_dir / "old_INFO.log").write_text(str(make_entry("inline output")))
+    store = LogStore(str(log_dir))
+
+    metadata = store.metadata("old_INFO.log")
+
+    assert metadata is not None
+    assert metadata["gradle_output"] == "inline output"
+    assert store.reader(metadata) is None
+
+
+def test_store_rejects_paths_outside_log_dir(tmp_path):
+    store = LogStore(str(tmp_path / "logs"))
+    (tmp_path / "secret").write_text(json.dumps({"secret": True}))
+
+    assert store.path_for("../secret") is None
+    assert store.metadata("..") is None
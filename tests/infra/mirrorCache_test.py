@@ -0,0 +1,132 @@
+import os
+import subprocess
+
+import pytest
+
+from src.infra.cache.lru import CacheEntry, select_evictions
+from src.infra.cache.mirrorCache import GitMirrorCache
+
+
+def git(*args: str, cwd: str) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def make_repo(path: str) -> str:
+    os.makedirs(path)
+    git("init", "-q", "-b", "main", cwd=path)
+    git("config", "user.email", "ci@example.com", cwd=path)
+    git("config", "user.name", "ci", cwd=path)
+    return commit(path, "first")
+
+
+def commit(path: str, content: str) -> str:
+    with open(os.path.join(path, "file.txt"), "w") as f:
+        f.write(content)
+    git("add", "file.txt", cwd=path)
+    git("commit", "-q", "-m", content, cwd=path)
+    return git("rev-parse", "HEAD", cwd=path)
+
+
+def test_select_evictions_removes_least_recently_used_first():
+    entries = [
+        CacheEntry(key="new", size=10, last_used=3),
+        CacheEntry(key="old", size=10, last_used=1),
+        CacheEntry(key="mid", size=10, last_used=2),
+    ]
+
+    evicted = select_evictions(entries, max_bytes=15)
+
+    assert [e.key for e in evicted] == ["old", "mid"]
+
+
+def test_select_evictions_within_budget_evicts_nothing():
+    entries = [CacheEntry(key="a", size=10, last_used=1)]
+
+    assert select_evictions(entries, max_bytes=10) == []
+
+
+def test_mirror_is_created_once_and_fetched_incrementally(tmp_path):
+    origin = str(tmp_path / "origin")
+    make_repo(origin)
+    cache = GitMirrorCache(str(tmp_path / "mirrors"), max_bytes=1 << 30)
+
+    with cache.lease(origin) as mirror:
+        assert not mirror.populated
+        subprocess.run(mirror.update_command(origin), check=True, capture_output=True)
+
+    second = commit(origin, "second")
+
+    with cache.lease(origin) as mirror:
+        assert mirror.populated
+        subprocess.run(mirror.update_command(origin), check=True, capture_output=True)
+        work = str(tmp_path / "work")
+        subprocess.run(mirror.clone_command(work), check=True, capture_output=True)
+
+    git("checkout", "-q", second, cwd=work)
+    with open(os.path.join(work, "file.txt")) as f:
+        assert f.read() == "second"
+
+    stats = cache.stats()
+    assert stats.hits == 1
+    assert stats.misses == 1
+    assert stats.entries == 1
+
+
+def test_leftovers_of_a_killed_clone_are_replaced(tmp_path):
+    origin = str(tmp_path / "origin")
+    head = make_repo(origin)
+    cache = GitMirrorCache(str(tmp_path / "mirrors"), max_bytes=1 << 30)
+    path = cache.path_for(cache.key_for(origin))
+    # A clone killed before it wrote HEAD, and one killed after it
+    os.makedirs(os.path.join(path, "objects"))
+    os.makedirs(path + ".tmp")
+    with open(os.path.join(path + ".tmp", "HEAD"), "w") as f:
+        f.write("ref: refs/heads/main\n")
+
+    with cache.lease(origin) as mirror:
+        assert not mirror.populated
+        subprocess.run(mirror.update_command(origin), check=True, capture_output=True)
+        work = str(tmp_path / "work")
+        subprocess.run(mirror.clone_command(work), check=True, capture_output=True)
+
+    assert git("rev-parse", "HEAD", cwd=work) == head
+    assert not os.path.exists(path + ".tmp")
+    with cache.lease(origin) as mirror:
+        assert mirror.populated
+
+
+def test_mirror_of_a_failed_lease_is_discarded(tmp_path):
+    origin = str(tmp_path / "origin")
+    make_repo(origin)
+    cache = GitMirrorCache(str(tmp_path / "mirrors"), max_bytes=1 << 30)
+
+    with pytest.raises(RuntimeError), cache.lease(origin) as mirror:
+        subprocess.run(mirror.update_command(origin), check=True, capture_output=True)
+        raise RuntimeError("clone step failed")
+
+    assert not os.path.exists(mirror.path)
+    assert not os.path.exists(mirror.staging_path)
+    with cache.lease(origin) as mirror:
+        assert not mirror.populated
+
+
+def test_least_recently_used_mirror_is_evicted(tmp_path):
+    first, second = str(tmp_path / "first"), str(tmp_path / "second")
+    make_repo(first)
+    make_repo(second)
+    cache = GitMirrorCache(str(tmp_path / "mirrors"), max_bytes=1 << 30)
+
+    for origin in (first, second):
+        with cache.lease(origin) as mirror:
+            subprocess.run(
+                mirror.update_command(origin), check=True, capture_output=True
+            )
+    os.utime(os.path.join(cache.root, cache.key_for(first)), (0, 0))
+
+    cache.max_bytes = cache.stats().size_bytes - 1
+    evicted = cache.evict()
+
+    assert evicted == [cache.key_for(first)]
+    assert os.path.isdir(os.path.join(cache.root, cache.key_for(second)))
@@ -0,0 +1,43 @@
+from src.infra.history.queueStore import BuildQueueStore, QueuedBuild
+from src.models import BuildRef
+
+
+def make_ref(sha: str) -> BuildRef:
+    return BuildRef(
+        repo="owner/repo", ref="refs/heads/main", sha=sha, installation_id=7
+    )
+
+
+def test_builds_survive_reopening_until_removed(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    store = BuildQueueStore(path)
+    store.add("b", make_ref("b"), enqueued_at=2.0)
+    store.add("a", make_ref("a"), enqueued_at=1.0)
+    store.add("c", make_ref("c"), enqueued_at=3.0)
+    store.start("a")
+    store.remove("c")
+    store.close()
+
+    reopened = BuildQueueStore(path)
+
+    assert reopened.pending() == [
+        QueuedBuild(
+            id="a", ref=make_ref("a"), enqueued_at=1.0, running=True, attempts=1
+        ),
+        QueuedBuild(id="b", ref=make_ref("b"), enqueued_at=2.0),
+    ]
+    reopened.close()
+
+
+def test_adding_again_requeues_and_keeps_attempts(tmp_path):
+    store = BuildQueueStore(str(tmp_path / "queue.sqlite3"))
+    store.add("a", make_ref("a"), enqueued_at=1.0)
+    store.start("a")
+
+    store.add("a", make_ref("a"), enqueued_at=1.0, attempts=1)
+    store.start("a")
+
+    (build,) = store.pending()
+    assert build.running
+    assert build.attempts == 2
+    store.close()
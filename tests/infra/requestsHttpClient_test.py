@@ -0,0 +1,62 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+
+import pytest
+
+from src.infra.http.requestsHttpClient import RequestsHttpClient
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    # Keep-alive requires HTTP/1.1
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.dumps(
+            {
+                "method": self.command,
+                "path": self.path,
+                "body": self.rfile.read(length).decode(),
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PATCH = _reply
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+@pytest.fixture
+def server_url() -> Iterator[str]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EchoHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_requests_reuse_pooled_connection(server_url):
+    client = RequestsHttpClient()
+
+    get = client.get(f"{server_url}/status", params={"page": 2})
+    post = client.post(f"{server_url}/status", json={"state": "success"})
+    patch = client.patch(f"{server_url}/status", json={"state": "failure"})
+    stats = client.stats()
+    client.close()
+
+    assert get.json() == {"method": "GET", "path": "/status?page=2", "body": ""}
+    assert post.json()["method"] == "POST"
+    assert json.loads(post.json()["body"]) == {"state": "success"}
+    assert patch.json()["method"] == "PATCH"
+    assert stats.requests == 3
+    assert stats.connections_opened == 1
+    assert stats.reused_connections == 2
+    assert stats.hosts == 1
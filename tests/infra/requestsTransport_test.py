@@ -1,3 +1,7 @@
+import time
+
+import pytest
+
 from src.infra.githubAuth.githubAuth import GithubAuthContext
 from src.infra.notifier.exceptions import TransportError
 from src.infra.notifier.requestsTransport import GithubRequestsTransport
@@ -43,3 +47,39 @@ def test_client_exception():
         assert False, "Expected TransportError was not raised"
     except TransportError as _:
         assert True
+
+
+def test_rate_limited_response_is_retryable_after_reset():
+    auth = GithubAuthMock()
+    client = MockHttpClient(
+        response_ok=False,
+        status_code=403,
+        response_headers={
+            "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Reset": str(int(time.time()) + 60),
+        },
+    )
+    transport = GithubRequestsTransport(auth, client)
+
+    with pytest.raises(TransportError) as exc:
+        transport.create_commit_status(
+            "owner/repo", "sha", {"state": "success"}, GithubAuthContext(None)
+        )
+
+    assert exc.value.retryable
+    assert exc.value.retry_after is not None
+    assert 55 <= exc.value.retry_after <= 60
+
+
+def test_client_error_is_not_retryable():
+    auth = GithubAuthMock()
+    client = MockHttpClient(response_ok=False, status_code=422)
+    transport = GithubRequestsTransport(auth, client)
+
+    with pytest.raises(TransportError) as exc:
+        transport.create_commit_status(
+            "owner/repo", "sha", {"state": "success"}, GithubAuthContext(None)
+        )
+
+    assert not exc.value.retryable
+    assert exc.value.retry_after is None
@@ -0,0 +1,74 @@
+import os
+
+from src.infra.cache.venvCache import VenvCache
+
+
+def make_project(path: str, pyproject: str) -> str:
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "pyproject.toml"), "w") as f:
+        f.write(pyproject)
+    return path
+
+
+def make_venv(path: str) -> str:
+    os.makedirs(os.path.join(path, "bin"))
+    os.makedirs(os.path.join(path, "lib"))
+    with open(os.path.join(path, "bin", "pytest"), "w") as f:
+        f.write(f"#!{path}/bin/python\nimport pytest\n")
+    os.chmod(os.path.join(path, "bin", "pytest"), 0o755)
+    with open(os.path.join(path, "lib", "package.py"), "w") as f:
+        f.write("VALUE = 1\n")
+    return path
+
+
+def test_key_depends_on_manifests_and_python_version(tmp_path):
+    cache = VenvCache(str(tmp_path / "cache"), 1 << 30, python_version="3.13.0")
+    project = make_project(str(tmp_path / "project"), "[project]\nname = 'a'\n")
+
+    key = cache.key_for(project)
+    assert key == cache.key_for(project)
+
+    make_project(project, "[project]\nname = 'b'\n")
+    assert key != cache.key_for(project)
+
+    other_python = VenvCache(str(tmp_path / "cache"), 1 << 30, python_version="3.12.0")
+    assert cache.key_for(project) != other_python.key_for(project)
+
+
+def test_restore_miss_then_hit_relocates_scripts(tmp_path):
+    cache = VenvCache(str(tmp_path / "cache"), 1 << 30, python_version="3.13.0")
+    original = make_venv(str(tmp_path / "build1" / "venv"))
+    restored = str(tmp_path / "build2" / "venv")
+
+    assert not cache.restore("key", restored)
+    cache.store("key", original)
+    assert cache.restore("key", restored)
+
+    with open(os.path.join(restored, "bin", "pytest")) as f:
+        assert f.read().startswith(f"#!{restored}/bin/python\n")
+    assert os.access(os.path.join(restored, "bin", "pytest"), os.X_OK)
+
+    # Unchanged files are hardlinked from the snapshot instead of copied
+    snapshot_file = os.path.join(cache.path_for("key"), "lib", "package.py")
+    assert os.path.samefile(snapshot_file, os.path.join(restored, "lib", "package.py"))
+
+    # Relocation must not leak into the snapshot
+    with open(os.path.join(cache.path_for("key"), "bin", "pytest")) as f:
+        assert f.read().startswith(f"#!{original}/bin/python\n")
+
+    stats = cache.stats()
+    assert stats.hits == 1
+    assert stats.misses == 1
+    assert stats.entries == 1
+
+
+def test_store_evicts_least_recently_used_snapshot(tmp_path):
+    cache = VenvCache(str(tmp_path / "cache"), 1 << 30, python_version="3.13.0")
+    cache.store("old", make_venv(str(tmp_path / "a" / "venv")))
+    os.utime(cache.path_for("old"), (0, 0))
+    cache.max_bytes = cache.stats().size_bytes + 10
+
+    cache.store("new", make_venv(str(tmp_path / "b" / "venv")))
+
+    assert not os.path.exists(cache.path_for("old"))
+    assert os.path.isdir(cache.path_for("new"))
@@ -0,0 +1,146 @@
+import hashlib
+import hmac
+import json
+
+from flask import Flask, jsonify
+
+from src.infra.history.deliveryJournal import DeliveryJournal
+from src.input_validation import webhook_validation_factory
+from src.models import BuildRef
+from tests.mocks.githubAuthMock import GithubAuthMock
+
+SECRET = "webhook-secret"
+
+
+def make_client(
+    secret: str | None = SECRET,
+    max_body_bytes: int = 4096,
+    journal: DeliveryJournal | None = None,
+    status: int = 202,
+):
+    received: list[BuildRef] = []
+    app = Flask(__name__)
+
+    @app.route("/webhook", methods=["POST"])
+    @webhook_validation_factory(GithubAuthMock(), secret, max_body_bytes, journal)
+    def webhook(ref: BuildRef):
+        received.append(ref)
+        return jsonify({"received": True}), status
+
+    return app.test_client(), received
+
+
+def push_payload(head_commit: dict | None = None, **extra) -> bytes:
+    payload = {
+        "ref": "refs/heads/main",
+        "repository": {"full_name": "owner/repo"},
+        "head_commit": head_commit if head_commit is not None else {"id": "abc123"},
+        **extra,
+    }
+    return json.dumps(payload).encode()
+
+
+def signed(body: bytes, event: str = "push", secret: str = SECRET) -> dict:
+    digest = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return {
+        "X-Hub-Signature-256": f"sha256={digest}",
+        "X-GitHub-Event": event,
+        "Content-Type": "application/json",
+    }
+
+
+def test_signed_push_is_accepted():
+    client, received = make_client()
+    body = push_payload()
+
+    response = client.post("/webhook", data=body, headers=signed(body))
+
+    assert response.status_code == 202
+    assert received == [
+        BuildRef(repo="owner/repo", ref="refs/heads/main", sha="abc123")
+    ]
+
+
+def test_missing_or_wrong_signature_is_rejected_before_parsing():
+    client, received = make_client()
+    body = push_payload()
+
+    unsigned = client.post("/webhook", data=body)
+    forged = client.post("/webhook", data=body, headers=signed(body, secret="guess"))
+    junk = client.post("/webhook", data=b"not json", headers=signed(body))
+
+    assert unsigned.status_code == 401
+    assert forged.status_code == 401
+    assert junk.status_code == 401
+    assert received == []
+
+
+def test_oversized_body_is_rejected():
+    client, received = make_client(max_body_bytes=64)
+    body = push_payload()
+
+    response = client.post("/webhook", data=body, headers=signed(body))
+
+    assert response.status_code == 413
+    assert received == []
+
+
+def test_other_events_and_branch_deletions_are_ignored():
+    client, received = make_client()
+    ping = b'{"zen": "Keep it logically awesome."}'
+    deletion = json.dumps(
+        {
+            "ref": "refs/heads/old",
+            "repository": {"full_name": "owner/repo"},
+            "head_commit": None,
+            "deleted": True,
+        }
+    ).encode()
+
+    ping_response = client.post("/webhook", data=ping, headers=signed(ping, "ping"))
+    deletion_response = client.post("/webhook", data=deletion, headers=signed(deletion))
+
+    assert ping_response.status_code == 200
+    assert ping_response.get_json()["ignored"] == "ping events are not built"
+    assert deletion_response.status_code == 200
+    assert received == []
+
+
+def test_invalid_payload_is_rejected_without_secret():
+    client, received = make_client(secret=None)
+
+    response = client.post("/webhook", data=b'{"ref": "refs/heads/main"}')
+
+    assert response.status_code == 400
+    assert received == []
+
+
+def test_redeliveries_are_acknowledged_without_building(tmp_path):
+    journal = DeliveryJournal(str(tmp_path / "deliveries.jsonl"))
+    client, received = make_client(journal=journal)
+    body = push_payload()
+    headers = {**signed(body), "X-GitHub-Delivery": "delivery-1"}
+
+    first = client.post("/webhook", data=body, headers=headers)
+    again = client.post("/webhook", data=body, headers=headers)
+
+    assert first.status_code == 202
+    assert again.status_code == 200
+    assert again.get_json()["duplicate"]
+    assert len(received) == 1
+    assert [d.id for d in journal.unfinished()] == ["delivery-1"]
+    journal.close()
+
+
+def test_rejected_deliveries_are_not_journaled(tmp_path):
+    journal = DeliveryJournal(str(tmp_path / "deliveries.jsonl"))
+    client, received = make_client(journal=journal, status=503)
+    body = push_payload()
+    headers = {**signed(body), "X-GitHub-Delivery": "delivery-1"}
+
+    client.post("/webhook", data=body, headers=headers)
+    client.post("/webhook", data=body, headers=headers)
+
+    assert len(received) == 2
+    assert "delivery-1" not in journal
+    journal.close()
@@ -0,0 +1,68 @@
+from src.metrics import BuildMetrics, Counter, Gauge, Histogram, MetricsRegistry
+from src.models import BuildReport, BuildStatus, StepTiming
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("step_seconds", "Step duration.", ("step",), buckets=(1, 10))
+    histogram.observe(0.5, "test")
+    histogram.observe(5, "test")
+    histogram.observe(50, "test")
+
+    assert histogram.render() == [
+        "# HELP step_seconds Step duration.",
+        "# TYPE step_seconds histogram",
+        'step_seconds_bucket{step="test",le="1"} 1',
+        'step_seconds_bucket{step="test",le="10"} 2',
+        'step_seconds_bucket{step="test",le="+Inf"} 3',
+        'step_seconds_sum{step="test"} 55.5',
+        'step_seconds_count{step="test"} 3',
+    ]
+
+
+def test_histogram_escapes_label_values():
+    histogram = Histogram("h", "Help.", ("repo",), buckets=(1,))
+    histogram.observe(1, 'a"b\\c')
+
+    assert 'h_count{repo="a\\"b\\\\c"} 1' in histogram.render()
+
+
+def test_registry_renders_gauges_and_build_metrics():
+    registry = MetricsRegistry()
+    build_metrics = BuildMetrics(registry)
+    registry.register(Gauge("queue_depth", "Queued builds.", lambda: 3))
+
+    build_metrics.observe_build(
+        "owner/repo",
+        BuildReport(state=BuildStatus.FAILURE),
+        duration=42.0,
+        timeline=[
+            StepTiming(
+                name="Unit Tests",
+                started_at=0.0,
+                duration=30.0,
+                cpu_user=20.0,
+                cpu_system=5.0,
+                max_rss_kb=1024,
+                exit_code=1,
+            )
+        ],
+    )
+    output = registry.render()
+
+    step = 'repo="owner/repo",step="Unit Tests"'
+    build = 'repo="owner/repo",status="failure"'
+    assert f"ci_build_duration_seconds_count{{{build}}} 1\n" in output
+    assert f"ci_build_step_duration_seconds_sum{{{step}}} 30\n" in output
+    assert f"ci_build_step_cpu_seconds_sum{{{step}}} 25\n" in output
+    assert f"ci_build_step_max_rss_bytes_sum{{{step}}} 1048576\n" in output
+    assert "queue_depth 3\n" in output
+
+
+def test_counter_renders_counter_type():
+    counter = Counter("requests_total", "Requests sent.", lambda: 7)
+
+    assert counter.render() == [
+        "# HELP requests_total Requests sent.",
+        "# TYPE requests_total counter",
+        "requests_total 7",
+    ]
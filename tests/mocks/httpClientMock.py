@@ -9,6 +9,7 @@ class MockResponse:
     text: str = "Mock response text"
     status_code: int = 200
     response_json: dict[str, Any] = field(default_factory=dict)
+    headers: dict[str, str] = field(default_factory=dict)
 
     def json(self) -> dict[str, Any]:
         return self.response_json
@@ -20,25 +21,53 @@ class MockHttpClient(HttpClient):
         response_ok: bool = True,
         raise_exception: bool = False,
         response_json: dict[str, Any] = {},
+        status_code: int = 200,
+        response_headers: dict[str, str] | None = None,
     ) -> None:
         self.response_ok = response_ok
         self.response_json = response_json
+        self.status_code = status_code
+        self.response_headers = response_headers if response_headers is not None else {}
         self.called_times = 0
+        self.last_method: str = ""
         self.last_url: str = ""
         self.last_data: dict[str, Any] = {}
         self.last_headers: dict[str, Any] = {}
         self.raise_exception = raise_exception
 
+    def get(
+        self,
+        url: str,
+        params: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> Any:
+        return self._request("GET", url, params, **kwargs)
+
     def post(
         self,
         url: str,
         data: dict[str, Any] | None = None,
         json: dict[str, Any] | None = None,
         **kwargs: Any,
+    ) -> Any:
+        return self._request("POST", url, json if json is not None else data, **kwargs)
+
+    def patch(
+        self,
+        url: str,
+        data: dict[str, Any] | None = None,
+        json: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> Any:
+        return self._request("PATCH", url, json if json is not None else data, **kwargs)
+
+    def _request(
+        self, method: str, url: str, body: dict[str, Any] | None, **kwargs: Any
     ) -> Any:
         self.called_times += 1
+        self.last_method = method
         self.last_url = url
-        self.last_data = json if json is not None else data if data is not None else {}
+        self.last_data = body if body is not None else {}
         self.last_headers = kwargs.get("headers", {})
 
         if self.raise_exception:
@@ -47,6 +76,7 @@ class MockHttpClient(HttpClient):
         return MockResponse(
             ok=self.response_ok,
             text="Mock response text",
-            status_code=200,
+            status_code=self.status_code,
             response_json=self.response_json,
+            headers=self.response_headers,
         )
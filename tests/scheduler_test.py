@@ -0,0 +1,164 @@
+import pytest
+
+from src.build_queue import BuildJob
+from src.models import BuildRef, BuildReport, BuildStatus
+from src.scheduler import AdmissionPolicy, BuildScheduler, Priorities
+from tests.mocks.clockMock import ClockMock
+
+
+def make_job(
+    job_id: str,
+    repo: str = "owner/repo",
+    enqueued_at: float = 0.0,
+    installation_id: int | None = None,
+    ref: str = "refs/heads/main",
+) -> BuildJob:
+    build_ref = BuildRef(
+        repo=repo,
+        ref=ref,
+        sha=job_id,
+        installation_id=installation_id,
+        default_branch="main",
+    )
+    return BuildJob(id=job_id, ref=build_ref, enqueued_at=enqueued_at)
+
+
+def take_all(scheduler: BuildScheduler) -> list[str]:
+    taken = []
+    while (job := scheduler.take()) is not None:
+        taken.append(job.id)
+    return taken
+
+
+def test_jobs_are_admitted_while_cores_and_memory_are_left():
+    scheduler = BuildScheduler(
+        AdmissionPolicy(
+            cpus_per_build=2,
+            memory_mb_per_build=1024,
+            total_cpus=8,
+            total_memory_mb=2048,
+        )
+    )
+    jobs = [make_job(job_id, enqueued_at=i) for i, job_id in enumerate("abc")]
+    for job in jobs:
+        scheduler.add(job)
+
+    # Memory runs out before the cores do
+    assert take_all(scheduler) == ["a", "b"]
+    scheduler.release(jobs[0])
+    assert take_all(scheduler) == ["c"]
+    assert len(scheduler) == 0
+
+
+def test_job_larger_than_host_runs_alone():
+    scheduler = BuildScheduler(AdmissionPolicy(cpus_per_build=16, total_cpus=4))
+    first, second = make_job("a"), make_job("b")
+    scheduler.add(first)
+    scheduler.add(second)
+
+    assert take_all(scheduler) == ["a"]
+    scheduler.release(first)
+    assert take_all(scheduler) == ["b"]
+
+
+def test_repository_and_installation_caps():
+    scheduler = BuildScheduler(AdmissionPolicy(max_per_repo=1, max_per_installation=2))
+    for i, (job_id, repo) in enumerate(
+        [("a1", "org/a"), ("a2", "org/a"), ("b1", "org/b"), ("c1", "org/c")]
+    ):
+        scheduler.add(make_job(job_id, repo, enqueued_at=i, installation_id=1))
+    scheduler.add(make_job("d1", "other/d", enqueued_at=9, installation_id=2))
+
+    assert take_all(scheduler) == ["a1", "b1", "d1"]
+    assert len(scheduler) == 2
+
+
+def test_repository_with_fewest_running_builds_goes_first():
+    scheduler = BuildScheduler()
+    for i, job_id in enumerate(["a1", "a2", "a3"]):
+        scheduler.add(make_job(job_id, "org/a", enqueued_at=i))
+    scheduler.add(make_job("b1", "org/b", enqueued_at=10))
+
+    # a1 is the oldest, then org/b has fewer running builds than org/a
+    assert scheduler.take().id == "a1"
+    assert scheduler.take().id == "b1"
+    assert scheduler.take().id == "a2"
+
+
+def test_finished_jobs_are_handed_out_without_reserving():
+    scheduler = BuildScheduler(AdmissionPolicy(max_per_repo=1))
+    running = make_job("a")
+    superseded = make_job("b")
+    superseded.report = BuildReport(state=BuildStatus.ERROR)
+    scheduler.add(running)
+    scheduler.add(superseded)
+
+    assert scheduler.take() is running
+    assert scheduler.take() is superseded
+    scheduler.release(superseded)
+    scheduler.add(make_job("c"))
+    assert scheduler.take() is None
+
+
+def add_classified(scheduler: BuildScheduler, job: BuildJob) -> None:
+    job.priority = scheduler.classify(job.ref)
+    scheduler.add(job)
+
+
+def test_priority_classes_match_default_branch_tags_and_repositories():
+    priorities = Priorities.parse(
+        "main=@default,refs/tags/*; release=acme/*:refs/heads/release/*"
+    )
+
+    assert priorities.names == ["main", "release", "other"]
+    assert priorities.classify(make_job("a").ref) == "main"
+    assert priorities.classify(make_job("b", ref="refs/tags/v1.0").ref) == "main"
+    assert (
+        priorities.classify(make_job("c", "acme/app", ref="refs/heads/release/2").ref)
+        == "release"
+    )
+    assert (
+        priorities.classify(make_job("d", "other/app", ref="refs/heads/release/2").ref)
+        == "other"
+    )
+    with pytest.raises(ValueError):
+        Priorities.parse("main=")
+    with pytest.raises(ValueError):
+        Priorities.parse("main=@default;main=refs/tags/*")
+
+
+def test_higher_priority_builds_jump_ahead_within_a_repository():
+    scheduler = BuildScheduler(
+        AdmissionPolicy(max_per_repo=1), Priorities.parse("main=@default")
+    )
+    for i, (job_id, ref) in enumerate(
+        [
+            ("f1", "refs/heads/feature"),
+            ("f2", "refs/heads/other"),
+            ("m", "refs/heads/main"),
+        ]
+    ):
+        add_classified(scheduler, make_job(job_id, enqueued_at=i, ref=ref))
+
+    first = scheduler.take()
+    assert first.id == "m"
+    assert first.priority == "main"
+    scheduler.release(first)
+    assert take_all(scheduler) == ["f1"]
+
+
+def test_waiting_builds_are_promoted_by_aging():
+    def first_started(now: float, main_enqueued_at: float) -> str:
+        scheduler = BuildScheduler(
+            AdmissionPolicy(max_per_repo=1),
+            Priorities.parse("main=@default", aging=60),
+            ClockMock(fixed_time=now),
+        )
+        feature = make_job("feature", "org/a", enqueued_at=0, ref="refs/heads/x")
+        add_classified(scheduler, feature)
+        add_classified(scheduler, make_job("main", "org/b", main_enqueued_at))
+        return scheduler.take().id
+
+    assert first_started(now=50, main_enqueued_at=40) == "main"
+    # Waited 100 seconds, promoted to the main class and older than the main build
+    assert first_started(now=100, main_enqueued_at=90) == "feature"
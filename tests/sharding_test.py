@@ -0,0 +1,55 @@
+from src.sharding import parse_collected_modules, plan_shards, read_junit_reports
+
+
+def test_parse_collected_modules_keeps_collection_order():
+    output = (
+        "tests/b_test.py::test_one\n"
+        "tests/a_test.py::TestThing::test_two\n"
+        "tests/b_test.py::test_three\n"
+        "\n"
+        "3 tests collected in 0.01s\n"
+    )
+
+    assert parse_collected_modules(output) == ["tests/b_test.py", "tests/a_test.py"]
+
+
+def test_plan_shards_balances_by_duration():
+    durations = {"slow.py": 10.0, "medium.py": 6.0, "fast.py": 3.0, "tiny.py": 1.0}
+
+    shards = plan_shards(["tiny.py", "fast.py", "medium.py", "slow.py"], durations, 2)
+
+    assert shards == [["slow.py"], ["tiny.py", "fast.py", "medium.py"]]
+
+
+def test_plan_shards_assumes_average_duration_for_new_modules():
+    shards = plan_shards(["new.py", "old.py"], {"old.py": 4.0}, 3)
+
+    assert sorted(shards) == [[], ["new.py"], ["old.py"]]
+
+
+def test_read_junit_reports_merges_shards(tmp_path):
+    (tmp_path / "junit-1.xml").write_text(
+        '<testsuites><testsuite tests="2">'
+        '<testcase file="tests/a_test.py" name="test_ok" time="1.5"/>'
+        '<testcase file="tests/a_test.py" name="test_bad" time="0.5">'
+        "<failure>assert False</failure></testcase>"
+        "</testsuite></testsuites>"
+    )
+    (tmp_path / "junit-2.xml").write_text(
+        '<testsuites><testsuite tests="1">'
+        '<testcase file="tests/b_test.py" name="test_skip" time="0.1">'
+        "<skipped/></testcase>"
+        "</testsuite></testsuites>"
+    )
+
+    summary = read_junit_reports([str(tmp_path / f"junit-{i}.xml") for i in (1, 2, 3)])
+
+    assert summary is not None
+    assert summary.tests == 3
+    assert summary.skipped == 1
+    assert summary.failed == ["tests/a_test.py::test_bad"]
+    assert summary.durations == {"tests/a_test.py": 2.0, "tests/b_test.py": 0.1}
+
+
+def test_read_junit_reports_without_reports():
+    assert read_junit_reports(["/nonexistent/junit.xml"]) is None
@@ -0,0 +1,51 @@
+from src.test_selection import parse_coverage_contexts, select_tests
+
+TEST_MODULES = ["tests/a_test.py", "tests/b_test.py", "tests/c_test.py"]
+IMPACT = {
+    "src/a.py": {"tests/a_test.py"},
+    "src/shared.py": {"tests/a_test.py", "tests/b_test.py"},
+}
+
+
+def test_changed_sources_and_tests_select_affected_modules():
+    selection = select_tests(
+        ["src/shared.py", "tests/c_test.py", "README.md"], IMPACT, TEST_MODULES
+    )
+
+    assert selection.modules == TEST_MODULES
+    assert select_tests(["src/a.py"], IMPACT, TEST_MODULES).modules == [
+        "tests/a_test.py"
+    ]
+    assert select_tests(["docs/index.rst"], IMPACT, TEST_MODULES).modules == []
+
+
+def test_unmapped_changes_run_all_tests():
+    for changed in (
+        ["pyproject.toml"],
+        ["tests/conftest.py"],
+        ["requirements-dev.txt"],
+        ["src/new.py"],
+        ["tests/data/fixture.json"],
+    ):
+        selection = select_tests(changed, IMPACT, TEST_MODULES)
+        assert selection.modules is None, changed
+        assert changed[0] in selection.reason
+
+    assert select_tests(["src/a.py"], {}, TEST_MODULES).modules is None
+
+
+def test_coverage_contexts_are_attributed_to_test_modules():
+    report = {
+        "files": {
+            "src/a.py": {"contexts": {"1": [""], "2": ["a_test.test_f"]}},
+            "src/b.py": {"contexts": {"2": ["b_test.test_g", "a_test.test_f"]}},
+            "src/unused.py": {"contexts": {"1": [""]}},
+            "tests/a_test.py": {"contexts": {"1": [""], "3": ["a_test.test_f"]}},
+            "tests/b_test.py": {"contexts": {"3": ["b_test.test_g"]}},
+        }
+    }
+
+    assert parse_coverage_contexts(report, TEST_MODULES) == {
+        "tests/a_test.py": {"tests/a_test.py", "src/a.py", "src/b.py"},
+        "tests/b_test.py": {"tests/b_test.py", "src/b.py"},
+    }